@@ -4,16 +4,21 @@ Module and scripts for generating descriptors (quantities listed
 in cell_analysis.m) from cycle-level summary statistics.
 
 Usage:
-    featurize [INPUT_JSON]
+    featurize [INPUT_JSON] [--workers=<n>] [--store]
 
 Options:
     -h --help        Show this screen
     --version        Show version
+    --workers=<n>    Number of processes to featurize files with [default: 1]
+    --store          Append features to a columnar feature store per feature class
 
 
 The `featurize` script will generate features according to the methods
 contained in beep.featurize.  It places output files corresponding to
-features in `/data-share/features/`.
+features in `/data-share/features/`. With `--workers`, each featurizer of each file
+is run as a separate task on a pool of processes. With `--store`, the features of each
+feature class are also appended to a single columnar file, `<class>_feature_store.hdf5`,
+which `run_model` can train on in one load.
 
 The input json must contain the following fields
 
@@ -22,6 +27,8 @@ The input json must contain the following fields
 The output json file will contain the following:
 
 * `file_list` - a list of filenames corresponding to the locations of the features
+* `time_list` - seconds taken by the featurizer of each entry of `file_list`
+* `feature_store_list` - with `--store`, the feature store of each feature class
 
 Example:
 ```angular2
@@ -34,22 +41,33 @@ $ featurize '{"invalid_file_list": ["/data-share/renamed_cycler_files/FastCharge
 
 import os
 import json
+import time
+import itertools
 import numpy as np
 import pandas as pd
 import math
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
 from docopt import docopt
-from monty.json import MSONable
+from monty.json import MSONable, MontyEncoder
 from monty.serialization import loadfn, dumpfn
 from scipy.stats import skew, kurtosis
 from beep.collate import scrub_underscore_suffix, add_suffix_to_filename
 from beep.utils import KinesisEvents
 from beep.helpers import featurizer_helpers
 from beep import logger, ENVIRONMENT, __version__
-from beep.structure import get_protocol_parameters
+from beep.structure import get_protocol_parameters, ProcessedCyclerRun, LazyProcessedCyclerRun
 
 s = {'service': 'DataAnalyzer'}
 
+# Number of processed cycler runs each featurizing process keeps loaded
+FEATURIZE_RUN_CACHE_SIZE = 2
+# Suffix of the columnar files holding the features of all cells of a feature class
+FEATURE_STORE_SUFFIX = "_feature_store.hdf5"
+# Width of the string columns of feature stores, fixed when a store is created
+FEATURE_STORE_STRING_SIZE = 1024
+
 
 class BeepFeatures(MSONable, metaclass=ABCMeta):
     """
@@ -61,6 +79,10 @@ class BeepFeatures(MSONable, metaclass=ABCMeta):
             and code used to produce features
     """
     class_feature_name = 'Base'
+    # Tables of the processed cycler run used to featurize it, mapped to the
+    # list of columns used from each table, or None if all are used
+    required_columns = {'summary': None, 'cycles_interpolated': None,
+                        'diagnostic_summary': None, 'diagnostic_interpolated': None}
 
     def __init__(self, name, X, metadata):
         self.name = name
@@ -110,6 +132,8 @@ class BeepFeatures(MSONable, metaclass=ABCMeta):
         """
         new_filename = os.path.basename(input_path)
         new_filename = scrub_underscore_suffix(new_filename)
+        # Features are always serialized to json, whatever the structure format
+        new_filename = os.path.splitext(new_filename)[0] + ".json"
 
         # Append model_name along with "features" to demarcate
         # different models when saving the feature vectors.
@@ -168,6 +192,7 @@ class DiagnosticCyclesFeatures(BeepFeatures):
     """
     # Class name for the feature object
     class_feature_name = 'DiagnosticCyclesFeatures'
+    required_columns = {'diagnostic_summary': None, 'diagnostic_interpolated': None}
     diagnostic_cycle_types = ['reset', 'hppc', 'rpt_0.2C', 'rpt_1C', 'rpt_2C']
 
     def __init__(self, name, X, metadata):
@@ -222,19 +247,16 @@ class DiagnosticCyclesFeatures(BeepFeatures):
             (boolean): True if all SOC window available in both diagnostic cycles. False otherwise.
         """
         conditions_met = []
-        # chooses the first and the second diagnostic cycle
-        for hppc_chosen in [0, 1]:
+        view = featurizer_helpers.get_diagnostic_view(processed_cycler_run)
 
-            # Getting just the HPPC cycles
-            hppc_diag_cycles = processed_cycler_run.diagnostic_interpolated[
-                processed_cycler_run.diagnostic_interpolated.cycle_type == "hppc"]
+        # Getting unique and ordered cycle index list for HPPC cycles
+        hppc_cycle_list = sorted(view.cycle_indices('hppc'))
 
-            # Getting unique and ordered cycle index list for HPPC cycles, and choosing the hppc cycle
-            hppc_cycle_list = list(set(hppc_diag_cycles.cycle_index))
-            hppc_cycle_list.sort()
+        # chooses the first and the second diagnostic cycle
+        for hppc_chosen in [0, 1]:
 
             # Getting unique and ordered Regular Step List (Non-unique identifier)
-            reg_step_list = hppc_diag_cycles[hppc_diag_cycles.cycle_index == hppc_cycle_list[hppc_chosen]].step_index
+            reg_step_list = view.rows('hppc', hppc_cycle_list[hppc_chosen]).step_index
             reg_step_list = list(set(reg_step_list))
             reg_step_list.sort()
 
@@ -242,9 +264,8 @@ class DiagnosticCyclesFeatures(BeepFeatures):
             reg_step_relax = 1
 
             # Getting unique and ordered Step Counter List (unique identifier)
-            step_count_list = hppc_diag_cycles[(hppc_diag_cycles.cycle_index == hppc_cycle_list[hppc_chosen]) &
-                                               (hppc_diag_cycles.step_index == reg_step_list[
-                                                   reg_step_relax])].step_index_counter
+            step_count_list = view.rows('hppc', hppc_cycle_list[hppc_chosen],
+                                        step_index=reg_step_list[reg_step_relax]).step_index_counter
             step_count_list = list(set(step_count_list))
             step_count_list.sort()
             # The first one isn't a proper relaxation curve(comes out of CV) so we ignore it
@@ -295,7 +316,7 @@ class DiagnosticCyclesFeatures(BeepFeatures):
 
     @classmethod
     def get_rpt_dQdV_features(cls, processed_cycler_run, diag_ref=0, diag_nr=1, charge_y_n=1, rpt_type='rpt_0.2C',
-                              plotting_y_n=0):
+                              plotting_y_n=0, backend='lmfit'):
         """
         Generate features out of peakfits to rpt cycles
 
@@ -309,6 +330,9 @@ class DiagnosticCyclesFeatures(BeepFeatures):
 
             charge_y_n (bool): 1 = charge, 0 = discharge
             rpt_type (str): type of rpt cycle.
+            plotting_y_n (int): if 1, plots the peak fits.
+            backend (str): 'lmfit' or 'least_squares', the peak fitting backend,
+                see featurizer_helpers.fit_dQdV_peaks.
 
         Returns:
              pd.DataFrame containing features based on gaussian fits to dQdV features in rpt cycles
@@ -335,14 +359,13 @@ class DiagnosticCyclesFeatures(BeepFeatures):
             raise InputError("{} is not a valid rpt cycle".format(
                 rpt_type))
 
-        peak_fit_df_ref = featurizer_helpers.generate_dQdV_peak_fits(processed_cycler_run, diag_nr=diag_ref,
+        peak_fits = featurizer_helpers.generate_dQdV_peak_fits_batch(processed_cycler_run, rpt_type=rpt_type,
                                                                      charge_y_n=charge_y_n,
-                                                                     rpt_type=rpt_type, plotting_y_n=plotting_y_n,
-                                                                     max_nr_peaks=max_nr_peaks)
-        peak_fit_df = featurizer_helpers.generate_dQdV_peak_fits(processed_cycler_run, diag_nr=diag_nr,
-                                                                 charge_y_n=charge_y_n,
-                                                                 rpt_type=rpt_type, plotting_y_n=plotting_y_n,
-                                                                 max_nr_peaks=max_nr_peaks)
+                                                                     diag_nrs=[diag_ref, diag_nr],
+                                                                     max_nr_peaks=max_nr_peaks, backend=backend,
+                                                                     plotting_y_n=plotting_y_n)
+        peak_fit_df_ref = peak_fits.iloc[[0]].reset_index(drop=True)
+        peak_fit_df = peak_fits.iloc[[1]].reset_index(drop=True)
 
         return 1 + (peak_fit_df - peak_fit_df_ref) / peak_fit_df_ref
 
@@ -361,11 +384,8 @@ class DiagnosticCyclesFeatures(BeepFeatures):
         Returns:
             dataframe of features based on voltage and resistance changes over a SOC window in hppc cycles
         """
-        data = processed_cycler_run.diagnostic_interpolated
-
-        cycle_hppc = data.loc[data.cycle_type == 'hppc']
-        cycle_hppc = cycle_hppc.loc[cycle_hppc.current.notna()]
-        cycles = cycle_hppc.cycle_index.unique()
+        view = featurizer_helpers.get_diagnostic_view(processed_cycler_run)
+        cycles = view.cycle_indices('hppc', valid_current=True)
 
         [f2_d, f2_c] = featurizer_helpers.get_hppc_r(processed_cycler_run, cycles[diag_pos])
         f3 = featurizer_helpers.get_hppc_ocv(processed_cycler_run, cycles[diag_pos])
@@ -531,6 +551,8 @@ class DeltaQFastCharge(BeepFeatures):
     """
     # Class name for the feature object
     class_feature_name = 'DeltaQFastCharge'
+    required_columns = {'summary': None,
+                        'cycles_interpolated': ['cycle_index', 'voltage', 'discharge_capacity', 'step_type']}
 
     # Class variables
     init_pred_cycle = 10
@@ -721,6 +743,7 @@ class TrajectoryFastCharge(DeltaQFastCharge):
     """
     # Class name for the feature object
     class_feature_name = 'TrajectoryFastCharge'
+    required_columns = {'summary': ['cycle_index', 'discharge_capacity']}
 
     def __init__(self, name, X, metadata):
         super().__init__(name, X, metadata)
@@ -754,6 +777,10 @@ class DiagnosticProperties(DiagnosticCyclesFeatures):
     """
     # Class name for the feature object
     class_feature_name = 'DiagnosticProperties'
+    required_columns = {'diagnostic_summary': ['cycle_index', 'cycle_type', 'discharge_capacity',
+                                               'discharge_energy'],
+                        'diagnostic_interpolated': ['cycle_index', 'cycle_type', 'step_index',
+                                                    'step_index_counter']}
 
     def __init__(self, name, X, metadata):
         super().__init__(name, X, metadata)
@@ -856,7 +883,7 @@ class DegradationPredictor(MSONable):
             prediction_type (str): Type of regression - 'single' vs 'multi'.
             diagnostic_features (bool): whether to compute diagnostic features.
         """
-        processed_cycler_run = loadfn(path)
+        processed_cycler_run = ProcessedCyclerRun.load(path)
 
         if features_label == 'full_model':
             return cls.init_full_model(processed_cycler_run, predict_only=predict_only,
@@ -1036,6 +1063,141 @@ class DegradationPredictor(MSONable):
         return cls(**d)
 
 
+class FeatureStore(object):
+    """
+    Columnar store of the features of many cells for a single feature class,
+    in one HDF5 file with row-aligned tables: `cells` (cell id, json metadata
+    and append batch of each row), `X` (features) and, for featurizers with
+    targets, `y`. Rows are appended in batches and read back in a single
+    load, where the latest batch of a cell replaces its earlier ones.
+
+    Attributes:
+        path (str): location of the store file.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): location of the store file.
+        """
+        self.path = path
+
+    @classmethod
+    def from_feature_dir(cls, feature_dir, class_feature_name):
+        """
+        Args:
+            feature_dir (str): path to the base directory for the feature sets.
+            class_feature_name (str): name of the feature class.
+
+        Returns:
+            beep.featurize.FeatureStore: store of the feature class.
+        """
+        return cls(os.path.join(feature_dir, class_feature_name + FEATURE_STORE_SUFFIX))
+
+    def append(self, featurizers, cell_ids):
+        """
+        Append the features of several cells as one batch.
+
+        Args:
+            featurizers (list): BeepFeatures or DegradationPredictor objects
+                of the same feature class.
+            cell_ids (list): id of the cell of each featurizer.
+        """
+        cells, X, y = [], [], []
+        for featurizer, cell_id in zip(featurizers, cell_ids):
+            if featurizer.X.empty:
+                continue
+            metadata = dict(getattr(featurizer, 'metadata', None) or {})
+            if hasattr(featurizer, 'nominal_capacity'):
+                metadata['nominal_capacity'] = featurizer.nominal_capacity
+            cells.append(pd.DataFrame({'cell_id': cell_id,
+                                       'metadata': json.dumps(metadata, cls=MontyEncoder)},
+                                      index=range(len(featurizer.X))))
+            X.append(featurizer.X)
+            targets = getattr(featurizer, 'y', None)
+            if targets is not None:
+                y.append(pd.DataFrame([targets]) if isinstance(targets, (int, float))
+                         else pd.DataFrame(targets))
+        if not cells:
+            return
+
+        featurizer = featurizers[0]
+        tables = {'cells': pd.concat(cells, ignore_index=True),
+                  'X': pd.concat(X, ignore_index=True)}
+        if y:
+            tables['y'] = pd.concat(y, ignore_index=True)
+            if len(y) != len(X) or len(tables['y']) != len(tables['X']):
+                raise ValueError('Either all or none of the rows of {} must have targets'.format(self.path))
+
+        with pd.HDFStore(self.path, mode='a', complib='blosc', complevel=5) as store:
+            if ('/y' in store.keys()) != ('y' in tables) and '/cells' in store.keys():
+                raise ValueError('Either all or none of the rows of {} must have targets'.format(self.path))
+            batch = store.get_storer('cells').nrows if '/cells' in store.keys() else 0
+            tables['cells']['batch'] = batch
+            for key, df in tables.items():
+                min_itemsize = {'values': FEATURE_STORE_STRING_SIZE} if (df.dtypes == object).any() else None
+                store.append(key, df, format='table', min_itemsize=min_itemsize, index=False)
+            store.root._v_attrs.beep_name = getattr(featurizer, 'class_feature_name', featurizer.name)
+            store.root._v_attrs.beep_predicted_quantity = getattr(featurizer, 'predicted_quantity', None)
+            store.root._v_attrs.beep_version = __version__
+
+    def load(self):
+        """
+        Read the latest features of all cells in a single load.
+
+        Returns:
+            pandas.DataFrame: cell id, json metadata and append batch of each row.
+            pandas.DataFrame: features of each row.
+            pandas.DataFrame: targets of each row, or None if not stored.
+        """
+        with pd.HDFStore(self.path, mode='r') as store:
+            cells = store.select('cells')
+            X = store.select('X')
+            y = store.select('y') if '/y' in store.keys() else None
+        latest = (cells.batch == cells.groupby('cell_id').batch.transform('max')).values
+        cells, X = cells[latest], X[latest]
+        if y is not None:
+            y = y[latest]
+        return cells, X, y
+
+    def get_attributes(self):
+        """
+        Returns:
+            dict: name of the feature set and predicted quantity of the store.
+        """
+        with pd.HDFStore(self.path, mode='r') as store:
+            attributes = store.root._v_attrs
+            return {'name': attributes.beep_name,
+                    'predicted_quantity': attributes.beep_predicted_quantity}
+
+    @property
+    def X(self):
+        """pandas.DataFrame: latest features of all cells, see load."""
+        return self.load()[1]
+
+
+def get_required_columns(featurizer_classes):
+    """
+    Merges the processed cycler run columns required by several featurizers,
+    for loading a run once for all of them.
+
+    Args:
+        featurizer_classes (list): BeepFeatures subclasses.
+
+    Returns:
+        dict: table name to the list of required columns, or None if all
+            columns of the table are required.
+    """
+    columns = {}
+    for featurizer_class in featurizer_classes:
+        for table, table_columns in featurizer_class.required_columns.items():
+            if table_columns is None or (table in columns and columns[table] is None):
+                columns[table] = None
+            else:
+                columns[table] = list(dict.fromkeys(columns.get(table, []) + table_columns))
+    return columns
+
+
 def add_file_prefix_to_path(path, prefix):
     """
     Helper function to add file prefix to path.
@@ -1053,7 +1215,105 @@ def add_file_prefix_to_path(path, prefix):
     return os.path.join(*split_path)
 
 
-def process_file_list_from_json(file_list_json, processed_dir='data-share/features/'):
+@lru_cache(maxsize=FEATURIZE_RUN_CACHE_SIZE)
+def load_processed_cycler_run(path, columns, mtime=None):
+    """
+    Loads a processed cycler run for featurization, keeping the most
+    recently used runs loaded so that all featurizer tasks of a file run
+    by the same process share its tables.
+
+    Args:
+        path (str): processed cycler run file.
+        columns (tuple): hashable form of the required columns, see
+            get_required_columns, as sorted (table, columns) pairs with
+            columns as a tuple or None.
+        mtime (float): modification time of the file, so that a run is
+            loaded again once its file is rewritten.
+
+    Returns:
+        beep.structure.LazyProcessedCyclerRun: processed cycler run.
+    """
+    columns = {table: None if table_columns is None else list(table_columns)
+               for table, table_columns in columns}
+    return LazyProcessedCyclerRun(path, columns=columns)
+
+
+def featurize_file(path, processed_dir, featurizer_class, required_columns):
+    """
+    Runs a single featurizer on a processed cycler run file and dumps the
+    features into processed_dir.
+
+    Args:
+        path (str): processed cycler run file.
+        processed_dir (str): location for the feature files.
+        featurizer_class (type): BeepFeatures subclass.
+        required_columns (tuple): columns to load, see
+            load_processed_cycler_run.
+
+    Returns:
+        (str, float): path of the feature file, or None if the data is
+            insufficient for the featurizer, and the seconds taken.
+    """
+    start = time.perf_counter()
+    processed_cycler_run = load_processed_cycler_run(path, required_columns, os.path.getmtime(path))
+    featurizer = featurizer_class.from_run(path, processed_dir, processed_cycler_run)
+    feature_path = None
+    if featurizer:
+        dumpfn(featurizer, featurizer.name)
+        feature_path = featurizer.name
+    return feature_path, time.perf_counter() - start
+
+
+def featurize_files(paths, processed_dir, featurizer_classes, workers=1):
+    """
+    Runs featurizers on a list of processed cycler run files, optionally
+    in parallel over a pool of processes, with each featurizer of each
+    file as a separate task. At most `workers` tasks are in flight at
+    any time, submitted file by file, and each process keeps the runs of
+    its latest tasks loaded, see load_processed_cycler_run.
+
+    Args:
+        paths (list): processed cycler run files.
+        processed_dir (str): location for the feature files.
+        featurizer_classes (list): BeepFeatures subclasses.
+        workers (int): number of processes to use, 1 featurizes the files
+            sequentially in the current process.
+
+    Returns:
+        list: (feature file path, seconds) for each file and featurizer,
+            ordered by file and then by featurizer, with a None path if
+            the data is insufficient for the featurizer.
+    """
+    required_columns = get_required_columns(featurizer_classes)
+    required_columns = tuple(sorted(
+        (table, None if table_columns is None else tuple(table_columns))
+        for table, table_columns in required_columns.items()))
+    tasks = list(itertools.product(paths, featurizer_classes))
+    if workers <= 1:
+        return [featurize_file(path, processed_dir, featurizer_class, required_columns)
+                for path, featurizer_class in tasks]
+
+    results = [None] * len(tasks)
+    queue = iter(enumerate(tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def submit(count):
+            for n, (path, featurizer_class) in itertools.islice(queue, count):
+                pending[executor.submit(featurize_file, path, processed_dir,
+                                        featurizer_class, required_columns)] = n
+
+        submit(workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+            submit(len(done))
+    return results
+
+
+def process_file_list_from_json(file_list_json, processed_dir='data-share/features/', workers=1,
+                                feature_store=False):
     """
     Function to take a json file containing processed cycler run file locations,
     extract features, dump the processed file into a predetermined directory,
@@ -1066,10 +1326,11 @@ def process_file_list_from_json(file_list_json, processed_dir='data-share/featur
             and loaded, otherwise interpreted as a json string.
         processed_dir (str): location for processed cycler run output files
             to be placed.
-        features_label (str): name of feature generation method.
-        predict_only (bool): whether to calculate predictions or not.
-        prediction_type (str): Single or multi-point predictions.
-        predicted_quantity (str): quantity being predicted - cycle or capacity.
+        workers (int): number of processes to featurize files with, see
+            featurize_files.
+        feature_store (bool): whether to also append the features to the
+            FeatureStore of each feature class in processed_dir, whose
+            locations are returned under the key "feature_store_list".
 
     Returns:
         str: json string of feature files (with key "file_list").
@@ -1097,36 +1358,52 @@ def process_file_list_from_json(file_list_json, processed_dir='data-share/featur
     processed_result_list = []
     processed_message_list = []
     processed_paths_list = []
+    processed_time_list = []
+
+    featurizer_classes = [DeltaQFastCharge, TrajectoryFastCharge, DiagnosticCyclesFeatures, DiagnosticProperties]
 
     for path, run_id in zip(file_list, run_ids):
         logger.info('run_id=%s featurizing=%s', str(run_id), path, extra=s)
-        processed_cycler_run = loadfn(path)
-
-        featurizer_classes = [DeltaQFastCharge, TrajectoryFastCharge, DiagnosticCyclesFeatures, DiagnosticProperties]
-        for featurizer_class in featurizer_classes:
-            featurizer = featurizer_class.from_run(path, processed_dir, processed_cycler_run)
-            if featurizer:
-                dumpfn(featurizer, featurizer.name)
-                processed_paths_list.append(featurizer.name)
-                processed_run_list.append(run_id)
-                processed_result_list.append("success")
-                processed_message_list.append({'comment': '',
-                                               'error': ''})
-                logger.info('Successfully generated %s', featurizer.name, extra=s)
-            else:
-                processed_paths_list.append(path)
-                processed_run_list.append(run_id)
-                processed_result_list.append("incomplete")
-                processed_message_list.append({'comment': 'Insufficient or incorrect data for featurization',
-                                               'error': ''})
-                logger.info('Unable to featurize %s', path, extra=s)
+    results = featurize_files(file_list, processed_dir, featurizer_classes, workers=workers)
+    tasks = itertools.product(zip(file_list, run_ids), featurizer_classes)
+
+    for ((path, run_id), featurizer_class), (feature_path, seconds) in zip(tasks, results):
+        processed_run_list.append(run_id)
+        processed_time_list.append(seconds)
+        if feature_path is not None:
+            processed_paths_list.append(feature_path)
+            processed_result_list.append("success")
+            processed_message_list.append({'comment': '',
+                                           'error': ''})
+            logger.info('Successfully generated %s in %.2f s', feature_path, seconds, extra=s)
+        else:
+            processed_paths_list.append(path)
+            processed_result_list.append("incomplete")
+            processed_message_list.append({'comment': 'Insufficient or incorrect data for featurization',
+                                           'error': ''})
+            logger.info('Unable to featurize %s with %s', path, featurizer_class.__name__, extra=s)
 
     output_data = {"file_list": processed_paths_list,
                    "run_list": processed_run_list,
                    "result_list": processed_result_list,
-                   "message_list": processed_message_list
+                   "message_list": processed_message_list,
+                   "time_list": processed_time_list
                    }
 
+    if feature_store:
+        output_data["feature_store_list"] = []
+        for featurizer_class in featurizer_classes:
+            entries = [(path, feature_path) for (path, task_class), (feature_path, _)
+                       in zip(itertools.product(file_list, featurizer_classes), results)
+                       if task_class is featurizer_class and feature_path is not None]
+            if not entries:
+                continue
+            store = FeatureStore.from_feature_dir(processed_dir, featurizer_class.class_feature_name)
+            cell_ids = [os.path.splitext(scrub_underscore_suffix(os.path.basename(path)))[0]
+                        for path, _ in entries]
+            store.append([loadfn(feature_path) for _, feature_path in entries], cell_ids)
+            output_data["feature_store_list"].append(os.path.abspath(store.path))
+
     events.put_analyzing_event(output_data, 'featurizing', 'complete')
     # Return jsonable file list
     return json.dumps(output_data)
@@ -1148,7 +1425,9 @@ def main():
     try:
         args = docopt(__doc__)
         input_json = args['INPUT_JSON']
-        print(process_file_list_from_json(input_json), end="")
+        workers = int(args['--workers'])
+        print(process_file_list_from_json(input_json, workers=workers,
+                                          feature_store=args['--store']), end="")
     except Exception as e:
         logger.error(str(e), extra=s)
         raise e
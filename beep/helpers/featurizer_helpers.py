@@ -9,10 +9,143 @@ All methods are currently lumped into this script.
 
 import pandas as pd
 import numpy as np
-import matplotlib as plt
+import matplotlib.pyplot as plt
 from scipy import signal
 from lmfit import models
 from scipy.interpolate import interp1d
+from scipy.optimize import least_squares
+
+# First HPPC diagnostic, the reference for changes in later ones
+HPPC_REFERENCE_CYCLE = 2
+# Rows of the reference cycle past this test time belong to a final HPPC
+# appended with the same cycle index
+HPPC_REFERENCE_MAX_TEST_TIME = 250000
+# Rest, discharge and charge pulse steps of the reference and later HPPC cycles
+HPPC_PULSE_STEPS = {'R': (11, 43), 'D': (12, 44), 'C': (14, 46)}
+# Number of SOC windows of an HPPC cycle
+HPPC_SOC_WINDOWS = 9
+
+
+class DiagnosticView(object):
+    """
+    Diagnostic cycles of a processed cycler run split by cycle type once,
+    with the rows of each cycle, step and step_index_counter looked up
+    from group indices instead of boolean scans over the whole table.
+    Featurizer helpers get the view of a run from get_diagnostic_view, so
+    that they all share its tables.
+
+    Attributes:
+        diagnostic_interpolated (pandas.DataFrame): diagnostic data of
+            the processed cycler run.
+    """
+    def __init__(self, diagnostic_interpolated):
+        """
+        Args:
+            diagnostic_interpolated (pandas.DataFrame): diagnostic data of
+                the processed cycler run.
+        """
+        self.diagnostic_interpolated = diagnostic_interpolated
+        self._tables = None
+        self._valid_current_tables = {}
+        self._groups = {}
+        self._derived = {}
+
+    def table(self, cycle_type, valid_current=False):
+        """
+        Rows of a cycle type.
+
+        Args:
+            cycle_type (str): cycle type, e. g. 'hppc' or 'rpt_0.2C'.
+            valid_current (bool): whether to keep only rows with a current.
+
+        Returns:
+            pandas.DataFrame: rows of the cycle type in their original order.
+        """
+        if self._tables is None:
+            data = self.diagnostic_interpolated
+            self._tables = {name: table for name, table in data.groupby('cycle_type', sort=False)}
+        table = self._tables.get(cycle_type, self.diagnostic_interpolated.iloc[:0])
+        if valid_current:
+            if cycle_type not in self._valid_current_tables:
+                self._valid_current_tables[cycle_type] = table.loc[table.current.notna()]
+            table = self._valid_current_tables[cycle_type]
+        return table
+
+    def cycle_indices(self, cycle_type, valid_current=False):
+        """
+        Args:
+            cycle_type (str): cycle type.
+            valid_current (bool): whether to consider only rows with a current.
+
+        Returns:
+            numpy.ndarray: cycle indices of the cycle type in order of appearance.
+        """
+        return self.table(cycle_type, valid_current).cycle_index.unique()
+
+    def rows(self, cycle_type, cycle_index, step_index=None, step_index_counter=None,
+             valid_current=False):
+        """
+        Rows of a cycle, optionally restricted to a step_index and/or a
+        step_index_counter.
+
+        Args:
+            cycle_type (str): cycle type.
+            cycle_index (int): cycle index.
+            step_index (int): step index, any if None.
+            step_index_counter (int): step index counter, any if None.
+            valid_current (bool): whether to keep only rows with a current.
+
+        Returns:
+            pandas.DataFrame: selected rows in their original order.
+        """
+        keys = ['cycle_index']
+        values = [cycle_index]
+        for key, value in [('step_index', step_index), ('step_index_counter', step_index_counter)]:
+            if value is not None:
+                keys.append(key)
+                values.append(value)
+        table = self.table(cycle_type, valid_current)
+        group_key = (cycle_type, valid_current, tuple(keys))
+        if group_key not in self._groups:
+            self._groups[group_key] = table.groupby(keys, sort=False).indices
+        positions = self._groups[group_key].get(values[0] if len(values) == 1 else tuple(values))
+        if positions is None:
+            return table.iloc[:0]
+        return table.iloc[positions]
+
+    def derived(self, name, function):
+        """
+        Table derived from the diagnostic data, computed on first use.
+
+        Args:
+            name (str): name of the derived table.
+            function (callable): computes the table from the view.
+
+        Returns:
+            the result of function(self).
+        """
+        if name not in self._derived:
+            self._derived[name] = function(self)
+        return self._derived[name]
+
+
+def get_diagnostic_view(processed_cycler_run):
+    """
+    Diagnostic view of a processed cycler run, built on first use and kept
+    on the run until its diagnostic_interpolated table is replaced.
+
+    Args:
+        processed_cycler_run (beep.structure.ProcessedCyclerRun): processed cycler run.
+
+    Returns:
+        beep.helpers.featurizer_helpers.DiagnosticView: view of its diagnostic cycles.
+    """
+    data = processed_cycler_run.diagnostic_interpolated
+    view = processed_cycler_run.__dict__.get('_diagnostic_view')
+    if view is None or view.diagnostic_interpolated is not data:
+        view = DiagnosticView(data)
+        processed_cycler_run._diagnostic_view = view
+    return view
 
 
 def isolate_dQdV_peaks(processed_cycler_run, diag_nr, charge_y_n, max_nr_peaks, rpt_type, half_peak_width=0.075):
@@ -30,22 +163,19 @@ def isolate_dQdV_peaks(processed_cycler_run, diag_nr, charge_y_n, max_nr_peaks,
         The peaks will be isolated
     """
 
-    rpt_type_data = processed_cycler_run.diagnostic_interpolated[(processed_cycler_run.diagnostic_interpolated.cycle_type == rpt_type)]
-    cycles = rpt_type_data.cycle_index.unique()
+    view = get_diagnostic_view(processed_cycler_run)
+    cycles = view.cycle_indices(rpt_type)
+    rpt_cycle_data = view.rows(rpt_type, cycles[diag_nr])
 
     ## Take charge or discharge from cycle 'diag_nr'
     data = pd.DataFrame({'dQdV': [], 'voltage': []})
 
     if charge_y_n == 1:
-        data.dQdV = rpt_type_data[
-            (rpt_type_data.cycle_index == cycles[diag_nr]) & (rpt_type_data.step_type == 0)].charge_dQdV.values
-        data.voltage = rpt_type_data[
-            (rpt_type_data.cycle_index == cycles[diag_nr]) & (rpt_type_data.step_type == 0)].voltage.values
+        data.dQdV = rpt_cycle_data[rpt_cycle_data.step_type == 0].charge_dQdV.values
+        data.voltage = rpt_cycle_data[rpt_cycle_data.step_type == 0].voltage.values
     elif charge_y_n == 0:
-        data.dQdV = rpt_type_data[
-            (rpt_type_data.cycle_index == cycles[diag_nr]) & (rpt_type_data.step_type == 1)].discharge_dQdV.values
-        data.voltage = rpt_type_data[
-            (rpt_type_data.cycle_index == cycles[diag_nr]) & (rpt_type_data.step_type == 1)].voltage.values
+        data.dQdV = rpt_cycle_data[rpt_cycle_data.step_type == 1].discharge_dQdV.values
+        data.voltage = rpt_cycle_data[rpt_cycle_data.step_type == 1].voltage.values
         # Turn values to positive temporarily
         data.dQdV = -data.dQdV
     else:
@@ -88,12 +218,14 @@ def isolate_dQdV_peaks(processed_cycler_run, diag_nr, charge_y_n, max_nr_peaks,
     return filter_data, no_filter_data, peak_voltages, peak_dQdVs
 
 
-def generate_model(spec):
+def generate_model(spec, seed=0):
     """
     Method that generates a model to fit the hppc data to for peak extraction, using spec dictionary
     :param spec (dict): dictionary containing X, y model types.
+    :param seed (int): seed of the random initial values, so that fits are reproducible.
     :return: composite model objects of lmfit Model class and a parameter object as defined in lmfit.
     """
+    random_state = np.random.RandomState(seed)
     composite_model = None
     params = None
     x = spec['x']
@@ -115,9 +247,9 @@ def generate_model(spec):
             model.set_param_hint('amplitude', min=1e-6)
 
             default_params = {
-                prefix + 'center': x_min + x_range * np.random.randn(),
-                prefix + 'height': y_max * np.random.randn(),
-                prefix + 'sigma': x_range * np.random.randn()
+                prefix + 'center': x_min + x_range * random_state.randn(),
+                prefix + 'height': y_max * random_state.randn(),
+                prefix + 'sigma': x_range * random_state.randn()
             }
         else:
             raise NotImplemented(f'model {basis_func["type"]} not implemented yet')
@@ -159,92 +291,269 @@ def update_spec_from_peaks(spec, model_indices, peak_voltages, peak_dQdVs, peak_
     return
 
 
-def generate_dQdV_peak_fits(processed_cycler_run, rpt_type, diag_nr, charge_y_n, plotting_y_n=0, max_nr_peaks=4):
+def gaussian(x, amplitude, center, sigma):
     """
-    Generate fits characteristics from dQdV peaks
+    Gaussian peaks as in lmfit's GaussianModel, i. e. with amplitude the
+    area under the peak.
 
     Args:
-        processed_cycler_run: processed_cycler_run (beep.structure.ProcessedCyclerRun)
-        diag_nr: if 1, takes dQdV of 1st RPT past the initial diagnostic, 0 (default) is initial dianostic
-        charge_y_n: if 1 (default), takes charge dQdV, if 0, takes discharge dQdV
+        x (numpy.ndarray): points to evaluate the peaks at.
+        amplitude, center, sigma (numpy.ndarray): parameters of each peak.
+
+    Returns:
+        numpy.ndarray: value of each peak (columns) at each point (rows).
+    """
+    x = np.asarray(x, dtype=float)[:, np.newaxis]
+    return amplitude / (sigma * np.sqrt(2 * np.pi)) * np.exp(-(x - center) ** 2 / (2 * sigma ** 2))
+
+
+def fit_gaussian_peaks(x, y, peak_voltages, peak_dQdVs, sigma_max=0.1, peak_width=10, initial_values=None):
+    """
+    Fits a sum of Gaussian peaks to dQdV data with scipy's bounded least
+    squares and the analytic Jacobian of the peaks, as a faster alternative
+    to fitting the composite lmfit model of generate_model. The bounds are
+    those of the lmfit model, the fit starts from the found peaks, or
+    from initial_values, e. g. the fit of the previous diagnostic.
 
+    Args:
+        x (pandas.Series): voltages.
+        y (pandas.Series): dQdV values.
+        peak_voltages (dict): voltage of each found peak.
+        peak_dQdVs (dict): dQdV of each found peak.
+        sigma_max (float): upper bound of the peak widths.
+        peak_width (int): width of the found peaks in points, for the
+            initial peak widths.
+        initial_values (dict): initial m{i}_amplitude, m{i}_center and
+            m{i}_sigma values, in the format of the returned values.
 
     Returns:
-        dataframe with Amplitude, mu and sigma of fitted peaks
+        dict: best m{i}_amplitude, m{i}_center and m{i}_sigma values.
     """
-    # Uses isolate_dQdV_peaks function to filter out peaks and returns x(Volt) and y(dQdV) values from peaks
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n_peaks = len(peak_voltages)
+    x_min, x_max = np.min(x), np.max(x)
+    x_range = x_max - x_min
+    names = ['m{}_{}'.format(i, name) for i in range(n_peaks) for name in ['amplitude', 'center', 'sigma']]
+    lower = np.tile([1e-6, x_min, 1e-6], n_peaks)
+    upper = np.tile([np.inf, x_max, min(x_range, sigma_max)], n_peaks)
 
-    data, no_filter_data, peak_voltages, peak_dQdVs = isolate_dQdV_peaks(processed_cycler_run, rpt_type=rpt_type, \
+    if initial_values is not None and all(name in initial_values for name in names):
+        p0 = np.array([initial_values[name] for name in names])
+    else:
+        sigma = x_range / len(x) * peak_width
+        heights = np.array([peak_dQdVs[i] for i in peak_dQdVs])
+        p0 = np.column_stack([heights * sigma * np.sqrt(2 * np.pi),
+                              [peak_voltages[i] for i in peak_voltages],
+                              np.full(n_peaks, sigma)]).ravel()
+    # Strictly within the bounds, as required by the trust region solver
+    margin = 1e-9 * np.maximum(1, np.abs(p0))
+    p0 = np.clip(p0, lower + margin, np.where(np.isinf(upper), np.inf, upper - margin))
+
+    def residuals(p):
+        amplitude, center, sigma = p.reshape(-1, 3).T
+        return gaussian(x, amplitude, center, sigma).sum(axis=1) - y
+
+    def jacobian(p):
+        amplitude, center, sigma = p.reshape(-1, 3).T
+        peaks = gaussian(x, amplitude, center, sigma)
+        dx = x[:, np.newaxis] - center
+        jac = np.empty((len(x), n_peaks, 3))
+        jac[:, :, 0] = peaks / amplitude
+        jac[:, :, 1] = peaks * dx / sigma ** 2
+        jac[:, :, 2] = peaks * (dx ** 2 / sigma ** 3 - 1 / sigma)
+        return jac.reshape(len(x), -1)
+
+    result = least_squares(residuals, p0, jac=jacobian, bounds=(lower, upper))
+    return dict(zip(names, result.x))
+
+
+def fit_dQdV_peaks(processed_cycler_run, rpt_type, diag_nr, charge_y_n, max_nr_peaks=4,
+                   backend='lmfit', initial_values=None, seed=0):
+    """
+    Fits Gaussian peaks to the dQdV curve of an RPT diagnostic cycle, see
+    generate_dQdV_peak_fits.
+
+    Args:
+        processed_cycler_run (beep.structure.ProcessedCyclerRun)
+        rpt_type (str): type of rpt cycle.
+        diag_nr (int): occurence of the rpt cycle, 0 is the initial diagnostic.
+        charge_y_n (int): if 1, takes charge dQdV, if 0, takes discharge dQdV.
+        max_nr_peaks (int): number of peaks to fit.
+        backend (str): 'lmfit' to fit the composite lmfit model of
+            generate_model or 'least_squares' for fit_gaussian_peaks.
+        initial_values (dict): initial peak parameters, e. g. the best
+            values of the fit of another diagnostic.
+        seed (int): seed of the random initial values of the lmfit model.
+
+    Returns:
+        dict: with the peak fit DataFrame ('peak_fit'), the best parameter
+            values ('best_values'), the fitted data ('x', 'y'), the data
+            before peak isolation ('no_filter_data'), the found peaks
+            ('peak_voltages', 'peak_dQdVs') and the fitted value of each
+            peak at x ('components').
+    """
+    # Uses isolate_dQdV_peaks function to filter out peaks and returns x(Volt) and y(dQdV) values from peaks
+    data, no_filter_data, peak_voltages, peak_dQdVs = isolate_dQdV_peaks(processed_cycler_run, rpt_type=rpt_type,
                                                                          charge_y_n=charge_y_n, diag_nr=diag_nr,
                                                                          max_nr_peaks=max_nr_peaks,
                                                                          half_peak_width=0.07)
+    x = data.voltage
+    y = data.dQdV
 
-    no_filter_x = no_filter_data.voltage
-    no_filter_y = no_filter_data.dQdV
+    if backend == 'least_squares':
+        best_values = fit_gaussian_peaks(x, y, peak_voltages, peak_dQdVs, initial_values=initial_values)
+    elif backend == 'lmfit':
+        ####### Setting spec for gaussian model generation
+        # Set construct spec using number of peaks
+        model_types = []
+        for i in np.arange(max_nr_peaks):
+            model_types.append({'type': 'GaussianModel', 'help': {'sigma': {'max': 0.1}}})
+
+        spec = {
+            'x': x,
+            'y': y,
+            'model': model_types
+        }
+
+        # Update spec using the found peaks
+        update_spec_from_peaks(spec, np.arange(max_nr_peaks), peak_voltages, peak_dQdVs)
+
+        #### Generate fitting model
+        model, params = generate_model(spec, seed=seed)
+        for name, value in (initial_values or {}).items():
+            if name in params and params[name].expr is None:
+                params[name].set(value=np.clip(value, params[name].min, params[name].max))
+        output = model.fit(spec['y'], params, x=spec['x'])
+        best_values = output.best_values
+    else:
+        raise ValueError('backend must be either lmfit or least_squares')
 
-    ####### Setting spec for gaussian model generation
+    # Construct dictionary of peak fits
+    peak_fit_dict = {}
+    components = {}
+    for i in range(max_nr_peaks):
+        prefix = f'm{i}_'
+        peak_fit_dict[prefix + "Amp"] = [peak_dQdVs[i]]
+        peak_fit_dict[prefix + "Mu"] = [best_values[prefix + "center"]]
+        peak_fit_dict[prefix + "Sig"] = [best_values[prefix + "sigma"]]
+        components[prefix] = gaussian(x, best_values[prefix + "amplitude"], best_values[prefix + "center"],
+                                      best_values[prefix + "sigma"])[:, 0]
 
-    x = data.voltage
-    y = data.dQdV
+    return {'peak_fit': pd.DataFrame(peak_fit_dict),
+            'best_values': dict(best_values),
+            'x': x,
+            'y': y,
+            'no_filter_data': no_filter_data,
+            'peak_voltages': peak_voltages,
+            'peak_dQdVs': peak_dQdVs,
+            'components': components}
 
-    # Set construct spec using number of peaks
-    model_types = []
-    for i in np.arange(max_nr_peaks):
-        model_types.append({'type': 'GaussianModel', 'help': {'sigma': {'max': 0.1}}})
 
-    spec = {
-        'x': x,
-        'y': y,
-        'model': model_types
-    }
+def generate_dQdV_peak_fits(processed_cycler_run, rpt_type, diag_nr, charge_y_n, plotting_y_n=0, max_nr_peaks=4,
+                            backend='lmfit', initial_values=None, seed=0):
+    """
+    Generate fits characteristics from dQdV peaks
 
-    # Update spec using the found peaks
-    update_spec_from_peaks(spec, np.arange(max_nr_peaks), peak_voltages, peak_dQdVs)
-    if plotting_y_n:
-        fig, ax = plt.subplots()
-        ax.scatter(spec['x'], spec['y'], s=4)
-        for i in peak_voltages:
-            ax.axvline(x=peak_voltages[i], c='black', linestyle='dotted')
-            ax.scatter(peak_voltages[i], peak_dQdVs[i], s=30, c='red')
+    Args:
+        processed_cycler_run: processed_cycler_run (beep.structure.ProcessedCyclerRun)
+        diag_nr: if 1, takes dQdV of 1st RPT past the initial diagnostic, 0 (default) is initial dianostic
+        charge_y_n: if 1 (default), takes charge dQdV, if 0, takes discharge dQdV
+        backend (str): 'lmfit' or 'least_squares', see fit_dQdV_peaks
+        initial_values (dict): initial peak parameters, see fit_dQdV_peaks
+        seed (int): seed of the random initial values of the lmfit model
 
-    #### Generate fitting model
 
-    model, params = generate_model(spec)
-    output = model.fit(spec['y'], params, x=spec['x'])
+    Returns:
+        dataframe with Amplitude, mu and sigma of fitted peaks
+    """
+    fit = fit_dQdV_peaks(processed_cycler_run, rpt_type, diag_nr, charge_y_n, max_nr_peaks=max_nr_peaks,
+                         backend=backend, initial_values=initial_values, seed=seed)
     if plotting_y_n:
-        #         #Plot residuals
-        #         fig, gridspec = output.plot(data_kws={'markersize': 1})
+        plot_dQdV_peak_fit(fit, diag_nr, charge_y_n)
+    return fit['peak_fit']
 
-        ### Plot components
 
-        ax.scatter(no_filter_x, no_filter_y, s=4)
-        ax.set_xlabel('Voltage')
+def plot_dQdV_peak_fit(fit, diag_nr, charge_y_n):
+    """
+    Plots the dQdV data, peaks and fitted components of a peak fit.
 
-        if charge_y_n:
-            ax.set_title(f'dQdV for charge diag cycle {diag_nr}')
-            ax.set_ylabel('dQdV')
-        else:
-            ax.set_title(f'dQdV for discharge diag cycle {diag_nr}')
-            ax.set_ylabel('- dQdV')
+    Args:
+        fit (dict): peak fit, see fit_dQdV_peaks.
+        diag_nr (int): occurence of the rpt cycle which was fit.
+        charge_y_n (int): if 1, the fit is of charge dQdV, if 0 of discharge dQdV.
+    """
+    peak_voltages = fit['peak_voltages']
+    peak_dQdVs = fit['peak_dQdVs']
+    fig, ax = plt.subplots()
+    ax.scatter(fit['x'], fit['y'], s=4)
+    for i in peak_voltages:
+        ax.axvline(x=peak_voltages[i], c='black', linestyle='dotted')
+        ax.scatter(peak_voltages[i], peak_dQdVs[i], s=30, c='red')
+
+    ### Plot components
+
+    ax.scatter(fit['no_filter_data'].voltage, fit['no_filter_data'].dQdV, s=4)
+    ax.set_xlabel('Voltage')
+
+    if charge_y_n:
+        ax.set_title(f'dQdV for charge diag cycle {diag_nr}')
+        ax.set_ylabel('dQdV')
+    else:
+        ax.set_title(f'dQdV for discharge diag cycle {diag_nr}')
+        ax.set_ylabel('- dQdV')
 
-        components = output.eval_components()
-        for i, model in enumerate(spec['model']):
-            ax.plot(spec['x'], components[f'm{i}_'])
+    for prefix, component in fit['components'].items():
+        ax.plot(fit['x'], component)
 
-    # Construct dictionary of peak fits
-    peak_fit_dict = {}
-    for i, model in enumerate(spec['model']):
-        best_values = output.best_values
-        prefix = f'm{i}_'
-        peak_fit_dict[prefix + "Amp"] = [peak_dQdVs[i]]
-        peak_fit_dict[prefix + "Mu"] = [best_values[prefix + "center"]]
-        peak_fit_dict[prefix + "Sig"] = [best_values[prefix + "sigma"]]
 
-    # Make dataframe out of dict
-    peak_fit_df = pd.DataFrame(peak_fit_dict)
+def generate_dQdV_peak_fits_batch(processed_cycler_run, rpt_type, charge_y_n, diag_nrs=None, max_nr_peaks=4,
+                                  backend='lmfit', warm_start=True, seed=0, plotting_y_n=0):
+    """
+    Generate fits characteristics from dQdV peaks of several diagnostics
+    of a run at once, each fit starting from the best values of the
+    previous one if warm_start. The fits are deterministic for a seed,
+    and computed once per run, see DiagnosticView.
 
-    return peak_fit_df
+    Args:
+        processed_cycler_run: processed_cycler_run (beep.structure.ProcessedCyclerRun)
+        rpt_type (str): type of rpt cycle.
+        charge_y_n (int): if 1, takes charge dQdV, if 0, takes discharge dQdV.
+        diag_nrs (list): occurences of the rpt cycle to fit, in fitting
+            order, all of them if None.
+        max_nr_peaks (int): number of peaks to fit.
+        backend (str): 'lmfit' or 'least_squares', see fit_dQdV_peaks.
+        warm_start (bool): whether to start each fit from the previous one.
+        seed (int): seed of the random initial values of the lmfit model.
+        plotting_y_n (int): if 1, plots each peak fit, see plot_dQdV_peak_fit.
 
+    Returns:
+        pandas.DataFrame: Amplitude, mu and sigma of fitted peaks, indexed by diag_nr.
+    """
+    view = get_diagnostic_view(processed_cycler_run)
+    if diag_nrs is None:
+        diag_nrs = range(len(view.cycle_indices(rpt_type)))
+    diag_nrs = tuple(diag_nrs)
+
+    def fit_all(view):
+        fits = []
+        initial_values = None
+        for diag_nr in diag_nrs:
+            fit = fit_dQdV_peaks(processed_cycler_run, rpt_type, diag_nr, charge_y_n, max_nr_peaks=max_nr_peaks,
+                                 backend=backend, initial_values=initial_values, seed=seed)
+            fits.append(fit)
+            if warm_start:
+                initial_values = fit['best_values']
+        peak_fits = pd.concat([fit['peak_fit'] for fit in fits], keys=diag_nrs).reset_index(level=1, drop=True)
+        return peak_fits, fits
+
+    key = ('dQdV_peak_fits', rpt_type, charge_y_n, diag_nrs, max_nr_peaks, backend, warm_start, seed)
+    peak_fits, fits = view.derived(key, fit_all)
+    # Plotted from the fits, so that plotting doesn't change them
+    if plotting_y_n:
+        for diag_nr, fit in zip(diag_nrs, fits):
+            plot_dQdV_peak_fit(fit, diag_nr, charge_y_n)
+    return peak_fits
 
 
 def interp(df):
@@ -270,19 +579,96 @@ def list_minus(list1, list2):
     return result
 
 
-def get_hppc_ocv_helper(cycle_hppc_0, step_num):
+def get_hppc_pulses(processed_cycler_run):
     """
-    this helper function takes in a cycle and a step number
-    and returns a list that stores the mean of the last five points of voltage in different
-    step counter indexes (which is basically the soc window)
+    Summarizes every pulse of the HPPC cycles of a run, i. e. every
+    step_index_counter of every step, in one pass over the HPPC rows with
+    a current. Rows of the reference cycle past HPPC_REFERENCE_MAX_TEST_TIME
+    are left out. The table is computed once per run, see DiagnosticView.
+
+    Args:
+        processed_cycler_run (beep.structure.ProcessedCyclerRun): processed cycler run.
+
+    Returns:
+        pandas.DataFrame: one row per pulse with cycle_index, step_index,
+            step_index_counter, soc_window (the position of the pulse among
+            those of its step, in order of appearance), voltage (last point),
+            ocv_voltage (tenth to last point, NaN for shorter pulses) and
+            current (mean), ordered by first appearance.
+    """
+    return get_diagnostic_view(processed_cycler_run).derived('hppc_pulses', _get_hppc_pulses)
+
+
+def _get_hppc_pulses(view):
+    hppc = view.table('hppc', valid_current=True)
+    hppc = hppc.loc[(hppc.cycle_index != HPPC_REFERENCE_CYCLE) |
+                    (hppc.test_time < HPPC_REFERENCE_MAX_TEST_TIME)]
+    keys = ['cycle_index', 'step_index', 'step_index_counter']
+    hppc = hppc.dropna(subset=keys)
+    groups = hppc.groupby(keys, sort=False)
+    codes = groups.ngroup().values
+    if len(codes) == 0:
+        return pd.DataFrame(columns=keys + ['soc_window', 'voltage', 'ocv_voltage', 'current'])
+
+    # Rows by pulse, in their original order within each pulse
+    order = np.argsort(codes, kind='mergesort')
+    counts = np.bincount(codes)
+    ends = np.cumsum(counts)
+    voltage = hppc.voltage.values
+    ocv_rows = order[np.maximum(ends - 10, ends - counts)]
+    pulses = pd.DataFrame(hppc[keys].values[order[ends - counts]], columns=keys)
+    pulses['soc_window'] = pulses.groupby(['cycle_index', 'step_index'], sort=False).cumcount()
+    pulses['voltage'] = voltage[order[ends - 1]]
+    pulses['ocv_voltage'] = np.where(counts >= 10, voltage[ocv_rows], np.nan)
+    pulses['current'] = np.bincount(codes, weights=hppc.current.values) / counts
+    return pulses
+
+
+def get_hppc_resistance(processed_cycler_run, n_soc_windows=HPPC_SOC_WINDOWS):
+    """
+    Discharge and charge pulse resistances of all HPPC cycles of a run,
+    from the overpotential of the last point of each pulse over that of
+    the preceding rest, see get_hppc_pulses. The table is computed once
+    per run.
+
+    Args:
+        processed_cycler_run (beep.structure.ProcessedCyclerRun): processed cycler run.
+        n_soc_windows (int): number of SOC windows per cycle to keep.
+
+    Returns:
+        pandas.DataFrame: one row per cycle_index, soc_window and state
+            ('D' for discharge, 'C' for charge) with the overpotential,
+            mean current and resistance of the pulse.
     """
-    chosen1 = cycle_hppc_0[cycle_hppc_0.step_index == step_num]
-    voltage1 = []
-    step_index_counters = chosen1.step_index_counter.unique()[0:9]
-    for i in range(len(step_index_counters)):
-        df_i = chosen1.loc[chosen1.step_index_counter == step_index_counters[i]]
-        voltage1.append(df_i['voltage'].iloc[-10].mean())  # take the mean of the last 10 points of the voltage value
-    return voltage1
+    view = get_diagnostic_view(processed_cycler_run)
+    return view.derived(('hppc_resistance', n_soc_windows),
+                        lambda view: _get_hppc_resistance(view.derived('hppc_pulses', _get_hppc_pulses),
+                                                          n_soc_windows))
+
+
+def _get_hppc_resistance(pulses, n_soc_windows):
+    pulses = pulses.loc[pulses.soc_window < n_soc_windows]
+    reference = (pulses.cycle_index == HPPC_REFERENCE_CYCLE).values
+    states = pd.Series(None, index=pulses.index, dtype=object)
+    for state, (reference_step, later_step) in HPPC_PULSE_STEPS.items():
+        steps = np.where(reference, reference_step, later_step)
+        states[(pulses.step_index == steps).values] = state
+    pulses = pulses.assign(state=states).dropna(subset=['state'])
+    pulses = pulses.set_index(['cycle_index', 'soc_window', 'state'])[['voltage', 'current']].unstack('state')
+
+    resistances = []
+    for state in ['D', 'C']:
+        if state not in pulses.voltage or 'R' not in pulses.voltage:
+            continue
+        resistance = pd.DataFrame({'overpotential': pulses.voltage[state] - pulses.voltage['R'],
+                                   'current': pulses.current[state]}).dropna()
+        resistance['resistance'] = resistance.overpotential / resistance.current
+        resistance['state'] = state
+        resistances.append(resistance.reset_index())
+    if not resistances:
+        return pd.DataFrame(columns=['cycle_index', 'soc_window', 'overpotential',
+                                     'current', 'resistance', 'state'])
+    return pd.concat(resistances, ignore_index=True)
 
 
 def get_hppc_ocv(processed_cycler_run, diag_num):
@@ -296,19 +682,13 @@ def get_hppc_ocv(processed_cycler_run, diag_num):
             a float
             the variance of the diag_num minus cycle 2 for OCV
     '''
-    data = processed_cycler_run.diagnostic_interpolated
-    cycle_hppc = data.loc[data.cycle_type == 'hppc']
-    cycle_hppc = cycle_hppc.loc[cycle_hppc.current.notna()]
-    step = 11
-    step_later = 43
-    cycle_hppc_0 = cycle_hppc.loc[cycle_hppc.cycle_index == 2]
-    #     in case that cycle 2 correspond to two cycles one is real cycle 2, one is at the end
-    cycle_hppc_0 = cycle_hppc_0.loc[cycle_hppc_0.test_time < 250000]
-    voltage_1 = get_hppc_ocv_helper(cycle_hppc_0, step)
-    chosen = cycle_hppc.loc[cycle_hppc.cycle_index == diag_num]
-    voltage_2 = get_hppc_ocv_helper(chosen, step_later)
-    dv = list_minus(voltage_1, voltage_2)
-    return np.var(dv)
+    pulses = get_hppc_pulses(processed_cycler_run)
+    pulses = pulses.loc[pulses.soc_window < HPPC_SOC_WINDOWS]
+    step, step_later = HPPC_PULSE_STEPS['R']
+    voltage_1 = pulses.loc[(pulses.cycle_index == HPPC_REFERENCE_CYCLE) & (pulses.step_index == step)]
+    voltage_2 = pulses.loc[(pulses.cycle_index == diag_num) & (pulses.step_index == step_later)]
+    dv = voltage_1.set_index('soc_window').ocv_voltage - voltage_2.set_index('soc_window').ocv_voltage
+    return np.var(dv.dropna().values)
 
 
 def get_hppc_r(processed_cycler_run, diag_num):
@@ -322,89 +702,16 @@ def get_hppc_r(processed_cycler_run, diag_num):
             two floats
             the variance of the diag_num - cycle 2 for HPPC resistance for both charge and discharge
     '''
-    data = processed_cycler_run.diagnostic_interpolated
-    cycle_hppc = data.loc[data.cycle_type == 'hppc']
-    cycle_hppc = cycle_hppc.loc[cycle_hppc.current.notna()]
-    cycles = cycle_hppc.cycle_index.unique()
+    cycles = get_diagnostic_view(processed_cycler_run).cycle_indices('hppc', valid_current=True)
     if diag_num not in cycles:
         return None
-    steps = [11, 12, 14]
-    states = ['R', 'D', 'C']
-    results_0 = {}
-    results = {}
-    resistance = {}
-    dr_d = {}
-    cycle_hppc_0 = cycle_hppc.loc[cycle_hppc.cycle_index == 2]
-    #     in case that cycle 2 correspond to two cycles one is real cycle 2, one is at the end
-    cycle_hppc_0 = cycle_hppc_0.loc[cycle_hppc_0.test_time < 250000]
-    for i in range(len(steps)):
-        chosen = cycle_hppc_0[cycle_hppc_0.step_index == steps[i]]
-        state = states[i]
-        result = get_V_I(chosen)
-        results_0[state] = result
-    results[2] = results_0
-    steps_later = [43, 44, 46]
-    #     step 43 is rest, 44 is discharge and 46 is charge, use the get ocv function to get the voltage values
-    #     and calculate the over potential and thus the resistance change
-    for i in range(1, len(cycles)):
-        chosen = cycle_hppc[cycle_hppc.cycle_index == cycles[i]]
-        results_s = {}
-        for j in range(len(steps_later)):
-            chosen_s = chosen[chosen.step_index == steps_later[j]]
-            state = states[j]
-            results_s[state] = get_V_I(chosen_s)
-        results[cycles[i]] = results_s
-    # calculate the resistance and compare the cycle evolution
-    keys = list(results.keys())
-    resistance['D'] = {}
-    resistance['C'] = {}
-    for i in range(len(keys)):
-        d_v = results[keys[i]]['D']['voltage']  # discharge voltage for a cycle
-        c_v = results[keys[i]]['C']['voltage']  # charge voltage for a cycle
-        r_v = results[keys[i]]['R']['voltage']  # rest voltage for a cycle
-        r_v_d = r_v[0:min(len(r_v), len(d_v))]  # in case the size is different
-        d_v = d_v[0:min(len(r_v), len(d_v))]
-        c_v = c_v[0:min(len(r_v), len(c_v))]
-        r_v_c = r_v[0:min(len(r_v), len(c_v))]
-        d_n = list(np.array(d_v) - np.array(r_v_d))  # discharge overpotential
-        c_n = list(np.array(c_v) - np.array(r_v_c))  # charge overpotential
-        resistance['D'][keys[i]] = np.true_divide(d_n, results[keys[i]]['D']['current'])
-        resistance['C'][keys[i]] = np.true_divide(c_n, results[keys[i]]['C']['current'])
-    resistance_d = resistance['D']
-    resistance_c = resistance['C']
-    dr_c = {}
-    SOC = list(range(10, 100, 10))
-    for i in range(1, len(keys)):
-        resistance_d_i = resistance_d[keys[i]]
-        resistance_d_0 = resistance_d[keys[0]]
-        resistance_d_0 = resistance_d_0[0:min(len(resistance_d_i), len(resistance_d_0))]
-        dr_d[keys[i]] = list(resistance_d_i - resistance_d_0)
-    for i in range(1, len(keys)):
-        resistance_c_i = resistance_c[keys[i]]
-        resistance_c_0 = resistance_c[keys[0]]
-        resistance_c_0 = resistance_c_0[0:min(len(resistance_c_i), len(resistance_c_0))]
-        dr_c[keys[i]] = list(resistance_c_i - resistance_c_0)
-    f2_d = np.var(dr_d[diag_num])
-    f2_c = np.var(dr_c[diag_num])
-    return f2_d, f2_c
-
-
-def get_V_I(df):
-    """
-    this helper functiion takes in a specific step in the first hppc cycle and gives you the voltage values as
-    well as the current values after each step in the first cycle.
-    """
-    result = {}
-    voltage = []
-    current = []
-    step_index_counters = df.step_index_counter.unique()[0:9]
-    for i in range(len(step_index_counters)):
-        df_i = df.loc[df.step_index_counter == step_index_counters[i]]
-        voltage.append(df_i['voltage'].iloc[-1])  # the last point of the voltage value
-        current.append(df_i['current'].mean())
-    result['voltage'] = voltage
-    result['current'] = current
-    return result
+    resistance = get_hppc_resistance(processed_cycler_run)
+    resistance = resistance.set_index(['state', 'cycle_index', 'soc_window']).resistance
+    variances = []
+    for state in ['D', 'C']:
+        dr = resistance[state][diag_num] - resistance[state][HPPC_REFERENCE_CYCLE]
+        variances.append(np.var(dr.dropna().values))
+    return tuple(variances)
 
 
 def get_v_diff(diag_num, processed_cycler_run, soc_window):
@@ -418,15 +725,12 @@ def get_v_diff(diag_num, processed_cycler_run, soc_window):
     Returns:
             a float
     """
-    data = processed_cycler_run.diagnostic_interpolated
-    hppc_data = data.loc[data.cycle_type == 'hppc']
+    view = get_diagnostic_view(processed_cycler_run)
     # the discharge steps in the hppc cycles step number 47
-    hppc_data_2 = hppc_data.loc[hppc_data.cycle_index == diag_num]
-    hppc_data_1 = hppc_data.loc[hppc_data.cycle_index == 2]
+    hppc_data_2_d = view.rows('hppc', diag_num, step_index=47)
+    hppc_data_1_d = view.rows('hppc', 2, step_index=15)
     #     in case a final HPPC is appended in the end also with cycle number 2
-    hppc_data_1 = hppc_data_1.loc[hppc_data_1.discharge_capacity < 8]
-    hppc_data_2_d = hppc_data_2.loc[hppc_data_2.step_index == 47]
-    hppc_data_1_d = hppc_data_1.loc[hppc_data_1.step_index == 15]
+    hppc_data_1_d = hppc_data_1_d.loc[hppc_data_1_d.discharge_capacity < 8]
     step_counters_1 = hppc_data_1_d.step_index_counter.unique()
     step_counters_2 = hppc_data_2_d.step_index_counter.unique()
     if (len(step_counters_1) < 8) or (len(step_counters_2) < 8):
@@ -486,6 +790,92 @@ def get_relaxation_times(voltage_data, time_data, decay_percentage = [0.5, 0.8,
     return np.array(time_array)
 
 
+def get_hppc_relaxation_times(processed_cycler_run, decay_percentage=(0.5, 0.8, 0.99),
+                              n_soc_windows=HPPC_SOC_WINDOWS):
+    """
+    Times taken to reach fractions of the voltage relaxation for every
+    relaxation curve of every HPPC cycle of a run at once, the equivalent
+    of get_relaxation_times for each curve. The relaxation curves of a
+    cycle are those of the second lowest step_index of the cycle, except
+    the first which comes out of CV, and each curve comprises all rows of
+    its step_index_counter. The times are computed once per run, see
+    DiagnosticView.
+
+    Args:
+        processed_cycler_run (beep.structure.ProcessedCyclerRun): processed cycler run.
+        decay_percentage (tuple): fractions of the relaxation to compute time constants for.
+        n_soc_windows (int): number of relaxation curves per cycle.
+
+    Returns:
+        numpy.ndarray: HPPC cycle indices in ascending order.
+        numpy.ndarray: times of shape (cycle, SOC window, percentage), SOC
+            windows from the highest SOC downwards, NaN where there is no
+            curve or the relaxation can't be computed.
+    """
+    view = get_diagnostic_view(processed_cycler_run)
+    key = ('hppc_relaxation_times', tuple(decay_percentage), n_soc_windows)
+    return view.derived(key, lambda view: _get_hppc_relaxation_times(view, decay_percentage, n_soc_windows))
+
+
+def _get_hppc_relaxation_times(view, decay_percentage, n_soc_windows):
+    hppc = view.table('hppc')
+    cycles = np.sort(view.cycle_indices('hppc'))
+    times = np.full((len(cycles), n_soc_windows, len(decay_percentage)), np.nan)
+    hppc = hppc.dropna(subset=['cycle_index', 'step_index', 'step_index_counter'])
+
+    # The relaxation step of each cycle is its second lowest step_index
+    steps = hppc[['cycle_index', 'step_index']].drop_duplicates().sort_values(['cycle_index', 'step_index'])
+    steps = steps.loc[(steps.groupby('cycle_index').cumcount() == 1).values]
+    relaxation_rows = hppc.merge(steps, on=['cycle_index', 'step_index'])
+    curves = relaxation_rows[['cycle_index', 'step_index_counter']].drop_duplicates()
+    curves = curves.sort_values(['cycle_index', 'step_index_counter'])
+    curves['soc_window'] = curves.groupby('cycle_index').cumcount().values - 1
+    curves = curves.loc[(curves.soc_window >= 0) & (curves.soc_window < n_soc_windows)]
+    curves['curve'] = np.arange(len(curves))
+    if len(curves) == 0:
+        return cycles, times
+
+    # Rows of each curve in their original order
+    rows = hppc[['cycle_index', 'step_index_counter', 'voltage', 'test_time']].reset_index(drop=True)
+    rows['position'] = np.arange(len(rows))
+    rows = rows.merge(curves, on=['cycle_index', 'step_index_counter'])
+    rows = rows.sort_values(['curve', 'position'], kind='mergesort')
+    curve = rows.curve.values
+    voltage = rows.voltage.values.astype(float)
+    test_time = rows.test_time.values.astype(float)
+    counts = np.bincount(curve, minlength=len(curves))
+    starts = np.cumsum(counts) - counts
+    ends = starts + counts - 1
+
+    # Voltage scaled to between 0-1 and time shifted to start at 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = (voltage - voltage[starts][curve]) / (voltage[ends][curve] - voltage[starts][curve])
+    shifted = test_time - test_time[starts][curve]
+    valid = (counts >= 2) & np.isfinite(np.add.reduceat(scaled, starts))
+
+    # Inverse of each relaxation curve by linear interpolation over the
+    # scaled voltage in ascending order within each curve, as interp1d
+    order = np.lexsort((scaled, curve))
+    scaled = scaled[order]
+    shifted = shifted[order]
+    curve_times = np.full((len(curves), len(decay_percentage)), np.nan)
+    for n, percent in enumerate(decay_percentage):
+        below = np.bincount(curve, weights=scaled < percent, minlength=len(curves)).astype(int)
+        hi = starts + np.clip(below, 1, np.maximum(counts - 1, 1))
+        lo = hi - 1
+        hi = np.minimum(hi, len(scaled) - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (shifted[hi] - shifted[lo]) / (scaled[hi] - scaled[lo])
+            curve_times[:, n] = slope * (percent - scaled[lo]) + shifted[lo]
+        # Fractions outside of the relaxation can't be interpolated
+        outside = (percent < scaled[starts]) | (percent > scaled[ends])
+        curve_times[outside, n] = np.nan
+    curve_times[~valid] = np.nan
+
+    times[np.searchsorted(cycles, curves.cycle_index.values), curves.soc_window.values] = curve_times
+    return cycles, times
+
+
 def get_relaxation_features(processed_cycler_run):
     """
 
@@ -503,48 +893,5 @@ def get_relaxation_features(processed_cycler_run):
         the percentages 50%, 80%, and 99% correspond to a given column, and the rows are different
         SOCs of the HPPC starting at 0 with the highest SOC and going downwards.
     """
-
-    total_time_array = []
-
-    # chooses the first and the second diagnostic cycle
-    for hppc_chosen in [0, 1]:
-
-        # Getting just the HPPC cycles
-        hppc_diag_cycles = processed_cycler_run.diagnostic_interpolated[processed_cycler_run.diagnostic_interpolated.cycle_type == "hppc"]
-
-        # Getting unique and ordered cycle index list for HPPC cycles, and choosing the hppc cycle
-        hppc_cycle_list = list(set(hppc_diag_cycles.cycle_index))
-        hppc_cycle_list.sort()
-
-        # Getting unique and ordered Regular Step List (Non-unique identifier)
-        reg_step_list = hppc_diag_cycles[hppc_diag_cycles.cycle_index == hppc_cycle_list[hppc_chosen]].step_index
-        reg_step_list = list(set(reg_step_list))
-        reg_step_list.sort()
-
-        # The value of 1 for regular step corresponds to all of the relaxation curves in the hppc
-        reg_step_relax = 1
-
-        # Getting unique and ordered Step Counter List (unique identifier)
-        step_count_list = hppc_diag_cycles[(hppc_diag_cycles.cycle_index == hppc_cycle_list[hppc_chosen]) &
-                                           (hppc_diag_cycles.step_index == reg_step_list[reg_step_relax])].step_index_counter
-        step_count_list = list(set(step_count_list))
-        step_count_list.sort()
-        # The first one isn't a proper relaxation curve(comes out of CV) so we ignore it
-        step_count_list = step_count_list[1:]
-
-        # 9x2 array where the rows are the different SOC starting high to low and columns are percent degrad
-        # initialized to all nans so when they can't be calculated it has a nan in its place
-        all_time_array = np.nan * np.ones((9, 3))
-
-        # gets all the times for a single SOC per loop
-        for soc_num in range(0, len(step_count_list)):
-            relax_curve_df = hppc_diag_cycles[(hppc_diag_cycles.cycle_index == hppc_cycle_list[hppc_chosen]) &\
-                                          (hppc_diag_cycles.step_index_counter == step_count_list[soc_num])]
-
-            time_array = get_relaxation_times(np.array(relax_curve_df.voltage), np.array(relax_curve_df.test_time))
-            all_time_array[soc_num][:] = time_array
-
-        total_time_array.append(all_time_array)
-
-    return total_time_array[1] / total_time_array[0]
-
+    _, times = get_hppc_relaxation_times(processed_cycler_run)
+    return times[1] / times[0]
@@ -5,6 +5,7 @@ from monty.json import MSONable
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 from monty.serialization import loadfn
+from beep.structure import ProcessedCyclerRun
 
 
 class PrincipalComponents(MSONable):
@@ -186,7 +187,7 @@ def pivot_data(file_list_json, qty_to_pca='discharge_capacity', pivot_column='vo
     file_list = file_list_data['file_list']
     df_to_pca = pd.DataFrame()
     for file in file_list:
-        processed_run = loadfn(file)
+        processed_run = ProcessedCyclerRun.load(file)
 
         df = processed_run.cycles_interpolated
         df = df[df.cycle_index.isin(cycles_to_pca)]
@@ -43,6 +43,7 @@ from sklearn.linear_model import Lasso, LassoCV, RidgeCV, Ridge, ElasticNetCV, \
 from sklearn.metrics import mean_squared_error
 from sklearn.model_selection import train_test_split
 from beep.utils import KinesisEvents
+from beep.featurize import FeatureStore, FEATURE_STORE_SUFFIX
 from beep import MODEL_DIR, ENVIRONMENT, logger, __version__
 
 s = {'service': 'DataAnalyzer'}
@@ -192,7 +193,8 @@ class DegradationModel(MSONable):
         Model coefficients are initialized after training.
 
         Args:
-            list_of_featurized_jsons (str): json string of featurized cycler run files.
+            list_of_featurized_jsons (str): json string of featurized cycler run files
+                or feature stores, see assemble_predictors.
             dataset_id (str): unique_id corresponding to a list of run_ids that are used
                 for model training.
             model_type (str): linear or random_forest.
@@ -260,6 +262,64 @@ class DegradationModel(MSONable):
             prediction = prediction.reshape((prediction.shape[1],))
         return prediction
 
+    def get_linear_terms(self):
+        """
+        Returns the model terms used for prediction as float arrays,
+        memoized on the instance and recomputed only if the underlying
+        entries of the model dictionary are replaced.
+
+        Returns:
+            numpy.ndarray: mean of the descriptors, or None if not standardized.
+            numpy.ndarray: std dev of the descriptors, or None if not standardized.
+            numpy.ndarray: coefficients of size (k, m), k = number of predicted points.
+            numpy.ndarray: intercepts of size (k,).
+        """
+        standardize = self.model['model_type'].lower() == 'linear'
+        sources = (self.model.get('mu'), self.model.get('sigma'),
+                   self.model['model']['coef_'], self.model['model']['intercept_'])
+        cached = getattr(self, '_linear_terms', None)
+        # The cache keeps the sources alive, so that a new entry can't be
+        # mistaken for a replaced one which was allocated at the same address
+        if cached is None or cached[0] != standardize or \
+                any(source is not cached_source for source, cached_source in zip(sources, cached[1])):
+            mu, sigma, coefs, intercept = sources
+            terms = (np.asarray(mu, dtype=float) if standardize else None,
+                     np.asarray(sigma, dtype=float) if standardize else None,
+                     np.atleast_2d(np.asarray(coefs, dtype=float)),
+                     np.atleast_1d(np.asarray(intercept, dtype=float)).ravel())
+            self._linear_terms = (standardize, sources, terms)
+            cached = self._linear_terms
+        return cached[2]
+
+    def predict_batch(self, features):
+        """
+        Predicts for many cells at once with a single matrix product.
+        Missing descriptors contribute nothing to the prediction, as in
+        DegradationModel.predict.
+
+        Args:
+            features (numpy.ndarray, pandas.DataFrame, [beep.featurize.DegradationPredictor]
+                or object with an X attribute): stacked descriptors of size (n, m),
+                n = number of cells, m = number of features.
+
+        Returns:
+            numpy.ndarray: predictions of size (n, k), k = number of predicted points;
+                row i matches DegradationModel.predict for cell i.
+        """
+        if hasattr(features, 'X'):
+            X = features.X
+        elif isinstance(features, (list, tuple)):
+            X = np.vstack([np.asarray(feature.X, dtype=float) for feature in features])
+        else:
+            X = features
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+
+        mu, sigma, coefs, intercept = self.get_linear_terms()
+        if mu is not None:
+            X = (X - mu) / sigma
+        X = np.where(np.isnan(X), 0.0, X)
+        return X @ coefs.T + intercept
+
     def prediction_to_dict(self, prediction, nominal_capacity=1.1):
         """
         Args:
@@ -400,6 +460,8 @@ def train_linear_model(X, y, random_state=1, test_size=0.2,
 def assemble_predictors(file_list_json):
     """
     Method to assemble predictor dataframe from a json string of paths to feature vectors.
+    Paths ending with FEATURE_STORE_SUFFIX are feature stores, whose
+    cells are all read in a single load.
 
     Args:
         file_list_json (str): json string corresponding to a dictionary
@@ -414,23 +476,37 @@ def assemble_predictors(file_list_json):
     else:
         file_list_data = json.loads(file_list_json)
 
-    X = pd.DataFrame()
-    y = pd.DataFrame()
+    X_list = []
+    y_list = []
 
     for path in file_list_data['file_list']:
-        features = loadfn(path)
-        X = X.append(features.X)
-        if isinstance(features.y, (int, float)):
-            y = y.append(pd.DataFrame([features.y]))
+        if path.endswith(FEATURE_STORE_SUFFIX):
+            store = FeatureStore(path)
+            _, X_store, y_store = store.load()
+            if y_store is None:
+                raise ValueError('Feature store {} has no targets'.format(path))
+            X_list.append(X_store)
+            y_list.append(y_store)
+            attributes = store.get_attributes()
+            name, predicted_quantity = attributes['name'], attributes['predicted_quantity']
         else:
-            y = y.append(pd.DataFrame(features.y))
+            features = loadfn(path)
+            X_list.append(features.X)
+            if isinstance(features.y, (int, float)):
+                y_list.append(pd.DataFrame([features.y]))
+            else:
+                y_list.append(pd.DataFrame(features.y))
+            name, predicted_quantity = features.name, features.predicted_quantity
+
+    X = pd.concat(X_list)
+    y = pd.concat(y_list)
 
     # Most NaNs should be handled at featurization, but if any crop-up during
     # model fitting, impute missing values with median of that feature.
     X = X.apply(lambda x: x.fillna(x.median()), axis=0)
     y = y.apply(lambda x: x.fillna(x.median()), axis=0)
 
-    return X, y, features.name, features.predicted_quantity
+    return X, y, name, predicted_quantity
 
 
 def add_file_prefix_to_path(path, prefix):
@@ -470,7 +546,8 @@ def get_project_name_from_list(file_list):
 
 def process_file_list_from_json(file_list_json, model_dir="/data-share/models/",
                                 processed_dir='data-share/predictions/',
-                                hyperparameters=None, model_name=None, predict_only=True):
+                                hyperparameters=None, model_name=None, predict_only=True,
+                                fan_out=True, consolidate=False):
     """
     Function to take a json file containing featurized json locations,
     train a new model if necessary, write files containing predictions into a
@@ -487,6 +564,10 @@ def process_file_list_from_json(file_list_json, model_dir="/data-share/models/",
         hyperparameters (dict): dictionary of hyperparameters to optimize/use for training
         model_name (str): name of feature generation method
         predict_only (bool):
+        fan_out (bool): whether to write one prediction file per feature file.
+        consolidate (bool): whether to write the predictions of all files to a
+            single consolidated file, whose location is returned under the
+            key "consolidated_file". Implied if fan_out is False.
 
     Returns:
         str: json string of feature files (with key "feature_file_list").
@@ -557,17 +638,34 @@ def process_file_list_from_json(file_list_json, model_dir="/data-share/models/",
                                        model_name=model_name, hyperparameters=hyperparameters)
         logger.warning('fitting=%s dataset=%s', model.name, str(dataset_id), extra=s)
 
-    for path, run_id in zip(file_list, run_ids):
-        logger.info('model=%s run_id=%s predicting=%s', model.name, str(run_id), path, extra=s)
-        features = loadfn(path)
-        prediction = model.predict(features)
-        prediction_dict = model.prediction_to_dict(prediction, features.nominal_capacity)
-        new_filename = os.path.basename(path)
-        new_filename = scrub_underscore_suffix(new_filename)
-        new_filename = add_suffix_to_filename(new_filename, "_predictions")
-        processed_path = os.path.join(processed_dir, new_filename)
-        processed_path = os.path.abspath(processed_path)
-        dumpfn(prediction_dict, processed_path)
+    # Stack all descriptors and predict in one pass, then fan out per file
+    consolidate = consolidate or not fan_out
+    features_list = [features] + [loadfn(path) for path in file_list[1:]] \
+        if predict_only else [loadfn(path) for path in file_list]
+    logger.info('model=%s predicting=%d files', model.name, len(file_list), extra=s)
+    predictions = model.predict_batch(features_list)
+    prediction_dicts = [model.prediction_to_dict(prediction, features.nominal_capacity)
+                        for prediction, features in zip(predictions, features_list)]
+
+    if consolidate:
+        consolidated_path = os.path.join(
+            processed_dir, '{}_{}_predictions.json'.format(project_name, model.name))
+        consolidated_path = os.path.abspath(consolidated_path)
+        dumpfn({"model_name": model.name,
+                "file_list": file_list,
+                "run_list": run_ids,
+                "predictions": prediction_dicts}, consolidated_path)
+
+    for path, run_id, prediction_dict in zip(file_list, run_ids, prediction_dicts):
+        if fan_out:
+            new_filename = os.path.basename(path)
+            new_filename = scrub_underscore_suffix(new_filename)
+            new_filename = add_suffix_to_filename(new_filename, "_predictions")
+            processed_path = os.path.join(processed_dir, new_filename)
+            processed_path = os.path.abspath(processed_path)
+            dumpfn(prediction_dict, processed_path)
+        else:
+            processed_path = consolidated_path
 
         # Append file loc to list to be returned
         processed_paths_list.append(processed_path)
@@ -581,6 +679,8 @@ def process_file_list_from_json(file_list_json, model_dir="/data-share/models/",
                    "result_list": processed_result_list,
                    "message_list": processed_message_list
                    }
+    if consolidate:
+        output_data["consolidated_file"] = consolidated_path
 
     events.put_analyzing_event(output_data, 'predicting', 'complete')
 
@@ -6,15 +6,28 @@ objects, which parse and structure data, along with utility
 functions for manipulating tabular data.
 
 Usage:
-    structure [INPUT_JSON]
+    structure [INPUT_JSON] [--workers=<n>] [--format=<format>] [--incremental] [--cache=<dir>]
+              [--validate]
 
 Options:
-    -h --help       Show this screen
-    --version       Show version
+    -h --help           Show this screen
+    --version           Show version
+    --workers=<n>       Number of processes to structure files with [default: 1]
+    --format=<format>   Format of structured files, json or hdf5 [default: json]
+    --incremental       Only structure data appended since files were last structured
+    --cache=<dir>       Reuse files structured before from a cache in this directory
+    --validate          Validate files while structuring them instead of using their validity
 
 
 The `structure` script will run the data structuring on specified filenames corresponding
-to validated raw cycler files.  It places the structured datafiles in `/data-share/structure`.
+to validated raw cycler files.  It places the structured datafiles in `/data-share/structure`,
+either as json or, with `--format hdf5`, in the columnar HDF5 format of `ProcessedCyclerRun.save`.
+With `--incremental`, files of runs which are still cycling are structured only from where
+they were last structured on, see `structure_file_incrementally`. With `--cache`, raw files
+which have been structured before with the same structuring parameters and beep version
+are copied from the cache instead of being structured again, see `StructuringCache`.
+With `--validate`, each raw file is parsed once, validated with `SimpleValidator` and
+structured from the same data, and the `validity` field of the input json is not needed.
 
 The input json must contain the following fields:
 * `file_list` - a list of full path filenames which have been processed
@@ -24,6 +37,13 @@ The output json contains the following fields:
 
 * `invalid_file_list` - a list of invalid files according to the validity
 * `file_list` - a list of files which have been structured into processed_cycler_runs
+* `run_list` - the run ids corresponding to `file_list`
+* `result_list` - "success" for each entry of `file_list`
+* `message_list` - comment and error message for each entry of `file_list`
+* `failed_file_list`, `failed_run_list`, `failed_message_list` - raw files which
+  failed to structure, their run ids and error messages
+* `cache_hits`, `cache_misses` - numbers of files found in and missing from the cache
+* `validity` - with `--validate`, the validation result of each input file
 
 Example:
 ```angular2
@@ -39,33 +59,53 @@ $ structure '{"validity": [false, false, true],
 
 import json
 import re
-from datetime import datetime
+import hashlib
+from io import BytesIO
+from datetime import datetime, timedelta
 
 import pandas as pd
 import numpy as np
+from pandas.core.internals import BlockManager, make_block
 import os
 import pytz
-import time
-from scipy import integrate
 import itertools
+import shutil
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-from monty.json import MSONable
+from monty.json import MSONable, MontyEncoder
 from docopt import docopt
 from monty.serialization import loadfn, dumpfn
 from glob import glob
-from beep import tqdm
 
 from beep import StringIO, MODULE_DIR, ENVIRONMENT
-from beep.validate import ValidatorBeep, BeepValidationError
+from beep.validate import ValidatorBeep, BeepValidationError, SimpleValidator, \
+    read_raw_data
 from beep.collate import add_suffix_to_filename
 from beep.conversion_schemas import ARBIN_CONFIG, MACCOR_CONFIG, \
     FastCharge_CONFIG, xTesladiag_CONFIG, INDIGO_CONFIG, BIOLOGIC_CONFIG, \
     STRUCTURE_DTYPES
-from beep.utils import KinesisEvents
+from beep.utils import KinesisEvents, hash_file
 from beep import logger, __version__
 
 s = {'service': 'DataStructurer'}
 
+# Extension of processed cycler run files saved in the columnar format
+STRUCTURE_HDF5_EXTENSION = ".hdf5"
+STRUCTURE_FILE_EXTENSIONS = {"json": ".json", "hdf5": STRUCTURE_HDF5_EXTENSION}
+# Extension replacing that of a processed cycler run file for the checkpoint
+# of its incremental structuring
+STRUCTURE_CHECKPOINT_EXTENSION = ".checkpoint.json"
+# Default size bound of the structuring cache, see StructuringCache
+STRUCTURE_CACHE_MAX_BYTES = 10 * 1024 ** 3
+
+# Number of rows of Arbin data csvs parsed at a time
+ARBIN_CHUNKSIZE = 100000
+# Epoch nanoseconds of missing timestamps, i. e. of NaT
+EPOCH_NAT = np.iinfo(np.int64).min
+# Cumulative quantities computed from the per step Maccor quantities
+MACCOR_QUANTITIES = [('capacity', 'charge'), ('capacity', 'discharge'),
+                     ('energy', 'charge'), ('energy', 'discharge')]
+
 
 class RawCyclerRun(MSONable):
     """
@@ -107,6 +147,29 @@ class RawCyclerRun(MSONable):
         self.metadata = metadata
         self.eis = eis
         self.filename = filename
+        self._segment_index = None
+        self._epoch_ns = None
+
+    @property
+    def epoch_ns(self):
+        """
+        numpy.ndarray: date_time_iso as int64 epoch nanoseconds, computed
+        once for summary and diagnostic processing and recomputed only if
+        the data is replaced.
+        """
+        if self._epoch_ns is None or self._epoch_ns[0] is not self.data:
+            self._epoch_ns = (self.data, datetime_to_epoch_ns(self.data['date_time_iso']))
+        return self._epoch_ns[1]
+
+    @property
+    def segment_index(self):
+        """
+        beep.structure.SegmentIndex: cycle and step row offsets of the data,
+        built on first access and rebuilt only if the data is replaced.
+        """
+        if self._segment_index is None or self._segment_index[0] is not self.data:
+            self._segment_index = (self.data, SegmentIndex(self.data))
+        return self._segment_index[1]
 
     @classmethod
     def from_file(cls, path, validate=False):
@@ -137,7 +200,8 @@ class RawCyclerRun(MSONable):
         else:
             raise ValueError("{} does not match any known file pattern".format(path))
 
-    def get_interpolated_steps(self, v_range, resolution, step_type='discharge', reg_cycles=None, axis='voltage'):
+    def get_interpolated_steps(self, v_range, resolution, step_type='discharge', reg_cycles=None, axis='voltage',
+                               axis_range=None):
         """
         Gets interpolated cycles for the step specified, charge or discharge.
 
@@ -148,54 +212,65 @@ class RawCyclerRun(MSONable):
             step_type (str): which step to interpolate i.e. 'charge' or 'discharge'
             reg_cycles (list): list containing cycle indicies of regular cycles
             axis (str): which column to use for interpolation
+            axis_range ([Float, Float]): interpolation range of a capacity
+                axis, by default the range of the axis over all of the data
 
         Returns:
             pandas.DataFrame: DataFrame corresponding to interpolated values.
         """
-        if step_type is 'discharge':
-            step_filter = determine_whether_step_is_discharging
-        elif step_type is 'charge':
-            step_filter = determine_whether_step_is_charging
+        if step_type == 'discharge':
+            step_direction = 1
+        elif step_type == 'charge':
+            step_direction = -1
         else:
             raise ValueError("{} is not a recognized step type")
         incl_columns = ["voltage", "current", "charge_capacity", "discharge_capacity",
                         "internal_resistance", "temperature"]
-        all_dfs = []
-        cycle_indices = self.data.cycle_index.unique()
-        cycle_indices = [c for c in cycle_indices if c in reg_cycles]
-        cycle_indices.sort()
-        for cycle_index in tqdm(cycle_indices):
-            # Use a cycle_index mask instead of a global groupby to save memoryÍ
-            new_df = self.data.loc[self.data["cycle_index"] == cycle_index].groupby("step_index").filter(step_filter)
-            if new_df.size == 0:
-                continue
-            if axis in ['charge_capacity', 'discharge_capacity']:
+
+        # Classify every cycle/step group at once, equivalent to applying
+        # determine_whether_step_is_(dis)charging to each group
+        group_keys = [self.data["cycle_index"], self.data["step_index"]]
+        capacity = self.data[["charge_capacity", "discharge_capacity"]]
+        mean_diff = capacity.groupby(group_keys).diff().groupby(group_keys).transform('mean')
+        direction = mean_diff["discharge_capacity"] - mean_diff["charge_capacity"]
+        step_mask = (direction * step_direction > 0).values
+        if reg_cycles is not None:
+            step_mask &= self.data["cycle_index"].isin(reg_cycles).values
+
+        # Cycle-ordered rows of the selected steps, so that each cycle forms
+        # a contiguous segment
+        index = self.segment_index
+        in_step = step_mask[index.order]
+        step_data = self.data.iloc[index.order[in_step]]
+        row_cycle = np.repeat(np.arange(len(index.cycles)), np.diff(index.cycle_offsets))
+        cycle_lengths = np.bincount(row_cycle[in_step], minlength=len(index.cycles))
+        cycle_indices = index.cycles[cycle_lengths > 0]
+        offsets = np.concatenate([[0], np.cumsum(cycle_lengths[cycle_lengths > 0])])
+
+        if axis in ['charge_capacity', 'discharge_capacity']:
+            if axis_range is None:
                 axis_range = [self.data[axis].min(), self.data[axis].max()]
-                new_df = get_interpolated_data(new_df, axis, field_range=axis_range,
-                                               columns=incl_columns, resolution=resolution)
-            elif axis == 'test_time':
-                axis_range = [new_df[axis].min(), new_df[axis].max()]
-                new_df = get_interpolated_data(new_df, axis, field_range=axis_range,
-                                               columns=incl_columns, resolution=resolution)
-            elif axis == 'voltage':
-                new_df = get_interpolated_data(new_df, axis, field_range=v_range,
-                                               columns=incl_columns, resolution=resolution)
-            else:
-                raise NotImplementedError
-            new_df['cycle_index'] = cycle_index
-            new_df['step_type'] = step_type
-            new_df['step_type'] = new_df['step_type'].astype('category')
-            all_dfs.append(new_df)
+            axis_ranges = [axis_range] * len(cycle_indices)
+        elif axis == 'test_time':
+            axis_ranges = step_data.groupby("cycle_index", sort=True)[axis].agg(['min', 'max']).values
+        elif axis == 'voltage':
+            axis_ranges = [v_range] * len(cycle_indices)
+        else:
+            raise NotImplementedError
 
-        # Ignore the index to avoid issues with overlapping voltages
-        result = pd.concat(all_dfs, ignore_index=True)
+        result = get_interpolated_segments(step_data, offsets, axis, field_ranges=axis_ranges,
+                                           columns=incl_columns, resolution=resolution,
+                                           keys={"cycle_index": cycle_indices})
+        result['step_type'] = step_type
+        result['step_type'] = result['step_type'].astype('category')
 
         # Cycle_index gets a little weird about typing, so round it here
         result.cycle_index = result.cycle_index.round()
 
         return result
 
-    def get_interpolated_cycles(self, v_range=None, resolution=1000, diagnostic_available=None):
+    def get_interpolated_cycles(self, v_range=None, resolution=1000, diagnostic_available=None,
+                                charge_range=None):
         """
         Gets interpolated cycles for both charge and discharge steps.
 
@@ -205,6 +280,8 @@ class RawCyclerRun(MSONable):
             resolution (int): resolution of interpolated data.
             diagnostic_available (dict): dictionary containing information about
                 location of diagnostic cycles
+            charge_range ([Float, Float]): charge capacity interpolation range
+                of the charge steps, by default that of all of the data
 
         Returns:
             pandas.DataFrame: DataFrame corresponding to interpolated values.
@@ -228,7 +305,8 @@ class RawCyclerRun(MSONable):
                                                           resolution,
                                                           step_type='charge',
                                                           reg_cycles=reg_cycles,
-                                                          axis='charge_capacity')
+                                                          axis='charge_capacity',
+                                                          axis_range=charge_range)
         result = pd.concat([interpolated_discharge, interpolated_charge], ignore_index=True)
         result = result.astype(STRUCTURE_DTYPES['cycles_interpolated'])
 
@@ -243,7 +321,7 @@ class RawCyclerRun(MSONable):
         """
         obj = {"@module": self.__class__.__module__,
                "@class": self.__class__.__name__,
-               "data": self.data.to_dict('list'),
+               "data": dataframe_to_dict(self.data),
                "metadata": self.metadata,
                "eis": self.eis}
         return obj
@@ -259,6 +337,8 @@ class RawCyclerRun(MSONable):
 
         data = pd.DataFrame(d['data'])
         data = data.sort_index()
+        if 'date_time_iso' in data:
+            data['date_time_iso'] = pd.to_datetime(data['date_time_iso'], utc=True)
         return cls(data, d['metadata'], d['eis'])
 
     def get_summary(self, diagnostic_available=None, nominal_capacity=1.1,
@@ -293,22 +373,32 @@ class RawCyclerRun(MSONable):
         else:
             reg_cycles_at = [i for i in self.data.cycle_index.unique()]
 
-        summary = self.data.groupby("cycle_index").agg({
-            "cycle_index": "first",
-            "discharge_capacity": "max",
-            "charge_capacity": "max",
-            "discharge_energy": "max",
-            "charge_energy": "max",
-            "internal_resistance": "last",
-            "temperature": ["max", "mean", "min"],
-            "date_time_iso": "first"})
-
-        summary.columns = ['cycle_index', 'discharge_capacity', 'charge_capacity',
-                           'discharge_energy', 'charge_energy',
-                           'dc_internal_resistance', 'temperature_maximum',
-                           'temperature_average', 'temperature_minimum',
-                           'date_time_iso']
-        summary = summary[summary.index.isin(reg_cycles_at)]
+        # All statistics are segmented reductions over the rows of each
+        # cycle, ordered by cycle by the segment index
+        index = self.segment_index
+        epoch_ns = self.epoch_ns
+        has_time = epoch_ns != EPOCH_NAT
+        temperature = self.data['temperature'].values
+        n_temperatures = index.reduce_cycles(np.add, (~np.isnan(temperature)).astype(np.int64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            temperature_average = index.reduce_cycles(
+                np.add, np.where(np.isnan(temperature), 0, temperature).astype(np.float64)) / n_temperatures
+        cycle_start = index.first_valid(epoch_ns, has_time, EPOCH_NAT)
+
+        summary = pd.DataFrame({
+            'cycle_index': index.cycles,
+            'discharge_capacity': index.reduce_cycles(np.fmax, self.data['discharge_capacity'].values),
+            'charge_capacity': index.reduce_cycles(np.fmax, self.data['charge_capacity'].values),
+            'discharge_energy': index.reduce_cycles(np.fmax, self.data['discharge_energy'].values),
+            'charge_energy': index.reduce_cycles(np.fmax, self.data['charge_energy'].values),
+            'dc_internal_resistance': index.last_valid(self.data['internal_resistance'].values),
+            'temperature_maximum': index.reduce_cycles(np.fmax, temperature),
+            'temperature_average': temperature_average,
+            'temperature_minimum': index.reduce_cycles(np.fmin, temperature),
+            'date_time_iso': pd.to_datetime(cycle_start, utc=True)},
+            index=pd.Index(index.cycles, name='cycle_index'))
+        regular = summary.index.isin(reg_cycles_at)
+        summary = summary[regular]
         summary['energy_efficiency'] = summary['discharge_energy']/summary['charge_energy']
         summary.loc[~np.isfinite(summary['energy_efficiency']), 'energy_efficiency'] = np.NaN
         summary['charge_throughput'] = summary.charge_capacity.cumsum()
@@ -317,39 +407,37 @@ class RawCyclerRun(MSONable):
         # This method for computing charge start and end times implicitly
         # assumes that a cycle starts with a charge step and is then followed
         # by discharge step.
-        charge_start_time = self.data.groupby('cycle_index', as_index=False)['date_time_iso'].agg('first')
-        charge_finish_time = self.data[self.data.charge_capacity >= nominal_capacity*full_fast_charge].\
-            groupby('cycle_index', as_index=False)['date_time_iso'].agg('first')
-
-        # Left merge, since some cells might not reach desired levels of
-        # charge_capacity and will have NaN for charge duration
-        merged = charge_start_time.merge(charge_finish_time, on='cycle_index', how='left')
-
-        # Charge duration stored in seconds - note that date_time_iso is only ~1sec resolution
-        time_diff = np.subtract(pd.to_datetime(merged.date_time_iso_y, utc=True, errors='coerce'),
-                                pd.to_datetime(merged.date_time_iso_x, errors='coerce'))
-        summary["charge_duration"] = np.round(time_diff/np.timedelta64(1, 's'), 2)
-
-        # Compute time since start of cycle in minutes. This comes handy
-        # for featurizing time-temperature integral
-        self.data['time_since_cycle_start'] = pd.to_datetime(self.data['date_time_iso']) - \
-            pd.to_datetime(self.data.groupby('cycle_index')['date_time_iso'].transform('first'))
-        self.data['time_since_cycle_start'] = (self.data['time_since_cycle_start'] / np.timedelta64(1, 's'))/60
-
-        # Group by cycle index and integrate time-temperature
-        # using a lambda function.
-        summary['time_temperature_integrated'] = \
-            self.data.groupby('cycle_index').apply(lambda g: integrate.trapz(g.temperature, x=g.time_since_cycle_start))
-
-        # Drop the time since cycle start column
-        self.data.drop(columns=['time_since_cycle_start'])
+        charged = self.data.charge_capacity.values >= nominal_capacity*full_fast_charge
+        charge_finish = index.first_valid(epoch_ns, has_time & charged, EPOCH_NAT)
+
+        # Charge duration stored in seconds, NaN for cycles which do not
+        # reach the desired levels of charge_capacity
+        charge_duration = np.where((cycle_start != EPOCH_NAT) & (charge_finish != EPOCH_NAT),
+                                   (charge_finish - cycle_start) / 1e9, np.nan)
+        summary['charge_duration'] = np.round(charge_duration[regular], 2)
+
+        # Integrate temperature over the time since the start of the cycle
+        # in minutes by the trapezoidal rule, summing the trapezoids of
+        # consecutive rows within each cycle
+        cycle_lengths = np.diff(index.cycle_offsets)
+        start_ns = np.repeat(cycle_start, cycle_lengths)
+        ordered_ns = epoch_ns[index.order]
+        minutes = np.where((ordered_ns != EPOCH_NAT) & (start_ns != EPOCH_NAT),
+                           ((ordered_ns - start_ns) / 1e9) / 60, np.nan)
+        ordered_temperature = temperature[index.order]
+        trapezoids = np.zeros(len(minutes))
+        trapezoids[1:] = np.diff(minutes) * (ordered_temperature[1:] + ordered_temperature[:-1]) / 2.0
+        trapezoids[index.cycle_offsets[:-1]] = 0
+        time_temperature_integrated = np.add.reduceat(trapezoids, index.cycle_offsets[:-1])
+        summary['time_temperature_integrated'] = time_temperature_integrated[regular]
 
         # Determine if any of the cycles has been paused
-        summary['paused'] = self.data.groupby("cycle_index").apply(determine_paused)
+        paused = determine_paused_cycles(epoch_ns, self.data['cycle_index'], segment_index=index)
+        summary['paused'] = paused.values[regular]
 
         summary = summary.astype(STRUCTURE_DTYPES['summary'])
 
-        last_voltage = self.data.loc[self.data['cycle_index'] == self.data['cycle_index'].max()]['voltage']
+        last_voltage = self.data['voltage'].iloc[index.cycle_rows(index.cycles[-1])]
         if ((last_voltage.min() < cycle_complete_vmin) and (last_voltage.max() > cycle_complete_vmax) and
             ((summary.iloc[[-1]])['discharge_capacity'].iloc[0] > cycle_complete_discharge_ratio
              * (summary.iloc[[-1]])['charge_capacity'].iloc[0])):
@@ -396,7 +484,7 @@ class RawCyclerRun(MSONable):
 
         diag_summary['coulombic_efficiency'] = diag_summary['discharge_capacity'] \
                                                / diag_summary['charge_capacity']
-        diag_summary['paused'] = self.data.groupby("cycle_index").apply(determine_paused)
+        diag_summary['paused'] = determine_paused_cycles(self.epoch_ns, self.data['cycle_index'])
 
         diag_summary.reset_index(drop=True, inplace=True)
 
@@ -442,70 +530,63 @@ class RawCyclerRun(MSONable):
                      "{}, are unequal lengths".format(diag_cycles_at, diag_cycle_type)
             raise ValueError(errmsg)
 
-        diag_data = self.data[self.data['cycle_index'].isin(diag_cycles_at)]
+        cycle_types = dict(reversed(list(zip(diag_cycles_at, diag_cycle_type))))
+
+        # Each contiguous run of a step_index within a diagnostic cycle is
+        # interpolated separately, in (cycle_index, step_index, step_index_counter)
+        # order; step_type is the order of first appearance of the step in its cycle
+        index = self.segment_index
+        steps = index.steps[index.steps.cycle_index.isin(diag_cycles_at)]
+        steps = steps[steps.step_index.notnull()]
+        first_steps = steps.loc[~steps.duplicated(['cycle_index', 'step_index']),
+                                ['cycle_index', 'step_index']]
+        first_steps['step_type'] = first_steps.groupby('cycle_index').cumcount()
+        steps = steps.merge(first_steps, on=['cycle_index', 'step_index'], how='left')
+        steps = steps.sort_values(['cycle_index', 'step_index', 'step_index_counter'])
+        steps['cycle_type'] = steps.cycle_index.map(cycle_types)
 
-        # Convert date_time_iso field into pd.datetime object
-        diag_data.loc[:, 'date_time_iso'] = pd.to_datetime(diag_data['date_time_iso'])
-
-        # Convert datetime into seconds to allow interpolation of time
-        diag_data.loc[:, 'datetime_seconds'] = [time.mktime(t.timetuple())
-                                                if t is not pd.NaT else float('nan')
-                                                for t in diag_data['date_time_iso']]
-
-        # Counter to ensure non-contiguous repeats of step_index
-        # within same cycle_index are grouped separately
-        diag_data.loc[:, 'step_index_counter'] = 0
-
-        for cycle_index in diag_cycles_at:
-            indices = diag_data.loc[diag_data.cycle_index == cycle_index].index
-            step_index_list = diag_data.step_index.loc[indices]
-            diag_data.loc[indices, 'step_index_counter'] = \
-                step_index_list.ne(step_index_list.shift()).cumsum()
-
-        group = diag_data.groupby(["cycle_index", "step_index", "step_index_counter"])
         incl_columns = ["current", "charge_capacity", "discharge_capacity",
                         "charge_energy", "discharge_energy", "internal_resistance",
                         "temperature", "datetime_seconds", "test_time"]
+        rows = index.order[segment_positions(steps.start.values, steps.stop.values)]
+        data_columns = ["voltage"] + [c for c in incl_columns if c != "datetime_seconds"]
+        diag_data = self.data[data_columns].iloc[rows].copy()
+
+        # Convert datetime into seconds to allow interpolation of time
+        diag_data['datetime_seconds'] = epoch_ns_to_seconds(self.epoch_ns[rows])
+        offsets = np.concatenate([[0], np.cumsum(steps.stop.values - steps.start.values)])
+
+        # HPPC steps are interpolated over their own voltage range
+        is_hppc = (steps.cycle_type == 'hppc').values
+        field_ranges = np.tile(np.asarray(v_range, dtype=np.float64), (len(steps), 1))
+        resolutions = np.full(len(steps), resolution, dtype=np.int64)
+        if is_hppc.any():
+            voltage = diag_data.voltage.values
+            v_min = np.fmin.reduceat(voltage, offsets[:-1])[is_hppc]
+            v_max = np.fmax.reduceat(voltage, offsets[:-1])[is_hppc]
+            field_ranges[is_hppc] = np.stack([v_min, v_max], axis=1)
+            resolutions[is_hppc] = ((v_max - v_min).astype(np.float64) / v_resolution).astype(np.int64)
+
+        result = get_interpolated_segments(
+            diag_data, offsets, field_name="voltage", field_ranges=field_ranges,
+            columns=incl_columns, resolution=resolutions,
+            keys={column: steps[column].values for column in
+                  ['cycle_index', 'cycle_type', 'step_index', 'step_index_counter', 'step_type']})
+
+        # Convert interpolated time in seconds back to datetime
+        result.insert(result.columns.get_loc('datetime_seconds'), 'date_time_iso',
+                      seconds_to_datetime(result['datetime_seconds']))
+        result = result.drop(columns='datetime_seconds')
+
+        # dQdV within each interpolated step, undefined at the first point of a step
+        step_start = np.ones(len(result), dtype=bool)
+        step_start[1:] = (result.cycle_index.values[1:] != result.cycle_index.values[:-1]) | \
+                         (result.step_index.values[1:] != result.step_index.values[:-1]) | \
+                         (result.step_index_counter.values[1:] != result.step_index_counter.values[:-1])
+        voltage_diff = result.voltage.diff().mask(step_start)
+        result['discharge_dQdV'] = result.discharge_capacity.diff().mask(step_start) / voltage_diff
+        result['charge_dQdV'] = result.charge_capacity.diff().mask(step_start) / voltage_diff
 
-        diag_dict = {}
-        for cycle in diag_data.cycle_index.unique():
-            diag_dict.update({cycle: None})
-            steps = diag_data[diag_data.cycle_index == cycle].step_index.unique()
-            diag_dict[cycle] = list(steps)
-
-        all_dfs = []
-        for (cycle_index, step_index, step_index_counter), df in tqdm(group):
-            if diag_cycle_type[diag_cycles_at.index(cycle_index)] == 'hppc':
-                v_hppc_step = [df.voltage.min(), df.voltage.max()]
-                hppc_resolution = int((df.voltage.max() - df.voltage.min()) / v_resolution)
-                new_df = get_interpolated_data(df, field_name="voltage", field_range=v_hppc_step,
-                                               columns=incl_columns, resolution=hppc_resolution)
-            else:
-                new_df = get_interpolated_data(df, field_name="voltage", field_range=v_range,
-                                               columns=incl_columns, resolution=resolution)
-
-            #Convert interpolated time in seconds back to datetime
-            new_df['date_time_iso'] = [datetime.utcfromtimestamp(t).isoformat()
-                                       if ~np.isnan(t) else t for t in new_df['datetime_seconds']]
-            new_df = new_df.drop(columns='datetime_seconds')
-
-            new_df['cycle_index'] = cycle_index
-            new_df['cycle_type'] = diag_cycle_type[diag_cycles_at.index(cycle_index)]
-            new_df['step_index'] = step_index
-            new_df['step_index_counter'] = step_index_counter
-            new_df['step_type'] = diag_dict[cycle_index].index(step_index)
-            new_df.astype({'cycle_index': 'int32',
-                           'cycle_type': 'category',
-                           'step_index': 'uint8',
-                           'step_index_counter': 'int16',
-                           'step_type': 'uint8'
-                           })
-            new_df['discharge_dQdV'] = new_df.discharge_capacity.diff() / new_df.voltage.diff()
-            new_df['charge_dQdV'] = new_df.charge_capacity.diff() / new_df.voltage.diff()
-            all_dfs.append(new_df)
-
-        # Ignore the index to avoid issues with overlapping voltages
-        result = pd.concat(all_dfs, ignore_index=True)
         # Cycle_index gets a little weird about typing, so round it here
         result.cycle_index = result.cycle_index.round()
 
@@ -525,27 +606,31 @@ class RawCyclerRun(MSONable):
         Returns:
             beep.structure.RawCyclerRun
         """
-        metadata_path = path.replace(".csv", "_Metadata.csv")
-        data = pd.read_csv(path)
-        data.rename(str.lower, axis='columns', inplace=True)
+        metadata = read_arbin_metadata(path)
+        data = read_arbin_data(path)
+        return cls(data, metadata, None, validate, filename=path)
 
-        for column, dtype in ARBIN_CONFIG['data_types'].items():
-            if column in data:
-                if not data[column].isnull().values.any():
-                    data[column] = data[column].astype(dtype)
+    @classmethod
+    def from_raw_data(cls, path, data):
+        """
+        Creates RawCyclerRun from the data of an Arbin csv or Maccor file
+        that has already been parsed, e. g. for validation, so that the
+        file is not parsed again. Maccor EIS files are not included.
 
-        data.rename(ARBIN_CONFIG['data_columns'], axis='columns', inplace=True)
-        metadata = pd.read_csv(metadata_path)
-        metadata.rename(str.lower, axis='columns', inplace=True)
-        metadata.rename(ARBIN_CONFIG['metadata_fields'], axis='columns', inplace=True)
-        # Note the to_dict, which scrubs numpy typing
-        metadata = {col: item[0] for col, item
-                    in metadata.to_dict('list').items()}
+        Args:
+            path (str): file path to the data file.
+            data (pandas.DataFrame): data with the columns of the file,
+                see beep.validate.read_raw_data.
 
-        # standardizing time format
-        data['date_time_iso'] = data['date_time'].apply(
-            lambda x: datetime.utcfromtimestamp(x).replace(tzinfo=pytz.UTC).isoformat())
-        return cls(data, metadata, None, validate, filename=path)
+        Returns:
+            beep.structure.RawCyclerRun
+        """
+        if re.match(ARBIN_CONFIG['file_pattern'], path):
+            return cls(format_arbin_data(data), read_arbin_metadata(path), None, filename=path)
+        elif re.match(MACCOR_CONFIG['file_pattern'], path):
+            return cls(format_maccor_data(data), read_maccor_metadata(path), None, filename=path)
+        else:
+            raise ValueError("{} is not an Arbin or Maccor file".format(path))
 
     @classmethod
     def from_indigo_file(cls, path, validate=False):
@@ -583,12 +668,11 @@ class RawCyclerRun(MSONable):
         data.loc[data.half_cycle_count % 2 == 0, 'discharge_energy'] = abs(data.cell_energy_j)
         data.loc[data.half_cycle_count % 2 == 1, 'discharge_energy'] = 0
         data['internal_resistance'] = data.cell_voltage_v / data.cell_current_a
-        data['date_time_iso'] = data['system_time_us']\
-            .apply(lambda x: datetime.utcfromtimestamp(x/1000000).replace(tzinfo=pytz.UTC).isoformat())
+        data['date_time_iso'] = pd.to_datetime(data['system_time_us'], unit='us', utc=True)
 
         data.rename(INDIGO_CONFIG['data_columns'], axis='columns', inplace=True)
 
-        metadata['start_datetime'] = data.sort_values(by='system_time_us')['date_time_iso'].iloc[0]
+        metadata['start_datetime'] = data['date_time_iso'].min().isoformat()
 
         return cls(data, metadata, None, validate, filename=path)
 
@@ -673,29 +757,56 @@ class RawCyclerRun(MSONable):
         Returns:
             Series: summed quantities.
         """
-        state_code = MACCOR_CONFIG["{}_state_code".format(state_type)]
-        quantity_agg = data['_' + quantity].where(data['_state'] == state_code, other=0.0, axis=0)
-        end_step = data['_ending_status'].apply(lambda x: MACCOR_CONFIG['end_step_code_min'] <= x
-                                                          <= MACCOR_CONFIG['end_step_code_max'])
-        end_step_inds = end_step.index[end_step]
+        sums = RawCyclerRun.get_maccor_quantity_sums(data, [(quantity, state_type)])
+        return sums.iloc[:, 0]
 
-        if end_step_inds.size == 0:
+    @staticmethod
+    def get_maccor_quantity_sums(data, quantities=MACCOR_QUANTITIES):
+        """
+        Computes several non-decreasing capacities or energies at once, see
+        get_maccor_quantity_sum. Rows are split into segments ending at each
+        step end, and each segment is offset by the summed quantities at the
+        ends of the preceding segments of the same cycle.
+
+        Args:
+            data (pd.DataFrame): maccor data.
+            quantities (list): (quantity, state_type) pairs, e. g.
+                ('capacity', 'charge').
+
+        Returns:
+            pd.DataFrame: summed quantities, in columns named
+                state_type + '_' + quantity.
+        """
+        quantity_agg = pd.DataFrame({
+            "{}_{}".format(state_type, quantity): data['_' + quantity].where(
+                data['_state'] == MACCOR_CONFIG["{}_state_code".format(state_type)], other=0.0, axis=0)
+            for quantity, state_type in quantities})
+        ending_status = np.asarray(data['_ending_status'], dtype=np.float64)
+        end_step = (MACCOR_CONFIG['end_step_code_min'] <= ending_status) & \
+                   (ending_status <= MACCOR_CONFIG['end_step_code_max'])
+        if not end_step.any():
             return quantity_agg
 
-        lastindex = quantity_agg.size - 1
-        for i, istep in enumerate(end_step_inds):
-            if i > 0:
-                quantity_agg[istep_old+1:istep+1] += cycle_sum
-            if istep == lastindex:
-                cycle_sum = 0.
-            elif data.loc[istep+1, 'cycle_index'] != data.loc[istep, 'cycle_index']:
-                cycle_sum = 0.
-            else:
-                cycle_sum = quantity_agg[istep]
-            istep_old = istep
-        if end_step_inds[-1] < lastindex:
-            quantity_agg[istep_old+1:] += cycle_sum
-        return quantity_agg
+        # Sums carry over a step end unless it is the last row or ends the cycle
+        cycle_index = data['cycle_index'].values
+        reset = np.append(cycle_index[1:] != cycle_index[:-1], True)[end_step]
+        group = np.append(0, np.cumsum(reset)[:-1])
+        rank = np.arange(group.size) - np.searchsorted(group, group)
+
+        # Running sums of the step ends within each group, accumulated one
+        # rank at a time across all groups so that additions happen in the
+        # same order as a sequential sum
+        offsets = quantity_agg.values[end_step]
+        by_rank = np.argsort(rank, kind='stable')
+        rank_bounds = np.searchsorted(rank[by_rank], np.arange(1, rank.max() + 2))
+        for start, stop in zip(rank_bounds[:-1], rank_bounds[1:]):
+            ends = by_rank[start:stop]
+            offsets[ends] += offsets[ends - 1]
+        offsets[reset] = 0
+        offsets = np.concatenate([np.zeros((1, offsets.shape[1]), dtype=offsets.dtype), offsets])
+
+        segment = np.append(0, np.cumsum(end_step)[:-1])
+        return quantity_agg + offsets[segment]
 
     @classmethod
     def from_maccor_file(cls, filename, include_eis=True, validate=False):
@@ -708,32 +819,8 @@ class RawCyclerRun(MSONable):
                 in the ingestion procedure.
             validate (bool): whether to validate on instantiation.
         """
-        with open(filename) as f:
-            metadata_line = f.readline().strip()
-
-        # Parse data
-        data = pd.read_csv(filename, delimiter="\t", skiprows=1)
-        data.rename(str.lower, axis='columns', inplace=True)
-        data = data.astype(MACCOR_CONFIG['data_types'])
-        data.rename(MACCOR_CONFIG['data_columns'], axis='columns', inplace=True)
-        data['charge_capacity'] = cls.get_maccor_quantity_sum(data, 'capacity', 'charge')
-        data['discharge_capacity'] = cls.get_maccor_quantity_sum(data, 'capacity', 'discharge')
-        data['charge_energy'] = cls.get_maccor_quantity_sum(data, 'energy', 'charge')
-        data['discharge_energy'] = cls.get_maccor_quantity_sum(data, 'energy', 'discharge')
-
-        if 'temperature' not in data.columns:
-            data['temperature'] = np.NaN
-
-        # Parse metadata - kinda hackish way to do it, but it works
-        metadata = parse_maccor_metadata(metadata_line)
-        metadata = pd.DataFrame(metadata)
-        _, channel_number = os.path.splitext(filename)
-        metadata['channel_id'] = int(channel_number.replace('.', ''))
-        metadata.rename(str.lower, axis='columns', inplace=True)
-        metadata.rename(MACCOR_CONFIG['metadata_fields'], axis='columns', inplace=True)
-        # Note the to_dict, which scrubs numpy typing
-        metadata = {col: item[0] for col, item
-                    in metadata.to_dict('list').items()}
+        data = read_maccor_data(filename)
+        metadata = read_maccor_metadata(filename)
 
         # Check for EIS files
         if include_eis:
@@ -743,9 +830,6 @@ class RawCyclerRun(MSONable):
         else:
             eis = None
 
-        # standardizing time format
-        data['date_time_iso'] = data['date_time'].apply(maccor_timestamp)
-
         return cls(data, metadata, eis, validate, filename=filename)
 
     def determine_structuring_parameters(self, v_range=None, resolution=1000,
@@ -770,30 +854,8 @@ class RawCyclerRun(MSONable):
                 finding and using the diagnostic cycles
 
         """
-        run_parameter, all_parameters = get_protocol_parameters(self.filename, parameters_path)
-        # Logic for interpolation variables and diagnostic cycles
-        diagnostic_available = False
-        if run_parameter is not None:
-            if {'capacity_nominal'}.issubset(run_parameter.columns.tolist()):
-                nominal_capacity = run_parameter['capacity_nominal'].iloc[0]
-            if {'discharge_cutoff_voltage', 'charge_cutoff_voltage'}.issubset(run_parameter.columns):
-                v_range = [all_parameters['discharge_cutoff_voltage'].min(),
-                           all_parameters['charge_cutoff_voltage'].max()]
-            if {'diagnostic_type', 'diagnostic_start_cycle', 'diagnostic_interval'}.issubset(run_parameter.columns):
-                if run_parameter['diagnostic_type'].iloc[0] == 'HPPC+RPT':
-                    hppc_rpt = ['reset', 'hppc', 'rpt_0.2C', 'rpt_1C', 'rpt_2C']
-                    hppc_rpt_len = 5
-                    diagnostic_starts_at = [1, 1 + run_parameter['diagnostic_start_cycle'].iloc[0] + 1 * hppc_rpt_len]
-                    for i in range(1, 100):
-                        diag_cycle_num = (i * (run_parameter['diagnostic_interval'].iloc[0] + hppc_rpt_len) +
-                                          1 + run_parameter['diagnostic_start_cycle'].iloc[0] + 1 * hppc_rpt_len)
-                        diagnostic_starts_at.append(diag_cycle_num)
-                    diagnostic_available = {"parameter_set": run_parameter['diagnostic_parameter_set'].iloc[0],
-                                            "cycle_type": hppc_rpt,
-                                            "length": hppc_rpt_len,
-                                            "diagnostic_starts_at": diagnostic_starts_at}
-
-        return v_range, resolution, nominal_capacity, full_fast_charge, diagnostic_available
+        return get_structuring_parameters(self.filename, v_range, resolution, nominal_capacity,
+                                          full_fast_charge, parameters_path)
 
     def to_processed_cycler_run(self):
         """
@@ -881,7 +943,23 @@ class ProcessedCyclerRun(MSONable):
         self.protocol = protocol
         self.channel_id = channel_id
         self.summary = summary
+        self.v_interpolated = self.get_v_interpolated(cycles_interpolated)
+        self.cycles_interpolated = cycles_interpolated
+        self.diagnostic_summary = diagnostic_summary
+        self.diagnostic_interpolated = diagnostic_interpolated
 
+    @staticmethod
+    def get_v_interpolated(cycles_interpolated):
+        """
+        Voltage grid of the first interpolated discharge cycle.
+
+        Args:
+            cycles_interpolated (pandas.DataFrame): interpolated data for
+                regular cycles.
+
+        Returns:
+            numpy.ndarray: interpolated voltages.
+        """
         # We can drop this restriction later if we don't need it
         min_index = cycles_interpolated.cycle_index.min()
         if 'step_type' in cycles_interpolated.columns:
@@ -889,16 +967,12 @@ class ProcessedCyclerRun(MSONable):
                                                (cycles_interpolated.step_type == 'discharge')]
         else:
             min_index_df = cycles_interpolated[(cycles_interpolated.cycle_index == min_index)]
-        self.v_interpolated = min_index_df.voltage.values
-
-        self.cycles_interpolated = cycles_interpolated
-        self.diagnostic_summary = diagnostic_summary
-        self.diagnostic_interpolated = diagnostic_interpolated
+        return min_index_df.voltage.values
 
     @classmethod
     def from_raw_cycler_run(cls, raw_cycler_run, v_range=None, resolution=1000,
                             diagnostic_resolution=500, nominal_capacity=1.1,
-                            full_fast_charge=0.8, diagnostic_available=False):
+                            full_fast_charge=0.8, diagnostic_available=False, charge_range=None):
         """
         Method to invoke ProcessedCyclerRun from RawCyclerRun object
 
@@ -913,6 +987,8 @@ class ProcessedCyclerRun(MSONable):
             full_fast_charge (float): full fast charge for summary stats.
             diagnostic_available (dict): project metadata for processing
                 diagnostic cycles correctly.
+            charge_range ([float, float]): charge capacity range for charge
+                step interpolation, by default that of the raw data.
         """
         if diagnostic_available:
             diagnostic_summary = raw_cycler_run.get_diagnostic_summary(
@@ -924,7 +1000,8 @@ class ProcessedCyclerRun(MSONable):
             diagnostic_interpolated = None
 
         cycles_interpolated = raw_cycler_run.get_interpolated_cycles(
-            v_range=v_range, resolution=resolution, diagnostic_available=diagnostic_available)
+            v_range=v_range, resolution=resolution, diagnostic_available=diagnostic_available,
+            charge_range=charge_range)
         return cls(raw_cycler_run.metadata.get("barcode"),
                    raw_cycler_run.metadata.get("protocol"),
                    raw_cycler_run.metadata.get("channel_id"),
@@ -936,6 +1013,43 @@ class ProcessedCyclerRun(MSONable):
                    diagnostic_summary,
                    diagnostic_interpolated)
 
+    def extend(self, processed_cycler_run, first_cycle):
+        """
+        Extends the processed run in place with the processed run of data
+        appended to the same raw run, replacing all cycles from first_cycle
+        on. Cumulative summary quantities are recomputed over the extended
+        summary.
+
+        Args:
+            processed_cycler_run (beep.structure.ProcessedCyclerRun): processed
+                run of the raw data from first_cycle on.
+            first_cycle (int): first cycle_index to replace.
+        """
+        summary = pd.concat([self.summary[self.summary.cycle_index < first_cycle],
+                             processed_cycler_run.summary])
+        summary.index = pd.Index(summary.cycle_index.values, name='cycle_index')
+        summary['charge_throughput'] = summary.charge_capacity.cumsum()
+        summary['energy_throughput'] = summary.charge_energy.cumsum()
+        self.summary = summary.astype(STRUCTURE_DTYPES['summary'])
+
+        # Discharge steps precede charge steps, as in get_interpolated_cycles
+        cycles_interpolated = pd.concat(
+            [self.cycles_interpolated[self.cycles_interpolated.cycle_index < first_cycle],
+             processed_cycler_run.cycles_interpolated], ignore_index=True)
+        order = np.argsort((cycles_interpolated.step_type == 'charge').values, kind='stable')
+        cycles_interpolated = cycles_interpolated.iloc[order].reset_index(drop=True)
+        self.cycles_interpolated = cycles_interpolated.astype(STRUCTURE_DTYPES['cycles_interpolated'])
+        self.v_interpolated = self.get_v_interpolated(self.cycles_interpolated)
+
+        for table in ['diagnostic_summary', 'diagnostic_interpolated']:
+            existing = getattr(self, table)
+            extension = getattr(processed_cycler_run, table)
+            if existing is not None and not existing.empty:
+                existing = existing[existing.cycle_index < first_cycle]
+                extension = pd.concat([existing, extension], ignore_index=True)
+            if extension is not None:
+                setattr(self, table, extension.astype(STRUCTURE_DTYPES[table]))
+
     @classmethod
     def auto_load(cls, filename, validate=False):
         """
@@ -1054,12 +1168,13 @@ class ProcessedCyclerRun(MSONable):
                 "barcode": self.barcode,
                 "protocol": self.protocol,
                 "channel_id": self.channel_id,
-                "summary": self.summary.to_dict("list"),
-                "cycles_interpolated": self.cycles_interpolated.to_dict("list"),
+                "summary": dataframe_to_dict(self.summary),
+                "cycles_interpolated": dataframe_to_dict(self.cycles_interpolated),
                 "diagnostic_summary":
-                    self.diagnostic_summary.to_dict("list") if self.diagnostic_summary is not None else None,
+                    dataframe_to_dict(self.diagnostic_summary) if self.diagnostic_summary is not None else None,
                 "diagnostic_interpolated":
-                    self.diagnostic_interpolated.to_dict("list") if self.diagnostic_interpolated is not None else None
+                    dataframe_to_dict(self.diagnostic_interpolated) if self.diagnostic_interpolated is not None
+                    else None
                 }
 
     @classmethod
@@ -1086,6 +1201,80 @@ class ProcessedCyclerRun(MSONable):
         return cls(**d)
 
     METADATA_ATTRIBUTE_ORDER = ['barcode', 'protocol', 'channel_id']
+    TABLE_ORDER = ['summary', 'cycles_interpolated', 'diagnostic_summary', 'diagnostic_interpolated']
+
+    def save(self, filename):
+        """
+        Save ProcessedCyclerRun to a single file. Files ending in .hdf5 are
+        written in the columnar HDF5 format (one compressed table per
+        DataFrame, with barcode, protocol and channel_id as file metadata),
+        which preserves column dtypes and supports reading a subset of
+        columns; any other filename is serialized to json.
+
+        Args:
+            filename (str): filename to save to.
+        """
+        if not filename.endswith(STRUCTURE_HDF5_EXTENSION):
+            dumpfn(self, filename)
+            return
+
+        metadata = {attribute: getattr(self, attribute)
+                    for attribute in self.METADATA_ATTRIBUTE_ORDER}
+        # Empty tables can't be stored as HDF5 tables, so only their dtypes are kept
+        empty_tables = {}
+        with pd.HDFStore(filename, mode='w', complib='blosc', complevel=5) as store:
+            for table in self.TABLE_ORDER:
+                df = getattr(self, table)
+                if df is None:
+                    continue
+                elif df.empty:
+                    empty_tables[table] = df.dtypes.astype(str).to_dict()
+                else:
+                    store.put(table, df, format='table')
+            store.root._v_attrs.beep_metadata = json.dumps(metadata, cls=MontyEncoder)
+            store.root._v_attrs.beep_empty_tables = json.dumps(empty_tables)
+            store.root._v_attrs.beep_version = __version__
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load ProcessedCyclerRun from a file written by save, i. e. the
+        columnar HDF5 format for .hdf5 files and json otherwise.
+
+        Args:
+            filename (str): filename to load.
+
+        Returns:
+            beep.structure.ProcessedCyclerRun: loaded processed cycler run.
+        """
+        if not filename.endswith(STRUCTURE_HDF5_EXTENSION):
+            return loadfn(filename)
+
+        with pd.HDFStore(filename, mode='r') as store:
+            metadata = json.loads(store.root._v_attrs.beep_metadata)
+            tables = {table: cls.read_hdf5_table(store, table) for table in cls.TABLE_ORDER}
+        return cls(**metadata, **tables)
+
+    @staticmethod
+    def read_hdf5_table(store, table, columns=None):
+        """
+        Read a table from an open store written by save.
+
+        Args:
+            store (pandas.HDFStore): store to read from.
+            table (str): name of the table, one of TABLE_ORDER.
+            columns (list): columns to read, all if None.
+
+        Returns:
+            pandas.DataFrame: table data, empty if the table was not stored.
+        """
+        if "/" + table in store.keys():
+            return store.select(table, columns=columns)
+        dtypes = json.loads(store.root._v_attrs.beep_empty_tables).get(table, {})
+        if columns is not None:
+            dtypes = {column: dtypes[column] for column in columns if column in dtypes}
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+
     SUMMARY_COLUMN_ORDER = ['discharge_capacity', 'charge_capacity', 'dc_internal_resistance', 'temperature_maximum',
                             'temperature_average', 'temperature_minimum', "charge_duration"]
     CYCLES_INTERPOLATED_COLUMN_ORDER = ['cycle_index', 'voltage', 'current', 'internal_resistance',
@@ -1135,6 +1324,362 @@ class ProcessedCyclerRun(MSONable):
                    **meta_kwargs)
 
 
+class LazyProcessedCyclerRun(ProcessedCyclerRun):
+    """
+    ProcessedCyclerRun backed by a file written with ProcessedCyclerRun.save,
+    which reads each table from the file on first access only and, given
+    columns, only the listed columns of that table. Featurization uses it
+    so that tables a featurizer never looks at, e. g. diagnostic_interpolated
+    for DeltaQFastCharge, are never materialized.
+
+    Json files cannot be read in part, so they are loaded whole on first
+    access and their tables projected onto the listed columns.
+
+    Attributes:
+        filename (str): processed cycler run file.
+        columns (dict): table name to the list of columns to load, tables
+            that are missing or map to None are loaded with all columns.
+    """
+    LAZY_ATTRIBUTES = ProcessedCyclerRun.METADATA_ATTRIBUTE_ORDER + \
+        ProcessedCyclerRun.TABLE_ORDER + ['v_interpolated']
+
+    def __init__(self, filename, columns=None):
+        """
+        Args:
+            filename (str): processed cycler run file, .hdf5 or json.
+            columns (dict): table name to the list of columns to load.
+        """
+        self.filename = filename
+        self.columns = columns or {}
+
+    def __getattr__(self, name):
+        # Only called for attributes which have not been loaded yet
+        if name not in self.LAZY_ATTRIBUTES:
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                self.__class__.__name__, name))
+        if not self.filename.endswith(STRUCTURE_HDF5_EXTENSION):
+            self.load_json()
+        elif name in self.METADATA_ATTRIBUTE_ORDER:
+            with pd.HDFStore(self.filename, mode='r') as store:
+                metadata = json.loads(store.root._v_attrs.beep_metadata)
+            self.__dict__.update(metadata)
+        elif name == 'v_interpolated':
+            self.v_interpolated = self.get_v_interpolated(self.cycles_interpolated)
+        else:
+            setattr(self, name, self.load_table(name))
+        return self.__dict__[name]
+
+    def load_table(self, table):
+        """
+        Read a single table of the columnar file, restricted to its
+        listed columns.
+
+        Args:
+            table (str): name of the table, one of TABLE_ORDER.
+
+        Returns:
+            pandas.DataFrame: table data, empty if the table was not stored.
+        """
+        with pd.HDFStore(self.filename, mode='r') as store:
+            return self.read_hdf5_table(store, table, self.columns.get(table))
+
+    def load_json(self):
+        """
+        Load all attributes from a json processed cycler run file.
+        """
+        processed_cycler_run = loadfn(self.filename)
+        for attribute in self.METADATA_ATTRIBUTE_ORDER:
+            setattr(self, attribute, getattr(processed_cycler_run, attribute))
+        self.v_interpolated = processed_cycler_run.v_interpolated
+        for table in self.TABLE_ORDER:
+            df = getattr(processed_cycler_run, table)
+            table_columns = self.columns.get(table)
+            if df is not None and table_columns is not None:
+                df = df[[column for column in table_columns if column in df.columns]]
+            setattr(self, table, df)
+
+    def as_dict(self):
+        """
+        Method for dictionary serialization, which loads any table not yet
+        read and serializes it as a ProcessedCyclerRun.
+
+        Returns:
+            dict: corresponding to dictionary for serialization.
+        """
+        d = super().as_dict()
+        d["@class"] = ProcessedCyclerRun.__name__
+        return d
+
+
+class SegmentIndex(object):
+    """
+    Row offsets of the cycle and step segments of cycler run data, built in
+    a single pass so that data can be sliced by position rather than by
+    repeated boolean masks over the whole frame.
+
+    Rows are ordered stably by cycle_index, so rows within a cycle keep
+    their original order; for data already sorted by cycle the ordering is
+    the identity. Rows without a cycle_index are excluded.
+
+    Attributes:
+        n_rows (int): number of rows in the indexed data.
+        order (numpy.ndarray): positional indices of the rows ordered by cycle.
+        cycles (numpy.ndarray): unique cycle_index values in ascending order.
+        cycle_offsets (numpy.ndarray): offsets into order delimiting each
+            cycle, i. e. cycle i spans order[cycle_offsets[i]:cycle_offsets[i + 1]].
+        steps (pandas.DataFrame): one row per contiguous run of step_index
+            within a cycle, with the cycle_index, step_index, step_index_counter
+            (1-based count of runs within the cycle) and the start and stop
+            offsets of the run into order. None if data has no step_index.
+    """
+    def __init__(self, data):
+        """
+        Args:
+            data (pandas.DataFrame): cycler data with a cycle_index column and
+                optionally a step_index column.
+        """
+        self.n_rows = len(data)
+        cycle_index = data['cycle_index'].to_numpy()
+        order = np.flatnonzero(~pd.isnull(cycle_index))
+        if np.any(np.diff(cycle_index[order]) < 0):
+            order = order[np.argsort(cycle_index[order], kind='mergesort')]
+        sorted_cycles = cycle_index[order]
+        new_cycle = np.ones(len(order), dtype=bool)
+        new_cycle[1:] = sorted_cycles[1:] != sorted_cycles[:-1]
+        cycle_starts = np.flatnonzero(new_cycle)
+
+        self.order = order
+        self.cycles = sorted_cycles[cycle_starts]
+        self.cycle_offsets = np.append(cycle_starts, len(order))
+
+        if 'step_index' in data:
+            step_index = data['step_index'].to_numpy()[order]
+            new_step = new_cycle.copy()
+            new_step[1:] |= step_index[1:] != step_index[:-1]
+            step_starts = np.flatnonzero(new_step)
+            step_cycle = np.cumsum(new_cycle)[step_starts] - 1
+            first_step_of_cycle = np.searchsorted(step_starts, cycle_starts)
+            self.steps = pd.DataFrame({
+                "cycle_index": self.cycles[step_cycle],
+                "step_index": step_index[step_starts],
+                "step_index_counter": np.arange(len(step_starts)) - first_step_of_cycle[step_cycle] + 1,
+                "start": step_starts,
+                "stop": np.append(step_starts[1:], len(order))})
+        else:
+            self.steps = None
+
+    def cycle_rows(self, cycles):
+        """
+        Positional indices of the rows belonging to one or more cycles.
+
+        Args:
+            cycles (int or list): cycle_index value or values to select.
+
+        Returns:
+            numpy.ndarray: positional row indices, ordered by cycle.
+        """
+        positions = np.searchsorted(self.cycles, np.unique(np.atleast_1d(cycles)))
+        positions = positions[positions < len(self.cycles)]
+        positions = positions[np.isin(self.cycles[positions], cycles)]
+        return self.order[segment_positions(self.cycle_offsets[positions],
+                                            self.cycle_offsets[positions + 1])]
+
+    def step_index_counter(self):
+        """
+        Counter of contiguous step_index runs within each cycle for every row,
+        distinguishing non-contiguous repeats of the same step_index.
+
+        Returns:
+            numpy.ndarray: 1-based counter in data row order, 0 for rows
+                without a cycle_index.
+        """
+        counter = np.zeros(self.n_rows, dtype=np.int64)
+        counter[self.order] = np.repeat(self.steps.step_index_counter.values,
+                                        self.steps.stop.values - self.steps.start.values)
+        return counter
+
+    def reduce_cycles(self, ufunc, values):
+        """
+        Reduces values over the rows of each cycle in one pass.
+
+        Args:
+            ufunc (numpy.ufunc): binary ufunc to reduce with, e. g. numpy.fmax
+                for a maximum ignoring NaN or numpy.add for a sum.
+            values (numpy.ndarray): values in data row order.
+
+        Returns:
+            numpy.ndarray: reduced value for each of cycles.
+        """
+        return ufunc.reduceat(np.asarray(values)[self.order], self.cycle_offsets[:-1])
+
+    def first_valid(self, values, valid=None, fill=np.nan):
+        """
+        First valid value of each cycle, as groupby first.
+
+        Args:
+            values (numpy.ndarray): values in data row order.
+            valid (numpy.ndarray): boolean mask of the rows to consider, by
+                default the rows where values are not null.
+            fill: value for cycles without valid rows.
+
+        Returns:
+            numpy.ndarray: first valid value for each of cycles.
+        """
+        return self._take_valid(np.minimum, values, valid, fill)
+
+    def last_valid(self, values, valid=None, fill=np.nan):
+        """
+        Last valid value of each cycle, as groupby last.
+
+        Args:
+            values (numpy.ndarray): values in data row order.
+            valid (numpy.ndarray): boolean mask of the rows to consider, by
+                default the rows where values are not null.
+            fill: value for cycles without valid rows.
+
+        Returns:
+            numpy.ndarray: last valid value for each of cycles.
+        """
+        return self._take_valid(np.maximum, values, valid, fill)
+
+    def _take_valid(self, ufunc, values, valid, fill):
+        # Reduce positions of the valid rows within the ordered rows, with a
+        # sentinel beyond either end for rows which are not valid
+        values = np.asarray(values)
+        if valid is None:
+            valid = ~pd.isnull(values)
+        n_ordered = len(self.order)
+        missing = n_ordered if ufunc is np.minimum else -1
+        positions = np.where(np.asarray(valid)[self.order], np.arange(n_ordered), missing)
+        positions = ufunc.reduceat(positions, self.cycle_offsets[:-1])
+        found = positions != missing
+        rows = self.order[np.where(found, positions, 0)]
+        return np.where(found, values[rows], fill)
+
+
+class StructuringCache(object):
+    """
+    Content-addressed cache of processed cycler run files, so that raw
+    files which have been structured before are not structured again.
+    Entries are keyed on the hash and name of the raw file, its structuring
+    parameters (see get_structuring_parameters), whether it was validated
+    and the beep version, and are stored as files named by that key in the cache directory. Once the
+    entries exceed max_bytes, the least recently used are removed.
+
+    Attributes:
+        cache_dir (str): directory of the cache entries.
+        max_bytes (int): size bound of the cache entries in bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=STRUCTURE_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir (str): directory of the cache entries, created if
+                it doesn't exist.
+            max_bytes (int): size bound of the cache entries in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(filename, parameters_path='data-share/raw/parameters', validate=False):
+        """
+        Cache key of a raw cycler run file.
+
+        Args:
+            filename (str): path to the raw cycler run file.
+            parameters_path (str): path to parameters file.
+            validate (bool): whether the file is validated before it is
+                structured, so that validated structuring is only served
+                from entries of files which passed validation.
+
+        Returns:
+            str: hex digest identifying the file and its structuring.
+        """
+        parameters = get_structuring_parameters(filename, parameters_path=parameters_path)
+        key = json.dumps([hash_file(filename, algorithm='blake2b').hex(), os.path.basename(filename),
+                          parameters, validate, __version__], cls=MontyEncoder)
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def entry_path(self, key, extension):
+        """
+        Args:
+            key (str): cache key, see key.
+            extension (str): extension of the processed cycler run file.
+
+        Returns:
+            str: path of the cache entry.
+        """
+        return os.path.join(self.cache_dir, key + extension)
+
+    def get(self, key, processed_cycler_run_loc):
+        """
+        Copy the cache entry of a key to a processed cycler run location.
+
+        Args:
+            key (str): cache key, see key.
+            processed_cycler_run_loc (str): path to copy the entry to, whose
+                extension selects the entry format.
+
+        Returns:
+            bool: whether there was an entry to copy.
+        """
+        entry = self.entry_path(key, os.path.splitext(processed_cycler_run_loc)[1])
+        try:
+            # Marks the entry as recently used for eviction
+            os.utime(entry)
+            shutil.copyfile(entry, processed_cycler_run_loc)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key, processed_cycler_run_loc):
+        """
+        Store a processed cycler run file as the cache entry of a key and
+        evict the least recently used entries beyond max_bytes.
+
+        Args:
+            key (str): cache key, see key.
+            processed_cycler_run_loc (str): processed cycler run file.
+        """
+        entry = self.entry_path(key, os.path.splitext(processed_cycler_run_loc)[1])
+        # Copied under a temporary name first so that concurrent workers
+        # never read a partially written entry
+        partial_entry = "{}.{}.partial".format(entry, os.getpid())
+        shutil.copyfile(processed_cycler_run_loc, partial_entry)
+        os.replace(partial_entry, entry)
+        self.evict(keep=entry)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the entries fit
+        into max_bytes.
+
+        Args:
+            keep (str): path of an entry never to remove.
+        """
+        entries = []
+        for entry in glob(os.path.join(self.cache_dir, "*")):
+            if entry.endswith(".partial"):
+                continue
+            try:
+                stat = os.stat(entry)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            try:
+                os.remove(entry)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+
 class EISpectrum(MSONable):
     """
     Class describing an Electrochemical Impedance Spectrum
@@ -1265,38 +1810,192 @@ def get_interpolated_data(dataframe, field_name='voltage', field_range=None,
     Returns:
         pandas.DataFrame: DataFrame of interpolated values
     """
-    columns = columns or dataframe.columns
-    columns = list(set(columns) | {field_name})
-
-    df = dataframe.loc[:, columns]
-    field_range = field_range or [df[field_name].iloc[0], df[field_name].iloc[-1]]
-    # If interpolating on datetime, change column to datetime series and
-    # use date_range to create interpolating vector
+    offsets = [0, len(dataframe)]
+    # If interpolating on datetime, interpolate on the epoch nanoseconds
+    # over the full span of the data and convert back afterwards
     if field_name == 'date_time_iso':
-        df['date_time_iso'] = pd.to_datetime(df['date_time_iso'])
-        interp_x = pd.date_range(
-            start=df[field_name].iloc[0], end=df[field_name].iloc[-1], periods=resolution)
-    else:
-        interp_x = np.linspace(*field_range, resolution)
-    interpolated_df = pd.DataFrame({field_name: interp_x, "interpolated": True})
-
-    df['interpolated'] = False
-
-    # Merge interpolated and uninterpolated DFs to use pandas interpolation
-    interpolated_df = interpolated_df.merge(df, how='outer', on=field_name, sort=True)
-    interpolated_df = interpolated_df.set_index(field_name)
-    interpolated_df = interpolated_df.interpolate('slinear')
-
-    # Filter for only interpolated values
-    interpolated_df[['interpolated_x']] = interpolated_df[['interpolated_x']].fillna(False)
-    interpolated_df = interpolated_df[interpolated_df['interpolated_x']]
-    interpolated_df = interpolated_df.drop(["interpolated_x", "interpolated_y"], axis=1)
-    interpolated_df = interpolated_df.reset_index()
-    # Remove duplicates
-    interpolated_df = interpolated_df[~interpolated_df[field_name].duplicated()]
+        df = dataframe.copy()
+        date_time = pd.to_datetime(df[field_name], utc=True)
+        df[field_name] = date_time.values.astype(np.int64)
+        field_range = [df[field_name].iloc[0], df[field_name].iloc[-1]]
+        interpolated_df = get_interpolated_segments(df, offsets, field_name, [field_range],
+                                                    columns=columns, resolution=resolution)
+        interpolated_df[field_name] = pd.to_datetime(interpolated_df[field_name], utc=True)
+        return interpolated_df
+
+    field_range = field_range or [dataframe[field_name].iloc[0], dataframe[field_name].iloc[-1]]
+    return get_interpolated_segments(dataframe, offsets, field_name, [field_range],
+                                     columns=columns, resolution=resolution)
+
+
+def get_interpolated_segments(dataframe, offsets, field_name='voltage', field_ranges=None,
+                              columns=None, resolution=1000, keys=None):
+    """
+    Interpolates many contiguous segments of a dataframe (e. g. the rows of
+    each cycle) onto uniform grids of the specified field in a single
+    batched operation. Equivalent to calling get_interpolated_data on each
+    segment separately and concatenating the results.
+
+    Args:
+        dataframe (pandas.DataFrame): dataframe containing the segments
+        offsets (list): row offsets delimiting the segments, i. e. segment
+            i spans rows offsets[i] to offsets[i + 1]
+        field_name (str): column name to use as the dependent interpolation variable
+        field_ranges (list): list of [start, end] endpoints for each segment,
+            if None, range is the min/max of each segment's field_name values
+        columns (list): list of column names to provide interpolated values for,
+            default value of None indicates all columns should be interpolated
+        resolution (int or list): number of data points to sample in each
+            segment, either the same for all segments or one per segment
+        keys (dict): optional mapping of column names to arrays of one value
+            per segment, which are added as columns of the output (e. g. cycle_index)
+
+    Returns:
+        pandas.DataFrame: DataFrame of interpolated values, sorted by field_name
+            within each segment
+    """
+    columns = columns if columns is not None else dataframe.columns
+    columns = [field_name] + [column for column in pd.unique(pd.Index(columns))
+                              if column != field_name]
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_segments = len(offsets) - 1
+    segment = np.repeat(np.arange(n_segments), np.diff(offsets))
+
+    # Sort each segment by the field, dropping rows without a field value
+    x = dataframe[field_name].to_numpy(dtype=np.float64)
+    order = np.lexsort((x, segment))
+    order = order[~np.isnan(x[order])]
+    x, segment = x[order], segment[order]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(segment, minlength=n_segments))])
+
+    # Uniform grid for each segment, sorted and deduplicated
+    if field_ranges is None:
+        field_ranges = [[x[start:stop].min(), x[start:stop].max()] if stop > start else [np.nan, np.nan]
+                        for start, stop in zip(offsets[:-1], offsets[1:])]
+    field_ranges = np.asarray(field_ranges, dtype=np.float64).reshape(n_segments, 2)
+    grid, grid_segment = linspace_segments(field_ranges[:, 0], field_ranges[:, 1], resolution)
+    grid_order = np.lexsort((grid, grid_segment))
+    grid, grid_segment = grid[grid_order], grid_segment[grid_order]
+    unique = np.ones(len(grid), dtype=bool)
+    unique[1:] = (grid[1:] != grid[:-1]) | (grid_segment[1:] != grid_segment[:-1])
+    x_interp = grid[unique]
+    interp_offsets = np.concatenate([[0], np.cumsum(np.bincount(grid_segment[unique], minlength=n_segments))])
+
+    interpolated = {field_name: x_interp}
+    values = dataframe[columns[1:]].to_numpy(dtype=np.float64)[order]
+    complete = ~np.isnan(values).any(axis=0)
+    if complete.any():
+        result = interpolate_segments(x, values[:, complete], offsets, x_interp, interp_offsets)
+        interpolated.update(zip(np.array(columns[1:])[complete], result.T))
+    # Columns with missing values are interpolated over their valid rows only
+    for n_column in np.flatnonzero(~complete):
+        valid = ~np.isnan(values[:, n_column])
+        column_offsets = np.concatenate([[0], np.cumsum(np.bincount(segment[valid], minlength=n_segments))])
+        interpolated[columns[n_column + 1]] = interpolate_segments(
+            x[valid], values[valid, n_column], column_offsets, x_interp, interp_offsets)
+
+    interpolated_df = pd.DataFrame({column: interpolated[column] for column in columns})
+    for key, key_values in (keys or {}).items():
+        interpolated_df[key] = np.repeat(np.asarray(key_values), np.diff(interp_offsets))
     return interpolated_df
 
 
+def linspace_segments(starts, stops, num):
+    """
+    Evenly spaced points for many ranges at once, with the same values
+    np.linspace gives for each range separately.
+
+    Args:
+        starts (numpy.ndarray): start of each range.
+        stops (numpy.ndarray): end (inclusive) of each range.
+        num (int or numpy.ndarray): number of points, for all or for each range.
+
+    Returns:
+        numpy.ndarray: concatenated points of all ranges.
+        numpy.ndarray: index of the range each point belongs to.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    stops = np.asarray(stops, dtype=np.float64)
+    num = np.broadcast_to(np.asarray(num, dtype=np.int64), starts.shape)
+    segment = np.repeat(np.arange(len(starts)), num)
+    range_offsets = np.cumsum(num) - num
+    position = np.arange(num.sum()) - np.repeat(range_offsets, num)
+    step = (stops - starts) / np.maximum(num - 1, 1)
+    points = position * step[segment] + starts[segment]
+    has_end = num > 1
+    points[(range_offsets + num - 1)[has_end]] = stops[has_end]
+    return points, segment
+
+
+def segment_positions(starts, stops):
+    """
+    Concatenated ranges from each start to the corresponding stop, i. e. a
+    vectorized np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)]).
+
+    Args:
+        starts (numpy.ndarray): start of each range.
+        stops (numpy.ndarray): end (exclusive) of each range.
+
+    Returns:
+        numpy.ndarray: concatenated positions.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(stops, dtype=np.int64) - starts
+    range_offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - range_offsets, lengths) + np.arange(lengths.sum())
+
+
+def interpolate_segments(x, y, offsets, x_interp, interp_offsets):
+    """
+    Linear interpolation of many independent segments in one vectorized
+    pass, i. e. a grouped numpy.interp. Points outside the range of their
+    segment are NaN rather than clamped to the endpoint values.
+
+    Args:
+        x (numpy.ndarray): field values, sorted within each segment
+        y (numpy.ndarray): 1-d or 2-d (rows x columns) values to interpolate
+        offsets (numpy.ndarray): row offsets delimiting the segments of x and y
+        x_interp (numpy.ndarray): points to interpolate at, grouped by segment
+        interp_offsets (numpy.ndarray): offsets delimiting the segments of x_interp
+
+    Returns:
+        numpy.ndarray: interpolated values with the same number of columns as y
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x_interp = np.asarray(x_interp, dtype=np.float64)
+    values = y[:, np.newaxis] if y.ndim == 1 else y
+    offsets = np.asarray(offsets, dtype=np.int64)
+    interp_offsets = np.asarray(interp_offsets, dtype=np.int64)
+    segment = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    interp_segment = np.repeat(np.arange(len(interp_offsets) - 1), np.diff(interp_offsets))
+    result = np.full((len(x_interp), values.shape[1]), np.nan)
+    if len(x) == 0:
+        return result[:, 0] if y.ndim == 1 else result
+
+    # Sort raw and interpolation points of all segments together, with
+    # interpolation points ahead of equal raw points, so that the number of
+    # raw points preceding each interpolation point gives its upper bracket
+    is_raw = np.concatenate([np.ones(len(x), dtype=bool), np.zeros(len(x_interp), dtype=bool)])
+    order = np.lexsort((is_raw, np.concatenate([x, x_interp]),
+                        np.concatenate([segment, interp_segment])))
+    merged_raw = is_raw[order]
+    upper = np.empty(len(x_interp), dtype=np.int64)
+    upper[order[~merged_raw] - len(x)] = np.cumsum(merged_raw)[~merged_raw]
+    lower = upper - 1
+
+    # Points coinciding with a raw point take its (first) value directly
+    below_end = upper < offsets[interp_segment + 1]
+    exact = below_end & (x[np.minimum(upper, len(x) - 1)] == x_interp)
+    inside = below_end & ~exact & (lower >= offsets[interp_segment])
+
+    lo, hi = lower[inside], upper[inside]
+    weight = ((x_interp[inside] - x[lo]) / (x[hi] - x[lo]))[:, np.newaxis]
+    result[inside] = values[lo] + weight * (values[hi] - values[lo])
+    result[exact] = values[upper[exact]]
+    return result[:, 0] if y.ndim == 1 else result
+
+
 def diagnostic_function(df, column):
     """
 
@@ -1336,6 +2035,225 @@ def parse_maccor_metadata(metadata_string):
     return metadata
 
 
+def read_arbin_metadata(path):
+    """
+    Reads the metadata of an Arbin data csv from its metadata csv.
+
+    Args:
+        path (str): file path to the Arbin data csv.
+
+    Returns:
+        dict: metadata.
+    """
+    metadata_path = path.replace(".csv", "_Metadata.csv")
+    metadata = pd.read_csv(metadata_path)
+    metadata.rename(str.lower, axis='columns', inplace=True)
+    metadata.rename(ARBIN_CONFIG['metadata_fields'], axis='columns', inplace=True)
+    # Note the to_dict, which scrubs numpy typing
+    return {col: item[0] for col, item in metadata.to_dict('list').items()}
+
+
+def read_maccor_metadata(filename):
+    """
+    Reads the metadata of a Maccor file from its first line and the
+    channel number from its extension.
+
+    Args:
+        filename (str): file path for maccor format file.
+
+    Returns:
+        dict: metadata.
+    """
+    with open(filename) as f:
+        metadata_line = f.readline().strip()
+
+    # Parse metadata - kinda hackish way to do it, but it works
+    metadata = parse_maccor_metadata(metadata_line)
+    metadata = pd.DataFrame(metadata)
+    _, channel_number = os.path.splitext(filename)
+    metadata['channel_id'] = int(channel_number.replace('.', ''))
+    metadata.rename(str.lower, axis='columns', inplace=True)
+    metadata.rename(MACCOR_CONFIG['metadata_fields'], axis='columns', inplace=True)
+    # Note the to_dict, which scrubs numpy typing
+    return {col: item[0] for col, item in metadata.to_dict('list').items()}
+
+
+def read_maccor_data(filepath_or_buffer, skiprows=1):
+    """
+    Reads the data of a Maccor file into a DataFrame with the standard
+    column names, cumulative capacities and energies, and UTC timestamps.
+
+    Args:
+        filepath_or_buffer (str or file-like): Maccor file, or a buffer
+            holding its column header line followed by data lines.
+        skiprows (int): number of lines before the column header line,
+            i. e. 1 for the metadata line of a Maccor file.
+
+    Returns:
+        pandas.DataFrame: Maccor data.
+    """
+    data = pd.read_csv(filepath_or_buffer, delimiter="\t", skiprows=skiprows)
+    return format_maccor_data(data)
+
+
+def format_maccor_data(data):
+    """
+    Converts the columns of a parsed Maccor file into the standard column
+    names and types, cumulative capacities and energies, and UTC timestamps.
+
+    Args:
+        data (pandas.DataFrame): data with the columns of the Maccor file,
+            which is left unchanged.
+
+    Returns:
+        pandas.DataFrame: Maccor data.
+    """
+    data = data.rename(str.lower, axis='columns')
+    data = data.astype(MACCOR_CONFIG['data_types'])
+    data.rename(MACCOR_CONFIG['data_columns'], axis='columns', inplace=True)
+    quantity_sums = RawCyclerRun.get_maccor_quantity_sums(data)
+    for column in quantity_sums:
+        data[column] = quantity_sums[column]
+
+    if 'temperature' not in data.columns:
+        data['temperature'] = np.NaN
+
+    # standardizing time format
+    data['date_time_iso'] = maccor_timestamps(data['date_time'])
+    return data
+
+
+def read_arbin_data(path, chunksize=ARBIN_CHUNKSIZE, usecols=None):
+    """
+    Streams an Arbin data csv into a DataFrame chunksize rows at a time.
+
+    A first pass parses only the integer and unconfigured columns, to count
+    the rows and settle the type of each column: the ARBIN_CONFIG data type,
+    float64 for integer columns with missing values, and the parsed type
+    for unconfigured columns. A single 2-D block is then preallocated per
+    type, as pandas stores a DataFrame, and the second pass parses the csv
+    with float types applied by the parser, casts the integer columns and
+    generates date_time_iso per chunk, and copies each chunk into the
+    blocks. The DataFrame is built around the blocks without copying them.
+
+    Peak memory is therefore the returned DataFrame, i. e. the number of
+    rows times the summed itemsize of its columns (e. g. 78 bytes for the
+    standard Arbin columns and date_time_iso), plus the parsing of a single
+    chunk, which takes up to about three times the memory of the chunk in
+    the default types of the parser.
+
+    Args:
+        path (str): file path to the Arbin data csv.
+        chunksize (int): number of rows parsed at a time.
+        usecols (list): csv columns to read, by default all but those which
+            ARBIN_CONFIG maps to private names, e. g. dV/dt.
+
+    Returns:
+        pandas.DataFrame: data with beep column names and date_time_iso.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    if usecols is None:
+        usecols = [column for column, name in zip(header, get_arbin_column_types(header)[0])
+                   if not name.startswith('_')]
+    header = [column for column in header if column in usecols]
+    names, dtypes = get_arbin_column_types(header)
+
+    # Rows, and types which depend on the values
+    scanned = [column for column, dtype in zip(header, dtypes)
+               if dtype is None or np.dtype(dtype).kind in 'iu']
+    n_rows = 0
+    missing = set()
+    scanned_dtypes = {}
+    for chunk in pd.read_csv(path, usecols=scanned or header[:1], chunksize=chunksize):
+        n_rows += len(chunk)
+        missing.update(chunk.columns[chunk.isnull().values.any(axis=0)])
+        for column in chunk.columns:
+            scanned_dtypes[column] = np.result_type(scanned_dtypes.get(column, chunk[column].dtype),
+                                                    chunk[column].dtype)
+        del chunk
+    dtypes = [np.dtype(np.float64) if column in missing and dtype is not None
+              else np.dtype(dtype) if dtype is not None else scanned_dtypes[column]
+              for column, dtype in zip(header, dtypes)]
+    # Float types can hold missing values, so they are applied by the parser
+    parse_dtypes = {column: dtype for column, dtype in zip(header, dtypes) if dtype.kind == 'f'}
+
+    # One block per type, of shape (columns, rows), and the position of
+    # each column within its block
+    block_columns = {}
+    for position, dtype in enumerate(dtypes):
+        block_columns.setdefault(dtype, []).append(position)
+    blocks = {dtype: np.empty((len(positions), n_rows), dtype=dtype)
+              for dtype, positions in block_columns.items()}
+    block_rows = [(blocks[dtype], block_columns[dtype].index(position))
+                  for position, dtype in enumerate(dtypes)]
+    date_time_iso = np.empty(n_rows, dtype='datetime64[ns]')
+    date_time = names.index('date_time')
+
+    # Chunks are released as soon as they are copied, so that only one is
+    # held while the next is parsed. Parsing is limited to the rows of the
+    # first pass, in case the file is growing
+    start = 0
+    for chunk in pd.read_csv(path, usecols=header, dtype=parse_dtypes, chunksize=chunksize, nrows=n_rows):
+        stop = start + len(chunk)
+        for column, (block, row) in zip(header, block_rows):
+            block[row, start:stop] = chunk[column].values
+        # standardizing time format
+        block, row = block_rows[date_time]
+        date_time_iso[start:stop] = pd.to_datetime(block[row, start:stop], unit='s')
+        start = stop
+        del chunk
+
+    manager_blocks = [make_block(block[:, :start], placement=block_columns[dtype])
+                      for dtype, block in blocks.items()]
+    date_time_iso = pd.arrays.DatetimeArray(date_time_iso[:start], dtype=pd.DatetimeTZDtype(tz='UTC'))
+    manager_blocks.append(make_block(date_time_iso, placement=[len(names)], ndim=2))
+    manager = BlockManager(manager_blocks, [pd.Index(names + ['date_time_iso']), pd.RangeIndex(start)])
+    return pd.DataFrame(manager)
+
+
+def get_arbin_column_types(header):
+    """
+    Args:
+        header (list): column names of an Arbin data csv.
+
+    Returns:
+        list: beep name of each column.
+        list: ARBIN_CONFIG data type of each column, None if not configured.
+    """
+    names = [ARBIN_CONFIG['data_columns'].get(column.lower(), column.lower())
+             for column in header]
+    dtypes = [ARBIN_CONFIG['data_types'].get(column.lower()) for column in header]
+    return names, dtypes
+
+
+def format_arbin_data(data):
+    """
+    Converts the columns of a parsed Arbin data csv into the beep column
+    names and types and adds date_time_iso, as read_arbin_data does while
+    streaming the file. Integer columns with missing values are stored as
+    float64, and columns which ARBIN_CONFIG maps to private names are left
+    out.
+
+    Args:
+        data (pandas.DataFrame): data with the columns of the Arbin csv,
+            which is left unchanged.
+
+    Returns:
+        pandas.DataFrame: data with beep column names and date_time_iso.
+    """
+    columns = {}
+    for column, name, dtype in zip(data.columns, *get_arbin_column_types(data.columns)):
+        if name.startswith('_'):
+            continue
+        values = data[column].values
+        if dtype is not None and np.dtype(dtype).kind in 'iu' and pd.isnull(values).any():
+            # Missing values in an integer column
+            dtype = np.float64
+        columns[name] = values.astype(dtype, copy=False) if dtype is not None else values
+    columns['date_time_iso'] = pd.to_datetime(columns['date_time'], unit='s', utc=True)
+    return pd.DataFrame(columns)
+
+
 def get_project_sequence(path):
     """
     Returns project sequence for a given path
@@ -1352,6 +2270,57 @@ def get_project_sequence(path):
     return file_parts
 
 
+def get_structuring_parameters(filename, v_range=None, resolution=1000,
+                               nominal_capacity=1.1, full_fast_charge=0.8,
+                               parameters_path='data-share/raw/parameters'):
+    """
+    Determines what values to use to convert a raw run into a processed run
+    from the protocol parameters of its project, see
+    RawCyclerRun.determine_structuring_parameters.
+
+    Args:
+        filename (str): path to the raw cycler run file.
+        v_range ([float, float]): voltage range for interpolation
+        resolution (int): resolution for interpolation
+        nominal_capacity (float): nominal capacity for summary stats
+        full_fast_charge (float): full fast charge for summary stats
+        parameters_path (str): path to parameters file
+
+    Returns:
+        v_range ([float, float]): voltage range for interpolation
+        resolution (int): resolution for interpolation
+        nominal_capacity (float): nominal capacity for summary stats
+        full_fast_charge (float): full fast charge for summary stats
+        diagnostic_available (dict): dictionary of values to use for
+            finding and using the diagnostic cycles
+
+    """
+    run_parameter, all_parameters = get_protocol_parameters(filename, parameters_path)
+    # Logic for interpolation variables and diagnostic cycles
+    diagnostic_available = False
+    if run_parameter is not None:
+        if {'capacity_nominal'}.issubset(run_parameter.columns.tolist()):
+            nominal_capacity = run_parameter['capacity_nominal'].iloc[0]
+        if {'discharge_cutoff_voltage', 'charge_cutoff_voltage'}.issubset(run_parameter.columns):
+            v_range = [all_parameters['discharge_cutoff_voltage'].min(),
+                       all_parameters['charge_cutoff_voltage'].max()]
+        if {'diagnostic_type', 'diagnostic_start_cycle', 'diagnostic_interval'}.issubset(run_parameter.columns):
+            if run_parameter['diagnostic_type'].iloc[0] == 'HPPC+RPT':
+                hppc_rpt = ['reset', 'hppc', 'rpt_0.2C', 'rpt_1C', 'rpt_2C']
+                hppc_rpt_len = 5
+                diagnostic_starts_at = [1, 1 + run_parameter['diagnostic_start_cycle'].iloc[0] + 1 * hppc_rpt_len]
+                for i in range(1, 100):
+                    diag_cycle_num = (i * (run_parameter['diagnostic_interval'].iloc[0] + hppc_rpt_len) +
+                                      1 + run_parameter['diagnostic_start_cycle'].iloc[0] + 1 * hppc_rpt_len)
+                    diagnostic_starts_at.append(diag_cycle_num)
+                diagnostic_available = {"parameter_set": run_parameter['diagnostic_parameter_set'].iloc[0],
+                                        "cycle_type": hppc_rpt,
+                                        "length": hppc_rpt_len,
+                                        "diagnostic_starts_at": diagnostic_starts_at}
+
+    return v_range, resolution, nominal_capacity, full_fast_charge, diagnostic_available
+
+
 def get_protocol_parameters(filepath, parameters_path='data-share/raw/parameters'):
     """
     Helper function to get the project parameters for a file given the filename
@@ -1474,14 +2443,40 @@ def determine_paused(group, paused_threshold=3600):
         bool: is there a pause in this cycle?
 
     """
-    date_time_obj = pd.to_datetime(group['date_time_iso'])
-    date_time_float = [time.mktime(t.timetuple())
-                       if t is not pd.NaT else float('nan')
-                       for t in date_time_obj]
-    date_time_float = pd.Series(date_time_float)
+    date_time_float = pd.Series(epoch_ns_to_seconds(datetime_to_epoch_ns(group['date_time_iso'])))
     return int(date_time_float.diff().max() > paused_threshold)
 
 
+def determine_paused_cycles(epoch_ns, cycle_index, paused_threshold=3600, segment_index=None):
+    """
+    Determines for all cycles at once whether each has been paused, i. e.
+    has a gap between consecutive timestamps longer than paused_threshold,
+    see determine_paused.
+
+    Args:
+        epoch_ns (numpy.ndarray): int64 epoch nanoseconds of each row.
+        cycle_index (pandas.Series): cycle index of each row.
+        paused_threshold (int): gap in seconds to classify as a pause.
+        segment_index (beep.structure.SegmentIndex): segment index of the
+            rows, built from cycle_index if not given.
+
+    Returns:
+        pandas.Series: 1 for paused and 0 for other cycles, indexed by
+            cycle index.
+    """
+    if segment_index is None:
+        segment_index = SegmentIndex(pd.DataFrame({'cycle_index': cycle_index}))
+    seconds = epoch_ns_to_seconds(np.asarray(epoch_ns)[segment_index.order])
+    gaps = np.empty(len(seconds))
+    gaps[1:] = np.diff(seconds)
+    gaps[segment_index.cycle_offsets[:-1]] = np.nan
+    # Cycles without any gap, i. e. all NaN, are not paused
+    with np.errstate(invalid='ignore'):
+        paused = np.fmax.reduceat(gaps, segment_index.cycle_offsets[:-1]) > paused_threshold
+    return pd.Series(paused.astype(int),
+                     index=pd.Index(segment_index.cycles, name=cycle_index.name))
+
+
 def maccor_timestamp(x):
     """
     Helper function with exception handling for cases where the
@@ -1508,7 +2503,471 @@ def maccor_timestamp(x):
     return iso
 
 
-def process_file_list_from_json(file_list_json, processed_dir='data-share/structure/'):
+def maccor_timestamps(date_time):
+    """
+    Vectorized maccor_timestamp, converts a column of maccor datetime strings
+    in US/Pacific time to UTC datetimes. Rows mis-printed without a time
+    are read as midnight, ambiguous times at the end of daylight savings
+    are read as daylight time and non-existent times at its start are read
+    as standard time, as with maccor_timestamp.
+
+    Args:
+        date_time (pandas.Series): datetime strings for maccor in format
+            '%m/%d/%Y %H:%M:%S'.
+
+    Returns:
+        pandas.Series: datetime64[ns, UTC] timestamps.
+    """
+    timestamps = pd.to_datetime(date_time, format='%m/%d/%Y %H:%M:%S', errors='coerce')
+    misprinted = timestamps.isnull() & date_time.notnull()
+    if misprinted.any():
+        timestamps[misprinted] = pd.to_datetime(date_time[misprinted], format='%m/%d/%Y')
+    timestamps = timestamps.dt.tz_localize('US/Pacific', ambiguous=np.ones(len(timestamps), dtype=bool),
+                                           nonexistent=timedelta(hours=-1))
+    return timestamps.dt.tz_convert('UTC')
+
+
+def datetime_to_epoch_ns(date_time):
+    """
+    Converts datetimes to nanoseconds since the epoch.
+
+    Args:
+        date_time (pandas.Series): datetimes, or strings parseable as such.
+
+    Returns:
+        numpy.ndarray: int64 nanoseconds, EPOCH_NAT for missing datetimes.
+    """
+    return pd.to_datetime(date_time, utc=True).values.view(np.int64)
+
+
+def epoch_ns_to_seconds(epoch_ns):
+    """
+    Converts nanoseconds since the epoch to seconds.
+
+    Args:
+        epoch_ns (numpy.ndarray): int64 nanoseconds, EPOCH_NAT for missing
+            datetimes.
+
+    Returns:
+        numpy.ndarray: seconds as floats, NaN for missing datetimes.
+    """
+    seconds = epoch_ns / 1e9
+    seconds[epoch_ns == EPOCH_NAT] = np.nan
+    return seconds
+
+
+def seconds_to_datetime(seconds):
+    """
+    Converts seconds since the epoch to datetimes.
+
+    Args:
+        seconds (pandas.Series): seconds as floats, NaN for missing values.
+
+    Returns:
+        pandas.Series: datetime64[ns, UTC] datetimes, NaT for missing values.
+    """
+    # NaN are cast to NaT, which numpy warns about
+    with np.errstate(invalid='ignore'):
+        return pd.to_datetime(seconds, unit='s', utc=True)
+
+
+def dataframe_to_dict(dataframe):
+    """
+    Converts a DataFrame to a dictionary of column lists for serialization,
+    with datetimes formatted as ISO 8601 strings.
+
+    Args:
+        dataframe (pandas.DataFrame): data to convert.
+
+    Returns:
+        dict: column names mapped to lists of values.
+    """
+    d = dataframe.to_dict("list")
+    for column in dataframe.select_dtypes(include=['datetime', 'datetimetz']):
+        d[column] = [t.isoformat() if t is not pd.NaT else None for t in dataframe[column]]
+    return d
+
+
+def get_structuring_restart(data, diagnostic_available=None):
+    """
+    Finds where the structuring of a run which is still cycling has to
+    restart to take in appended data: the first cycle which may still
+    change, i. e. the last cycle or the start of the diagnostic it belongs
+    to, and the first row to re-parse. For Maccor data the row is moved
+    back to the start of the cumulative sums running into that cycle, see
+    RawCyclerRun.get_maccor_quantity_sums, so that they restart from zero.
+
+    Args:
+        data (pandas.DataFrame): cycler run data.
+        diagnostic_available (dict): diagnostic cycle locations, see
+            RawCyclerRun.determine_structuring_parameters.
+
+    Returns:
+        (int, int): first cycle_index and first row position to restart
+            from, None if the data is not ordered by cycle.
+    """
+    cycle_index = data['cycle_index'].values
+    if len(cycle_index) == 0 or pd.isnull(cycle_index).any() or np.any(np.diff(cycle_index) < 0):
+        return None
+    first_cycle = cycle_index[-1]
+    if diagnostic_available:
+        for start in diagnostic_available['diagnostic_starts_at']:
+            if start <= first_cycle < start + diagnostic_available['length']:
+                first_cycle = start
+    row = np.searchsorted(cycle_index, first_cycle)
+    if '_ending_status' in data:
+        ending_status = np.asarray(data['_ending_status'], dtype=np.float64)
+        end_step = (MACCOR_CONFIG['end_step_code_min'] <= ending_status) & \
+                   (ending_status <= MACCOR_CONFIG['end_step_code_max'])
+        resets = np.flatnonzero(end_step[:row] & (cycle_index[1:row + 1] != cycle_index[:row]))
+        row = resets[-1] + 1 if len(resets) else 0
+    return int(first_cycle), int(row)
+
+
+def structure_file_incrementally(filename, processed_cycler_run_loc):
+    """
+    Structures a raw cycler run file which may still be growing, parsing
+    and structuring only the data appended since the last call for the
+    same processed cycler run file.
+
+    Next to the processed cycler run a checkpoint records the byte offset
+    of the first line to re-parse and the first cycle to recompute, see
+    get_structuring_restart. On the next call the lines from there on are
+    structured on their own and replace the corresponding cycles of the
+    saved processed run, see ProcessedCyclerRun.extend. The file is
+    structured in full instead if there is no matching checkpoint, if its
+    structuring parameters changed, or if the charge capacity range of the
+    run grew, since that range is the interpolation axis of all charge
+    steps. Only Maccor files are structured incrementally, others are
+    always structured in full.
+
+    Args:
+        filename (str): path to the raw cycler run file.
+        processed_cycler_run_loc (str): path of the processed cycler run
+            file, hdf5 if it ends with .hdf5 and json otherwise.
+
+    Returns:
+        beep.structure.ProcessedCyclerRun: the saved processed cycler run.
+    """
+    checkpoint_loc = os.path.splitext(processed_cycler_run_loc)[0] + STRUCTURE_CHECKPOINT_EXTENSION
+    checkpoint = None
+    if os.path.exists(checkpoint_loc):
+        checkpoint = loadfn(checkpoint_loc)
+        # Removed until a new one is written, so that it never outlives
+        # the processed cycler run it belongs to
+        os.remove(checkpoint_loc)
+
+    if re.match(ARBIN_CONFIG['file_pattern'], filename) or \
+            not re.match(MACCOR_CONFIG['file_pattern'], filename):
+        processed_cycler_run = RawCyclerRun.from_file(filename).to_processed_cycler_run()
+        processed_cycler_run.save(processed_cycler_run_loc)
+        return processed_cycler_run
+
+    # Read the lines from the checkpoint on if it is still valid for the
+    # file, i. e. the column header and the line at the offset are unchanged
+    with open(filename, 'rb') as f:
+        f.readline()
+        header_line = f.readline()
+        byte_offset = f.tell()
+        if checkpoint is not None and os.path.exists(processed_cycler_run_loc) and \
+                checkpoint['version'] == __version__:
+            f.seek(checkpoint['byte_offset'])
+            line_hash = hashlib.md5(header_line + f.readline()).hexdigest()
+            if line_hash == checkpoint['line_hash']:
+                byte_offset = checkpoint['byte_offset']
+            else:
+                checkpoint = None
+        else:
+            checkpoint = None
+        f.seek(byte_offset)
+        line_starts = get_line_starts(f)
+
+        # Only complete lines are structured, a partially written line is
+        # read once complete
+        f.seek(byte_offset)
+        header = pd.read_csv(BytesIO(header_line), delimiter="\t", nrows=0).columns
+        data = pd.read_csv(f, delimiter="\t", header=None, names=header, nrows=len(line_starts))
+    data = format_maccor_data(data)
+
+    raw_cycler_run = RawCyclerRun(data, read_maccor_metadata(filename), filename=filename)
+    parameters = raw_cycler_run.determine_structuring_parameters()
+    v_range, resolution, nominal_capacity, full_fast_charge, diagnostic_available = parameters
+    parameters = json.loads(json.dumps(parameters, cls=MontyEncoder))
+    charge_range = [float(data.charge_capacity.min()), float(data.charge_capacity.max())]
+
+    if checkpoint is None:
+        processed_cycler_run = ProcessedCyclerRun.from_raw_cycler_run(
+            raw_cycler_run, v_range=v_range, resolution=resolution,
+            nominal_capacity=nominal_capacity, full_fast_charge=full_fast_charge,
+            diagnostic_available=diagnostic_available)
+    else:
+        first_cycle = checkpoint['first_cycle']
+        appended = data[data.cycle_index >= first_cycle].reset_index(drop=True)
+        charge_range = [min(checkpoint['charge_range'][0], float(appended.charge_capacity.min())),
+                        max(checkpoint['charge_range'][1], float(appended.charge_capacity.max()))]
+        if parameters != checkpoint['parameters'] or charge_range != checkpoint['charge_range']:
+            return structure_file_incrementally(filename, processed_cycler_run_loc)
+
+        appended_diagnostic = False
+        if diagnostic_available:
+            starts_at = [i for i in diagnostic_available['diagnostic_starts_at']
+                         if first_cycle <= i <= appended.cycle_index.max()]
+            if starts_at:
+                appended_diagnostic = dict(diagnostic_available, diagnostic_starts_at=starts_at)
+        appended_cycler_run = RawCyclerRun(appended, raw_cycler_run.metadata, filename=filename)
+        processed_cycler_run = ProcessedCyclerRun.load(processed_cycler_run_loc)
+        processed_cycler_run.extend(ProcessedCyclerRun.from_raw_cycler_run(
+            appended_cycler_run, v_range=v_range, resolution=resolution,
+            nominal_capacity=nominal_capacity, full_fast_charge=full_fast_charge,
+            diagnostic_available=appended_diagnostic, charge_range=charge_range), first_cycle)
+    processed_cycler_run.save(processed_cycler_run_loc)
+
+    restart = get_structuring_restart(data, diagnostic_available)
+    if restart is not None and len(line_starts) == len(data):
+        first_cycle, row = restart
+        restart_offset = byte_offset + int(line_starts[row])
+        with open(filename, 'rb') as f:
+            f.seek(restart_offset)
+            restart_line = f.readline()
+        dumpfn({"filename": os.path.abspath(filename),
+                "byte_offset": restart_offset,
+                "line_hash": hashlib.md5(header_line + restart_line).hexdigest(),
+                "first_cycle": first_cycle,
+                "charge_range": charge_range,
+                "parameters": parameters,
+                "version": __version__}, checkpoint_loc)
+    return processed_cycler_run
+
+
+def get_line_starts(f, chunksize=2 ** 20):
+    """
+    Locates the non-empty complete lines of a file from its current
+    position on, reading chunksize bytes at a time.
+
+    Args:
+        f (file): file opened in binary mode.
+        chunksize (int): number of bytes read at a time.
+
+    Returns:
+        numpy.ndarray: offset of the start of each non-empty line ending
+            with a newline, relative to the initial position.
+    """
+    line_starts = []
+    position = 0
+    line_start = 0
+    last_byte = b'\n'
+    for block in iter(lambda: f.read(chunksize), b''):
+        line_ends = position + np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+        starts = np.append(line_start, line_ends + 1)[:len(line_ends)]
+        before_ends = np.frombuffer(last_byte + block, dtype=np.uint8)[line_ends - position]
+        line_lengths = line_ends - starts - (before_ends == ord('\r'))
+        line_starts.append(starts[line_lengths > 0])
+        if len(line_ends):
+            line_start = line_ends[-1] + 1
+        position += len(block)
+        last_byte = block[-1:]
+    return np.concatenate(line_starts) if line_starts else np.array([], dtype=np.int64)
+
+
+def structure_file(filename, processed_dir, output_format='json', incremental=False, cache=None,
+                   validate=False):
+    """
+    Structures a single raw cycler run file and dumps the resulting
+    processed cycler run into processed_dir.
+
+    With validate, the file is parsed once, validated with SimpleValidator
+    and structured from the same data, see validate_and_structure_file.
+
+    Args:
+        filename (str): path to the raw cycler run file.
+        processed_dir (str): location for the processed cycler run file.
+        output_format (str): 'json' or 'hdf5', the format of the
+            processed cycler run file.
+        incremental (bool): whether to only structure data appended since
+            the file was last structured, see structure_file_incrementally.
+        cache (beep.structure.StructuringCache): cache of processed cycler
+            runs to reuse, see structure_file_cached. Not used for
+            incremental structuring.
+        validate (bool): whether to validate the file before structuring
+            it, raising BeepValidationError if it is invalid. Can not be
+            combined with incremental.
+
+    Returns:
+        str: absolute path of the processed cycler run file.
+
+    """
+    if validate and incremental:
+        raise ValueError("Validation is not supported for incremental structuring")
+
+    if cache is not None and not incremental:
+        return structure_file_cached(filename, processed_dir, cache, output_format, validate)[0]
+
+    processed_cycler_run_loc = get_processed_cycler_run_loc(filename, processed_dir, output_format)
+    if incremental:
+        structure_file_incrementally(filename, processed_cycler_run_loc)
+        return processed_cycler_run_loc
+
+    if validate:
+        raw_cycler_run = validate_and_structure_file(filename)
+    else:
+        raw_cycler_run = RawCyclerRun.from_file(filename)
+    processed_cycler_run = raw_cycler_run.to_processed_cycler_run()
+    processed_cycler_run.save(processed_cycler_run_loc)
+    return processed_cycler_run_loc
+
+
+def validate_and_structure_file(filename):
+    """
+    Parses a raw Arbin csv or Maccor file once, validates the data with
+    SimpleValidator and creates the RawCyclerRun to be structured from
+    the same data, instead of parsing the file again after validation.
+
+    Args:
+        filename (str): path to the raw cycler run file.
+
+    Returns:
+        beep.structure.RawCyclerRun: raw cycler run of the valid file.
+
+    Raises:
+        BeepValidationError: if the file is invalid or of an unknown type.
+
+    """
+    data = read_raw_data(filename)
+    result = SimpleValidator().validate_raw_data(filename, data)
+    if not result['validated']:
+        raise BeepValidationError(result['errors'])
+    return RawCyclerRun.from_raw_data(filename, data)
+
+
+def structure_file_cached(filename, processed_dir, cache, output_format='json', validate=False):
+    """
+    Structures a single raw cycler run file like structure_file, unless
+    the cache holds the processed cycler run of the same raw file and
+    structuring parameters, which is then copied into processed_dir.
+    With validate, only entries of files which were validated are used,
+    so files found in the cache are not validated again.
+
+    Args:
+        filename (str): path to the raw cycler run file.
+        processed_dir (str): location for the processed cycler run file.
+        cache (beep.structure.StructuringCache): cache of processed
+            cycler runs.
+        output_format (str): 'json' or 'hdf5', the format of the
+            processed cycler run file.
+        validate (bool): whether to validate the file before structuring
+            it, see structure_file.
+
+    Returns:
+        (str, bool): absolute path of the processed cycler run file and
+            whether it was found in the cache.
+
+    """
+    processed_cycler_run_loc = get_processed_cycler_run_loc(filename, processed_dir, output_format)
+    key = cache.key(filename, validate=validate)
+    if cache.get(key, processed_cycler_run_loc):
+        return processed_cycler_run_loc, True
+
+    processed_cycler_run_loc = structure_file(filename, processed_dir, output_format,
+                                              validate=validate)
+    cache.put(key, processed_cycler_run_loc)
+    return processed_cycler_run_loc, False
+
+
+def get_processed_cycler_run_loc(filename, processed_dir, output_format='json'):
+    """
+    Location of the processed cycler run file of a raw cycler run file.
+
+    Args:
+        filename (str): path to the raw cycler run file.
+        processed_dir (str): location for the processed cycler run file.
+        output_format (str): 'json' or 'hdf5', the format of the
+            processed cycler run file.
+
+    Returns:
+        str: absolute path of the processed cycler run file.
+
+    """
+    new_filename, ext = os.path.splitext(os.path.basename(filename))
+    new_filename = new_filename + STRUCTURE_FILE_EXTENSIONS[output_format]
+    new_filename = add_suffix_to_filename(new_filename, "_structure")
+    processed_cycler_run_loc = os.path.join(processed_dir, new_filename)
+    return os.path.abspath(processed_cycler_run_loc)
+
+
+def structure_files(filenames, processed_dir, workers=1, output_format='json', incremental=False,
+                    cache=None, validate=False):
+    """
+    Structures a list of raw cycler run files, optionally in parallel
+    over a pool of processes. At most `workers` files are in flight at
+    any time, which bounds memory use to that of `workers` runs.
+
+    Args:
+        filenames (list): paths to the raw cycler run files.
+        processed_dir (str): location for the processed cycler run files.
+        workers (int): number of processes to use, 1 structures the files
+            sequentially in the current process.
+        output_format (str): 'json' or 'hdf5', the format of the
+            processed cycler run files.
+        incremental (bool): whether to only structure data appended since
+            the files were last structured.
+        cache (beep.structure.StructuringCache): cache of processed cycler
+            runs to reuse, not used for incremental structuring.
+        validate (bool): whether to validate each file before structuring
+            it, see structure_file. Invalid files give a
+            BeepValidationError.
+
+    Returns:
+        list: (processed file path, exception, cache hit) for each file in
+            the order of filenames, with one of the first two being None.
+            The cache hit is None if no cache was used.
+
+    """
+    if cache is not None and not incremental:
+        function, args = structure_file_cached, (processed_dir, cache, output_format, validate)
+    else:
+        function, args = structure_file, (processed_dir, output_format, incremental, None, validate)
+
+    def get_result(result):
+        if function is structure_file_cached:
+            return result[0], None, result[1]
+        return result, None, None
+
+    results = [None] * len(filenames)
+    if workers <= 1:
+        for n, filename in enumerate(filenames):
+            try:
+                results[n] = get_result(function(filename, *args))
+            except Exception as e:
+                results[n] = (None, e, None)
+        return results
+
+    queue = iter(enumerate(filenames))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def submit(count):
+            for n, filename in itertools.islice(queue, count):
+                try:
+                    pending[executor.submit(function, filename, *args)] = n
+                except Exception as e:
+                    results[n] = (None, e, None)
+
+        submit(workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                n = pending.pop(future)
+                try:
+                    results[n] = get_result(future.result())
+                except Exception as e:
+                    results[n] = (None, e, None)
+            submit(len(done))
+    return results
+
+
+def process_file_list_from_json(file_list_json, processed_dir='data-share/structure/', workers=1,
+                                output_format='json', incremental=False, cache_dir=None,
+                                cache_max_bytes=STRUCTURE_CACHE_MAX_BYTES, validate=False):
     """
     Function to take a json filename corresponding to a data structure
     with a 'file_list' and a 'validity' attribute, process each file
@@ -1523,11 +2982,30 @@ def process_file_list_from_json(file_list_json, processed_dir='data-share/struct
             and loaded, otherwise interpreted as a json string.
         processed_dir (str): location for processed cycler run output
             files to be placed.
+        workers (int): number of processes to structure files with.
+        output_format (str): 'json' or 'hdf5', the format of the processed
+            cycler run files, see ProcessedCyclerRun.save.
+        incremental (bool): whether to only structure data appended to
+            the files since they were last structured, for runs which
+            are still cycling, see structure_file_incrementally.
+        cache_dir (str): location of a cache of processed cycler run
+            files, relative to BEEP_PROCESSING_DIR, from which files
+            which have been structured before are reused instead of being
+            structured again, see StructuringCache. No cache if None.
+        cache_max_bytes (int): size bound of the cache in bytes.
+        validate (bool): whether to validate the files while structuring
+            them, parsing each file only once, instead of using the
+            validity of the input json, which is then not required.
 
     Returns:
-        str: json string of processed files (with key "processed_file_list").
-            Note that this list contains None values for every file that
-            had a corresponding False in the validity list.
+        str: json string of processed files (with key "file_list").
+            Files which failed to structure are left out of "file_list"
+            and listed by their raw file name in "failed_file_list", with
+            their run ids in "failed_run_list" and error messages in
+            "failed_message_list".
+            The numbers of files found in and missing from the cache are
+            given as "cache_hits" and "cache_misses". With validate,
+            the validity of each input file is given as "validity".
 
     """
     # Get file list and validity from json, if ends with .json,
@@ -1546,42 +3024,76 @@ def process_file_list_from_json(file_list_json, processed_dir='data-share/struct
     if not os.path.exists(processed_dir):
         os.makedirs(processed_dir)
 
+    cache = None
+    if cache_dir is not None:
+        cache_dir = os.path.join(os.environ.get("BEEP_PROCESSING_DIR", "/"), cache_dir)
+        cache = StructuringCache(cache_dir, cache_max_bytes)
+
     file_list = file_list_data['file_list']
-    validities = file_list_data['validity']
+    if validate:
+        # Files are validated as they are structured
+        validities = ['valid'] * len(file_list)
+    else:
+        validities = file_list_data['validity']
     run_ids = file_list_data['run_list']
-    processed_file_list = []
-    processed_run_list = []
-    processed_result_list = []
-    processed_message_list = []
+    valid_files = []
+    valid_run_ids = []
     invalid_file_list = []
     for filename, validity, run_id in zip(file_list, validities, run_ids):
         logger.info('run_id=%s structuring=%s', str(run_id), filename, extra=s)
         if validity == 'valid':
-            # Process raw cycler run and dump to file
-            raw_cycler_run = RawCyclerRun.from_file(filename)
-            processed_cycler_run = raw_cycler_run.to_processed_cycler_run()
-            new_filename, ext = os.path.splitext(os.path.basename(filename))
-            new_filename = new_filename + ".json"
-            new_filename = add_suffix_to_filename(new_filename, "_structure")
-            processed_cycler_run_loc = os.path.join(processed_dir, new_filename)
-            processed_cycler_run_loc = os.path.abspath(processed_cycler_run_loc)
-            dumpfn(processed_cycler_run, processed_cycler_run_loc)
-
-            # Append file loc to list to be returned
+            valid_files.append(filename)
+            valid_run_ids.append(run_id)
+        else:
+            invalid_file_list.append(filename)
+
+    processed_file_list = []
+    processed_run_list = []
+    processed_result_list = []
+    processed_message_list = []
+    failed_file_list = []
+    failed_run_list = []
+    failed_message_list = []
+    results = structure_files(valid_files, processed_dir, workers=workers,
+                              output_format=output_format, incremental=incremental, cache=cache,
+                              validate=validate)
+    cache_hits = 0
+    cache_misses = 0
+    for filename, run_id, (processed_cycler_run_loc, error, cache_hit) in zip(valid_files, valid_run_ids, results):
+        if isinstance(error, BeepValidationError):
+            logger.warning('run_id=%s invalid=%s: %s', str(run_id), filename, str(error), extra=s)
+            invalid_file_list.append(filename)
+            continue
+        if cache_hit is not None:
+            cache_hits += cache_hit
+            cache_misses += not cache_hit
+        if error is None:
             processed_file_list.append(processed_cycler_run_loc)
             processed_run_list.append(run_id)
             processed_result_list.append("success")
             processed_message_list.append({'comment': '',
                                            'error': ''})
-
         else:
-            invalid_file_list.append(filename)
+            logger.error('run_id=%s unable to structure=%s: %s', str(run_id), filename,
+                         str(error), extra=s)
+            failed_file_list.append(filename)
+            failed_run_list.append(run_id)
+            failed_message_list.append({'comment': 'Unable to structure file',
+                                        'error': '{}: {}'.format(type(error).__name__, error)})
 
     output_json = {"file_list": processed_file_list,
                    "run_list": processed_run_list,
                    "result_list": processed_result_list,
                    "message_list": processed_message_list,
-                   "invalid_file_list": invalid_file_list}
+                   "invalid_file_list": invalid_file_list,
+                   "failed_file_list": failed_file_list,
+                   "failed_run_list": failed_run_list,
+                   "failed_message_list": failed_message_list,
+                   "cache_hits": cache_hits,
+                   "cache_misses": cache_misses}
+    if validate:
+        output_json["validity"] = ['invalid' if filename in invalid_file_list else 'valid'
+                                   for filename in file_list]
 
     events.put_structuring_event(output_json, 'complete')
 
@@ -1600,7 +3112,12 @@ def main():
     try:
         args = docopt(__doc__)
         input_json = args['INPUT_JSON']
-        print(process_file_list_from_json(input_json))
+        workers = int(args['--workers'])
+        print(process_file_list_from_json(input_json, workers=workers,
+                                          output_format=args['--format'],
+                                          incremental=args['--incremental'],
+                                          cache_dir=args['--cache'],
+                                          validate=args['--validate']))
     except Exception as e:
         logger.error(str(e), extra=s)
         raise e
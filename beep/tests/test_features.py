@@ -7,11 +7,16 @@ import json
 import shutil
 
 import numpy as np
+import pandas as pd
 from beep.utils.secrets_manager import event_setup
-from beep.featurize import process_file_list_from_json, \
-    DeltaQFastCharge, TrajectoryFastCharge, DegradationPredictor, DiagnosticCyclesFeatures, DiagnosticProperties
+from beep.featurize import process_file_list_from_json, get_required_columns, \
+    DeltaQFastCharge, TrajectoryFastCharge, DegradationPredictor, DiagnosticCyclesFeatures, DiagnosticProperties, \
+    FeatureStore
+from beep.structure import RawCyclerRun, ProcessedCyclerRun
+from beep.helpers import featurizer_helpers
 from monty.serialization import dumpfn, loadfn
 from monty.tempfile import ScratchDir
+import matplotlib.pyplot as plt
 
 TEST_DIR = os.path.dirname(__file__)
 TEST_FILE_DIR = os.path.join(TEST_DIR, "test_files")
@@ -153,6 +158,72 @@ class TestFeaturizer(unittest.TestCase):
             self.assertIsInstance(features_reloaded, DiagnosticProperties)
             self.assertListEqual(list(features_reloaded.X.iloc[2,:]), [143, 0.9753520623934744, 'rpt_0.2C','discharge_energy'])
 
+    def test_feature_generation_list_to_json_workers(self):
+        insufficient_path = os.path.join(TEST_FILE_DIR, PROCESSED_CYCLER_FILE_INSUF)
+        with ScratchDir('.'):
+            os.environ['BEEP_PROCESSING_DIR'] = os.getcwd()
+            processed_cycler_run_path = os.path.join(os.getcwd(), "PredictionDiagnostics_000109_structure.json")
+            RawCyclerRun.from_file(MACCOR_FILE_W_PARAMETERS).to_processed_cycler_run().save(
+                processed_cycler_run_path)
+            json_obj = {
+                        "mode": self.events_mode,
+                        "file_list": [processed_cycler_run_path, insufficient_path],
+                        'run_list': [0, 1]
+                        }
+            json_string = json.dumps(json_obj)
+            sequential = json.loads(process_file_list_from_json(json_string, processed_dir=os.getcwd()))
+            parallel = json.loads(process_file_list_from_json(json_string, processed_dir=os.getcwd(),
+                                                              workers=2))
+            for key in ['file_list', 'run_list', 'result_list', 'message_list']:
+                self.assertEqual(parallel[key], sequential[key])
+            self.assertEqual(parallel['run_list'], [0] * 4 + [1] * 4)
+            self.assertEqual(parallel['result_list'][4:], ['incomplete'] * 4)
+            self.assertEqual(parallel['file_list'][4:], [insufficient_path] * 4)
+            self.assertEqual(len(parallel['time_list']), 8)
+
+    def test_feature_generation_list_to_json_feature_store(self):
+        processed_cycler_run_path = os.path.join(TEST_FILE_DIR, PROCESSED_CYCLER_FILE)
+        with ScratchDir('.'):
+            os.environ['BEEP_PROCESSING_DIR'] = os.getcwd()
+            json_obj = {
+                        "mode": self.events_mode,
+                        "file_list": [processed_cycler_run_path],
+                        'run_list': [0]
+                        }
+            json_string = json.dumps(json_obj)
+            for _ in range(2):
+                reloaded = json.loads(process_file_list_from_json(json_string, processed_dir=os.getcwd(),
+                                                                  feature_store=True))
+            feature_paths = [path for path, result in zip(reloaded['file_list'], reloaded['result_list'])
+                             if result == 'success']
+            self.assertEqual(len(reloaded['feature_store_list']), len(feature_paths))
+            for feature_path, store_path in zip(feature_paths, reloaded['feature_store_list']):
+                features = loadfn(feature_path)
+                cells, X, y = FeatureStore(store_path).load()
+                self.assertIsNone(y)
+                self.assertEqual(set(cells.cell_id), {"2017-06-30_2C-10per_6C_CH10"})
+                np.testing.assert_array_equal(X.values, features.X.values)
+
+    def test_feature_store(self):
+        with ScratchDir('.') as scratch_dir:
+            store = FeatureStore.from_feature_dir(scratch_dir, DiagnosticProperties.class_feature_name)
+            metadata = {'barcode': None, 'protocol': 'diagnosticV3.000', 'channel_id': 1}
+            X = pd.DataFrame({'cycle_index': [143, 250], 'fractional_metric': [0.97, 0.95],
+                              'cycle_type': ['rpt_0.2C', 'rpt_1C'], 'metric': 'discharge_energy'})
+            features = [DiagnosticProperties('cell_a', X, metadata),
+                        DiagnosticProperties('cell_b', X.iloc[:1], metadata),
+                        DiagnosticProperties('cell_c', X.iloc[:0], metadata)]
+            store.append(features, ['a', 'b', 'c'])
+            store.append([DiagnosticProperties('cell_a', X.iloc[1:], metadata)], ['a'])
+
+            cells, X_store, y = store.load()
+            self.assertIsNone(y)
+            self.assertListEqual(list(cells.cell_id), ['b', 'a'])
+            self.assertEqual(json.loads(cells.metadata.iloc[0]), metadata)
+            self.assertListEqual(list(X_store.cycle_type), ['rpt_0.2C', 'rpt_1C'])
+            self.assertListEqual(list(X_store.columns), list(X.columns))
+            self.assertEqual(store.get_attributes()['name'], 'DiagnosticProperties')
+
     def test_insufficient_data_file(self):
         processed_cycler_run_path = os.path.join(TEST_FILE_DIR, PROCESSED_CYCLER_FILE_INSUF)
         with ScratchDir('.'):
@@ -171,6 +242,18 @@ class TestFeaturizer(unittest.TestCase):
             self.assertEqual(output_obj['message_list'][0]['comment'],
                              'Insufficient or incorrect data for featurization')
 
+    def test_get_required_columns(self):
+        columns = get_required_columns([DeltaQFastCharge])
+        self.assertIsNone(columns['summary'])
+        self.assertNotIn('diagnostic_interpolated', columns)
+
+        columns = get_required_columns([TrajectoryFastCharge, DiagnosticProperties])
+        self.assertEqual(columns['summary'], ['cycle_index', 'discharge_capacity'])
+        self.assertNotIn('cycles_interpolated', columns)
+        columns = get_required_columns([TrajectoryFastCharge, DeltaQFastCharge, DiagnosticCyclesFeatures])
+        self.assertIsNone(columns['summary'])
+        self.assertIsNone(columns['diagnostic_interpolated'])
+
     def test_DiagnosticCyclesFeatures_class(self):
         with ScratchDir('.'):
             os.environ['BEEP_PROCESSING_DIR'] = TEST_FILE_DIR
@@ -197,3 +280,145 @@ class TestFeaturizer(unittest.TestCase):
             self.assertEqual(folder, 'DiagnosticProperties')
             self.assertEqual(featurizer.X.shape, (10, 4))
             self.assertListEqual(list(featurizer.X.iloc[2,:]), [143, 0.9753520623934744, 'rpt_0.2C','discharge_energy'])
+
+    def test_diagnostic_view(self):
+        diagnostic_interpolated = pd.DataFrame({
+            'cycle_type': ['hppc'] * 6 + ['rpt_0.2C'] * 2,
+            'cycle_index': [2, 2, 2, 2, 37, 37, 3, 3],
+            'step_index': [11, 11, 12, 11, 43, 44, 5, 5],
+            'step_index_counter': [1, 1, 2, 3, 1, 2, 1, 1],
+            'current': [0.0, np.nan, -1.0, 0.0, 0.0, -1.0, 0.2, 0.2]})
+        cycles_interpolated = pd.DataFrame({'cycle_index': [], 'voltage': []})
+        processed_cycler_run = ProcessedCyclerRun(None, None, None, None, cycles_interpolated,
+                                                  diagnostic_interpolated=diagnostic_interpolated)
+        view = featurizer_helpers.get_diagnostic_view(processed_cycler_run)
+        self.assertIs(featurizer_helpers.get_diagnostic_view(processed_cycler_run), view)
+        self.assertEqual(view.cycle_indices('hppc').tolist(), [2, 37])
+        self.assertEqual(view.rows('hppc', 2, step_index=11).index.tolist(), [0, 1, 3])
+        self.assertEqual(view.rows('hppc', 2, step_index=11, valid_current=True).index.tolist(), [0, 3])
+        self.assertEqual(view.rows('hppc', 2, step_index_counter=1).index.tolist(), [0, 1])
+        self.assertEqual(view.rows('hppc', 37, step_index=11).index.tolist(), [])
+        self.assertEqual(view.rows('rpt_1C', 3).index.tolist(), [])
+
+        processed_cycler_run.diagnostic_interpolated = diagnostic_interpolated.copy()
+        self.assertIsNot(featurizer_helpers.get_diagnostic_view(processed_cycler_run), view)
+
+    def test_get_hppc_resistance(self):
+        # Two SOC windows of a rest, discharge and charge pulse per cycle
+        rows = []
+        for cycle_index, steps in [(2, [11, 12, 14]), (37, [43, 44, 46])]:
+            counter = 0
+            for soc_window in range(2):
+                for step_index, voltage, current in zip(steps, [3.5, 3.4, 3.6], [0.0, -1.0, 2.0]):
+                    counter += 1
+                    growth = 0.01 * (cycle_index == 37) * (step_index != steps[0])
+                    rows.append(pd.DataFrame({
+                        'cycle_type': 'hppc', 'cycle_index': cycle_index, 'step_index': step_index,
+                        'step_index_counter': counter, 'test_time': 0.0, 'current': current,
+                        'voltage': [voltage + growth - 0.1 * soc_window] * 3}))
+        diagnostic_interpolated = pd.concat(rows, ignore_index=True)
+        cycles_interpolated = pd.DataFrame({'cycle_index': [], 'voltage': []})
+        processed_cycler_run = ProcessedCyclerRun(None, None, None, None, cycles_interpolated,
+                                                  diagnostic_interpolated=diagnostic_interpolated)
+
+        resistance = featurizer_helpers.get_hppc_resistance(processed_cycler_run)
+        resistance = resistance.set_index(['state', 'cycle_index', 'soc_window']).resistance
+        np.testing.assert_allclose(resistance['D'][2].values, [0.1, 0.1])
+        np.testing.assert_allclose(resistance['C'][2].values, [0.05, 0.05])
+        np.testing.assert_allclose(resistance['D'][37].values, [0.09, 0.09])
+        np.testing.assert_allclose(resistance['C'][37].values, [0.055, 0.055])
+        np.testing.assert_allclose(featurizer_helpers.get_hppc_r(processed_cycler_run, 37), (0, 0), atol=1e-12)
+        self.assertIsNone(featurizer_helpers.get_hppc_r(processed_cycler_run, 142))
+
+    def test_fit_gaussian_peaks(self):
+        x = np.linspace(3.4, 3.9, 200)
+        peaks = featurizer_helpers.gaussian(x, np.array([0.2, 0.3]), np.array([3.55, 3.75]), np.array([0.03, 0.02]))
+        y = peaks.sum(axis=1)
+        best_values = featurizer_helpers.fit_gaussian_peaks(x, y, {0: 3.56, 1: 3.74}, {0: y.max(), 1: y.max()})
+        np.testing.assert_allclose([best_values['m0_center'], best_values['m1_center']], [3.55, 3.75], atol=1e-6)
+        np.testing.assert_allclose([best_values['m0_sigma'], best_values['m1_sigma']], [0.03, 0.02], atol=1e-6)
+        np.testing.assert_allclose([best_values['m0_amplitude'], best_values['m1_amplitude']], [0.2, 0.3],
+                                   atol=1e-6)
+        # Warm started from the solution
+        warm_values = featurizer_helpers.fit_gaussian_peaks(x, y, {0: 3.56, 1: 3.74}, {0: y.max(), 1: y.max()},
+                                                            initial_values=best_values)
+        np.testing.assert_allclose(list(warm_values.values()), list(best_values.values()), atol=1e-6)
+
+    def test_dQdV_peak_fits_batch(self):
+        # Four charge and discharge peaks per rpt_0.2C cycle, shifted by 10 mV per diagnostic
+        def processed_cycler_run():
+            voltage = np.linspace(3.0, 4.2, 1000)
+            rows = []
+            for diag_nr, cycle_index in enumerate([2, 42, 147]):
+                centers = np.array([3.45, 3.6, 3.75, 3.95]) + 0.01 * diag_nr
+                dQdV = featurizer_helpers.gaussian(voltage, np.array([0.2, 0.3, 0.25, 0.15]), centers,
+                                                   np.array([0.02, 0.025, 0.02, 0.03])).sum(axis=1)
+                for step_type in [0, 1]:
+                    rows.append(pd.DataFrame({
+                        'cycle_type': 'rpt_0.2C', 'cycle_index': cycle_index, 'step_type': step_type,
+                        'voltage': voltage,
+                        'charge_dQdV': dQdV if step_type == 0 else np.nan,
+                        'discharge_dQdV': -dQdV if step_type == 1 else np.nan}))
+            diagnostic_interpolated = pd.concat(rows, ignore_index=True)
+            cycles_interpolated = pd.DataFrame({'cycle_index': [], 'voltage': []})
+            return ProcessedCyclerRun(None, None, None, None, cycles_interpolated,
+                                      diagnostic_interpolated=diagnostic_interpolated)
+
+        centers = ['m{}_Mu'.format(i) for i in range(4)]
+        run = processed_cycler_run()
+        peak_fits = featurizer_helpers.generate_dQdV_peak_fits_batch(run, 'rpt_0.2C', 1)
+        self.assertEqual(peak_fits.index.tolist(), [0, 1, 2])
+        np.testing.assert_allclose(peak_fits[centers].values,
+                                   [[3.45, 3.6, 3.75, 3.95], [3.46, 3.61, 3.76, 3.96], [3.47, 3.62, 3.77, 3.97]],
+                                   atol=1e-3)
+        # Memoized on the diagnostic view of the run
+        self.assertIs(featurizer_helpers.generate_dQdV_peak_fits_batch(run, 'rpt_0.2C', 1), peak_fits)
+        # Reproducible for the same seed
+        pd.testing.assert_frame_equal(
+            featurizer_helpers.generate_dQdV_peak_fits_batch(processed_cycler_run(), 'rpt_0.2C', 1), peak_fits)
+
+        discharge_fits = featurizer_helpers.generate_dQdV_peak_fits_batch(run, 'rpt_0.2C', 0, diag_nrs=[0, 2])
+        self.assertEqual(discharge_fits.index.tolist(), [0, 2])
+        np.testing.assert_allclose(discharge_fits[centers].values, peak_fits.loc[[0, 2], centers].values, atol=1e-3)
+
+        cold_fits = featurizer_helpers.generate_dQdV_peak_fits_batch(run, 'rpt_0.2C', 1, warm_start=False)
+        np.testing.assert_allclose(cold_fits[centers].values, peak_fits[centers].values, atol=1e-3)
+        least_squares_fits = featurizer_helpers.generate_dQdV_peak_fits_batch(run, 'rpt_0.2C', 1,
+                                                                              backend='least_squares')
+        np.testing.assert_allclose(least_squares_fits[centers].values, peak_fits[centers].values, atol=1e-3)
+        self.assertRaises(ValueError, featurizer_helpers.generate_dQdV_peak_fits_batch,
+                          run, 'rpt_0.2C', 1, backend='curve_fit')
+
+        # Plotting does not change the features
+        features = DiagnosticCyclesFeatures.get_rpt_dQdV_features(processed_cycler_run(), diag_nr=2)
+        plotted_features = DiagnosticCyclesFeatures.get_rpt_dQdV_features(processed_cycler_run(), diag_nr=2,
+                                                                          plotting_y_n=1)
+        plt.close('all')
+        pd.testing.assert_frame_equal(plotted_features, features)
+        np.testing.assert_allclose(features[centers].values, [[3.47 / 3.45, 3.62 / 3.6, 3.77 / 3.75, 3.97 / 3.95]],
+                                   atol=1e-3)
+
+    def test_get_hppc_relaxation_times(self):
+        # Linear relaxations over 10 s in the first and 20 s in the second HPPC cycle,
+        # alternating with pulses, the first relaxation coming out of CV
+        rows = []
+        for cycle_index, duration in [(2, 10.0), (37, 20.0)]:
+            for counter in range(1, 7):
+                step_index = 11 if counter % 2 else 12
+                rows.append(pd.DataFrame({
+                    'cycle_type': 'hppc', 'cycle_index': cycle_index, 'step_index': step_index,
+                    'step_index_counter': counter, 'current': 0.0,
+                    'test_time': 100 * counter + np.linspace(0, duration, 11),
+                    'voltage': np.linspace(3.0, 3.1, 11)}))
+        diagnostic_interpolated = pd.concat(rows, ignore_index=True)
+        cycles_interpolated = pd.DataFrame({'cycle_index': [], 'voltage': []})
+        processed_cycler_run = ProcessedCyclerRun(None, None, None, None, cycles_interpolated,
+                                                  diagnostic_interpolated=diagnostic_interpolated)
+
+        cycles, times = featurizer_helpers.get_hppc_relaxation_times(processed_cycler_run)
+        self.assertEqual(cycles.tolist(), [2, 37])
+        self.assertEqual(times.shape, (2, 9, 3))
+        np.testing.assert_allclose(times[0, :2], [[5, 8, 9.9]] * 2)
+        np.testing.assert_allclose(times[1, :2], [[10, 16, 19.8]] * 2)
+        self.assertTrue(np.isnan(times[:, 2:]).all())
+        np.testing.assert_allclose(featurizer_helpers.get_relaxation_features(processed_cycler_run)[:2], 2)
@@ -8,7 +8,9 @@ import numpy as np
 from glob import glob
 from beep import MODEL_DIR, ENVIRONMENT
 from beep.utils.secrets_manager import event_setup
-from beep.run_model import DegradationModel, process_file_list_from_json, get_project_name_from_list
+from beep.run_model import DegradationModel, process_file_list_from_json, get_project_name_from_list, \
+    assemble_predictors
+from beep.featurize import FeatureStore
 from monty.serialization import loadfn
 from monty.tempfile import ScratchDir
 
@@ -130,6 +132,70 @@ class TestRunModel(unittest.TestCase):
             os.remove(file)
 
 
+    def test_predict_batch(self):
+        for features_path, model_name in [(SINGLE_TASK_FEATURES_PATH, 'd3batt_single_point.model'),
+                                          (MULTI_TASK_FEATURES_PATH, 'd3batt_multi_point.model')]:
+            model = DegradationModel.from_serialized_model(model_dir=MODEL_DIR,
+                                                           serialized_model=model_name)
+            features_list = [loadfn(path) for path in
+                             sorted(glob(os.path.join(features_path, "*features.json")))]
+            predictions = model.predict_batch(features_list)
+            self.assertEqual(predictions.shape[0], len(features_list))
+            for prediction, features in zip(predictions, features_list):
+                np.testing.assert_allclose(prediction, model.predict(features))
+
+            # Stacked matrix input with a missing descriptor
+            X = np.vstack([features.X.values for features in features_list])
+            X[0, 0] = np.nan
+            features_list[0].X.iloc[0, 0] = np.nan
+            np.testing.assert_allclose(model.predict_batch(X)[0],
+                                       model.predict(features_list[0]))
+
+    def test_consolidated_prediction_list_to_json(self):
+        featurized_jsons = sorted(glob(os.path.join(MULTI_TASK_FEATURES_PATH, "*features.json")))
+        json_obj = {
+            "mode": self.events_mode,
+            "file_list": featurized_jsons,
+            'run_list': list(range(len(featurized_jsons)))
+        }
+        json_string = json.dumps(json_obj)
+        with ScratchDir('.') as scratch_dir:
+            newjsonpaths = process_file_list_from_json(json_string, model_dir=MODEL_DIR,
+                                                       processed_dir=scratch_dir, predict_only=True,
+                                                       fan_out=False)
+            reloaded = json.loads(newjsonpaths)
+            self.assertEqual(len(set(reloaded['file_list'])), 1)
+            self.assertEqual(reloaded['file_list'][0], reloaded['consolidated_file'])
+            consolidated = loadfn(reloaded['consolidated_file'])
+            self.assertEqual(consolidated['run_list'], reloaded['run_list'])
+            self.assertEqual(len(consolidated['predictions']), len(featurized_jsons))
+            self.assertEqual(glob(os.path.join(scratch_dir, "*predictions.json")),
+                             [reloaded['consolidated_file']])
+
+
+    def test_assemble_predictors_feature_store(self):
+        for features_path in [SINGLE_TASK_FEATURES_PATH, MULTI_TASK_FEATURES_PATH]:
+            featurized_jsons = sorted(glob(os.path.join(features_path, "*features.json")))
+            with ScratchDir('.') as scratch_dir:
+                store = FeatureStore.from_feature_dir(scratch_dir, 'full_model')
+                features_list = [loadfn(path) for path in featurized_jsons]
+                cell_ids = [os.path.basename(path) for path in featurized_jsons]
+                # Re-appending a cell replaces its earlier rows
+                store.append(features_list[:2], cell_ids[:2])
+                store.append(features_list, cell_ids)
+                self.assertEqual(len(store.X), len(featurized_jsons))
+
+                X, y, name, predicted_quantity = assemble_predictors(
+                    json.dumps({"file_list": featurized_jsons}))
+                X_store, y_store, name_store, predicted_quantity_store = assemble_predictors(
+                    json.dumps({"file_list": [store.path]}))
+                np.testing.assert_array_equal(X_store.values, X.values)
+                np.testing.assert_array_equal(y_store.values, y.values)
+                self.assertListEqual(list(y_store.columns), list(y.columns))
+                self.assertEqual(name_store, name)
+                self.assertEqual(predicted_quantity_store, predicted_quantity)
+
+
 class TestHelperFunctions(unittest.TestCase):
     def test_get_project_name_from_list(self):
         file_list = ['data-share/predictions/PredictionDiagnostics_000100_003022_predictions.json',
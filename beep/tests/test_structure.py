@@ -4,6 +4,7 @@
 import json
 import os
 import subprocess
+import tracemalloc
 import unittest
 import numpy as np
 import pandas as pd
@@ -12,8 +13,13 @@ from beep import MODULE_DIR
 from beep.structure import RawCyclerRun, ProcessedCyclerRun, \
     process_file_list_from_json, EISpectrum, get_project_sequence, \
     get_protocol_parameters, get_diagnostic_parameters, \
-    determine_paused
-from beep.conversion_schemas import STRUCTURE_DTYPES
+    determine_paused, get_interpolated_data, interpolate_segments, SegmentIndex, \
+    LazyProcessedCyclerRun, read_arbin_data, maccor_timestamp, maccor_timestamps, \
+    determine_paused_cycles, datetime_to_epoch_ns, structure_file, STRUCTURE_CHECKPOINT_EXTENSION, \
+    StructuringCache, format_arbin_data
+from beep.validate import BeepValidationError, read_raw_data
+from beep.featurize import process_file_list_from_json as featurize_file_list_from_json
+from beep.conversion_schemas import STRUCTURE_DTYPES, ARBIN_CONFIG, MACCOR_CONFIG
 from monty.serialization import loadfn, dumpfn
 from monty.tempfile import ScratchDir
 from beep.utils import os_format
@@ -113,6 +119,106 @@ class RawCyclerRunTest(unittest.TestCase):
         capacity_sign = np.sign(np.diff(raw_cycler_run.data['discharge_capacity']))
         self.assertTrue(np.all(capacity_sign >= -cycle_sign))      # Capacity increases throughout cycle
 
+    def test_read_arbin_data(self):
+        arbin_file = os.path.join(TEST_FILE_DIR, "FastCharge_000025_CH8.csv")
+        data = read_arbin_data(arbin_file)
+        self.assertEqual(len(data), 248)
+        self.assertEqual(data.columns[-1], 'date_time_iso')
+        self.assertEqual(data['date_time_iso'].iloc[0], pd.Timestamp('2017-05-13T03:14:08+00:00'))
+        self.assertEqual(data['date_time_iso'].dtype, 'datetime64[ns, UTC]')
+        for column, dtype in ARBIN_CONFIG['data_types'].items():
+            name = ARBIN_CONFIG['data_columns'][column]
+            if not name.startswith('_'):
+                self.assertEqual(data[name].dtype, dtype)
+        self.assertNotIn('_dv/dt', data)
+        self.assertIn('_dv/dt', read_arbin_data(arbin_file, usecols=['dV/dt', 'DateTime']))
+        pd.testing.assert_frame_equal(read_arbin_data(arbin_file, chunksize=7), data)
+
+        # Carriage return line endings
+        with ScratchDir('.'):
+            with open(arbin_file, 'rb') as f:
+                text = f.read().replace(b'\r\n', b'\n').replace(b'\n', b'\r')
+            with open('cr_only.csv', 'wb') as f:
+                f.write(text)
+            pd.testing.assert_frame_equal(read_arbin_data('cr_only.csv', chunksize=7), data)
+
+        # Integer columns with missing values
+        data = read_arbin_data(self.arbin_bad, chunksize=100)
+        self.assertEqual(len(data), 287)
+        self.assertEqual(data['step_index'].dtype, np.float64)
+        self.assertTrue(data['step_index'].isnull().all())
+        self.assertEqual(data['data_point'].dtype, np.int32)
+        pd.testing.assert_frame_equal(format_arbin_data(read_raw_data(self.arbin_bad)), data)
+
+    def test_read_arbin_data_memory(self):
+        arbin_file = os.path.join(TEST_FILE_DIR, "FastCharge_000025_CH8.csv")
+        chunksize = 10000
+        with open(arbin_file) as f:
+            header = f.readline()
+            lines = f.read().splitlines()
+        # Missing cycle indices in the middle of the file
+        missing = [','.join(line.split(',')[:5] + [''] + line.split(',')[6:]) for line in lines]
+        with ScratchDir('.'):
+            with open('large.csv', 'w') as f:
+                f.write(header)
+                for tile in range(400):
+                    f.write('\n'.join(missing if tile == 200 else lines) + '\n')
+
+            tracemalloc.start()
+            data = read_arbin_data('large.csv', chunksize=chunksize)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            chunk = pd.read_csv('large.csv', nrows=chunksize).memory_usage(deep=True).sum()
+
+            self.assertEqual(len(data), 400 * len(lines))
+            self.assertEqual(data['cycle_index'].dtype, np.float64)
+            self.assertEqual(data['cycle_index'].isnull().sum(), len(lines))
+            self.assertNotIn('_dv/dt', data)
+            # The data is held once, next to the parsing of a single chunk
+            self.assertLess(peak, 1.1 * data.memory_usage(deep=True).sum() + 3 * chunk)
+            pd.testing.assert_frame_equal(format_arbin_data(pd.read_csv('large.csv')), data)
+
+    def test_from_raw_data(self):
+        for filename in [os.path.join(TEST_FILE_DIR, "FastCharge_000025_CH8.csv"),
+                         self.maccor_file_timezone]:
+            raw_data = read_raw_data(filename)
+            from_raw_data = RawCyclerRun.from_raw_data(filename, raw_data)
+            from_file = RawCyclerRun.from_file(filename)
+            pd.testing.assert_frame_equal(from_raw_data.data, from_file.data)
+            self.assertEqual(from_raw_data.metadata['barcode'], from_file.metadata['barcode'])
+            self.assertEqual(from_raw_data.metadata['channel_id'], from_file.metadata['channel_id'])
+            self.assertEqual(list(read_raw_data(filename).columns), list(raw_data.columns))
+
+    def test_maccor_timestamps(self):
+        # Ambiguous and non-existent times around daylight savings and
+        # rows mis-printed at midnight
+        date_time = pd.Series(['11/03/2019 01:30:00', '11/03/2019 02:00:00', '03/10/2019 02:30:00',
+                               '10/22/2019', '7/4/2019 12:00:00'])
+        timestamps = maccor_timestamps(date_time)
+        self.assertEqual(timestamps.dtype, 'datetime64[ns, UTC]')
+        for timestamp, x in zip(timestamps, date_time):
+            self.assertEqual(timestamp, pd.Timestamp(maccor_timestamp(x)))
+
+        raw_cycler_run = RawCyclerRun.from_maccor_file(self.maccor_file_timezone, include_eis=False)
+        self.assertEqual(raw_cycler_run.data.date_time_iso.dtype, 'datetime64[ns, UTC]')
+        self.assertEqual(raw_cycler_run.data.date_time_iso.iloc[0],
+                         pd.Timestamp(maccor_timestamp(raw_cycler_run.data.date_time.iloc[0])))
+
+    def test_quantity_sums_maccor(self):
+        for maccor_file in [self.maccor_file, self.maccor_file_timezone,
+                            self.maccor_file_timestamp, self.maccor_file_paused]:
+            raw_cycler_run = RawCyclerRun.from_maccor_file(maccor_file, include_eis=False)
+            data = raw_cycler_run.data
+            quantity_sums = RawCyclerRun.get_maccor_quantity_sums(data)
+            for quantity, state_type in [('capacity', 'charge'), ('capacity', 'discharge'),
+                                         ('energy', 'charge'), ('energy', 'discharge')]:
+                column = "{}_{}".format(state_type, quantity)
+                expected = sum_maccor_quantity(data, quantity, state_type).values
+                self.assertTrue(np.array_equal(quantity_sums[column].values, expected))
+                self.assertTrue(np.array_equal(data[column].values, expected))
+                self.assertTrue(np.array_equal(
+                    RawCyclerRun.get_maccor_quantity_sum(data, quantity, state_type).values, expected))
+
     # Note that the compression is from 45 M / 6 M as of 02/25/2019
     def test_binary_save(self):
         cycler_run = RawCyclerRun.from_file(self.arbin_file)
@@ -334,7 +440,9 @@ class RawCyclerRunTest(unittest.TestCase):
         self.assertTrue(interp3.current.mean() > 0)
         self.assertEqual(len(interp3.voltage), 10000)
         self.assertEqual(interp3.voltage.max(), np.float32(4.100838))
-        self.assertEqual(interp3.voltage.min(), np.float32(3.3334765))
+        # The voltage at the start of the charge, grid points just below a
+        # capacity repeated by the following step are bracketed by its first row
+        self.assertEqual(interp3.voltage.min(), np.float32(3.437705))
         np.testing.assert_almost_equal(interp3[interp3.charge_capacity <=
                                                interp3.charge_capacity.median()].current.iloc[0], 2.423209, decimal=6)
 
@@ -530,6 +638,23 @@ class RawCyclerRunTest(unittest.TestCase):
         paused = cycler_run.data.groupby('cycle_index').apply(determine_paused)
         self.assertEqual(paused.max(), 1)
 
+    def test_determine_paused_cycles(self):
+        for path in [self.maccor_file_paused, self.maccor_file_timezone]:
+            cycler_run = RawCyclerRun.from_file(path)
+            data = cycler_run.data
+            expected = data.groupby('cycle_index').apply(determine_paused)
+            paused = determine_paused_cycles(cycler_run.epoch_ns, data['cycle_index'])
+            self.assertEqual(paused.to_dict(), expected.to_dict())
+
+    def test_epoch_ns(self):
+        cycler_run = RawCyclerRun.from_file(self.maccor_file_timezone)
+        data = cycler_run.data
+        self.assertEqual(cycler_run.epoch_ns.dtype, np.int64)
+        self.assertTrue(np.array_equal(cycler_run.epoch_ns, datetime_to_epoch_ns(data['date_time_iso'])))
+        self.assertNotIn('epoch_ns', data)
+        summary = cycler_run.get_summary()
+        self.assertFalse(summary['charge_duration'].isnull().any())
+
 
 class CliTest(unittest.TestCase):
     def setUp(self):
@@ -571,6 +696,10 @@ class ProcessedCyclerRunTest(unittest.TestCase):
         self.maccor_file_w_diagnostics = os.path.join(TEST_FILE_DIR, "xTESLADIAG_000020_CH71.071")
         self.maccor_file_w_parameters = os.path.join(TEST_FILE_DIR, "PredictionDiagnostics_000109_tztest.010")
         self.pcycler_run_file = os.path.join(TEST_FILE_DIR, "2017-12-04_4_65C-69per_6C_CH29_processed.json")
+        self.diagnostic_available = {'parameter_set': 'Tesla21700',
+                                     'cycle_type': ['reset', 'hppc', 'rpt_0.2C', 'rpt_1C'],
+                                     'length': 4,
+                                     'diagnostic_starts_at': [86]}
 
     def test_from_raw_cycler_run_arbin(self):
         rcycler_run = RawCyclerRun.from_file(self.arbin_file)
@@ -733,11 +862,388 @@ class ProcessedCyclerRunTest(unittest.TestCase):
             self.assertTrue(np.all(loaded_processed_cycler_run.summary == loaded_from_raw.summary),
                             "Loaded processed cycler_run is not equal to that loaded from raw file")
 
+    def test_json_processing_workers(self):
+        with ScratchDir('.'):
+            os.environ['BEEP_PROCESSING_DIR'] = os.getcwd()
+            # Arbin file without its metadata file
+            with open("garbage_file.csv", "w") as f:
+                f.write("Data_Point,Test_Time\n0,1.0\n")
+            json_obj = {
+                        "mode": self.events_mode,
+                        "file_list": [self.maccor_file, "garbage_file.csv", "invalid_file",
+                                      self.maccor_file_w_parameters],
+                        'run_list': [0, 1, 2, 3],
+                        "validity": ['valid', 'valid', 'invalid', 'valid']
+                        }
+            sequential = json.loads(process_file_list_from_json(json.dumps(json_obj), workers=1))
+            parallel = json.loads(process_file_list_from_json(json.dumps(json_obj), workers=2))
+
+            for reloaded in [sequential, parallel]:
+                self.assertEqual(reloaded['invalid_file_list'], ['invalid_file'])
+                self.assertEqual(reloaded['run_list'], [0, 3])
+                self.assertEqual(reloaded['result_list'], ['success', 'success'])
+                self.assertEqual(reloaded['failed_file_list'], ['garbage_file.csv'])
+                self.assertEqual(reloaded['failed_run_list'], [1])
+                self.assertIn('FileNotFoundError', reloaded['failed_message_list'][0]['error'])
+                self.assertTrue(reloaded['file_list'][0].endswith('xTESLADIAG_000019_CH70_structure.json'))
+                self.assertTrue(reloaded['file_list'][1].endswith(
+                    'PredictionDiagnostics_000109_tztest_structure.json'))
+
+            # Files which failed to structure are not featurized
+            sequential['mode'] = self.events_mode
+            featurized = json.loads(featurize_file_list_from_json(json.dumps(sequential),
+                                                                  processed_dir=os.getcwd()))
+            self.assertEqual(set(featurized['run_list']), {0, 3})
+            self.assertNotIn('garbage_file.csv', featurized['file_list'])
+
+            loaded = loadfn(parallel['file_list'][0])
+            loaded_from_raw = RawCyclerRun.from_file(self.maccor_file).to_processed_cycler_run()
+            pd.testing.assert_frame_equal(loaded.summary.reset_index(drop=True),
+                                          loaded_from_raw.summary.reset_index(drop=True))
+
+    def test_json_processing_validate(self):
+        with ScratchDir('.'):
+            os.environ['BEEP_PROCESSING_DIR'] = os.getcwd()
+            json_obj = {
+                        "mode": self.events_mode,
+                        "file_list": [self.maccor_file, self.maccor_file_w_parameters, "unknown_file"],
+                        'run_list': [0, 1, 2]
+                        }
+            for workers in [1, 2]:
+                reloaded = json.loads(process_file_list_from_json(json.dumps(json_obj), workers=workers,
+                                                                  validate=True))
+                self.assertEqual(reloaded['validity'], ['valid', 'invalid', 'invalid'])
+                self.assertEqual(reloaded['invalid_file_list'],
+                                 [self.maccor_file_w_parameters, "unknown_file"])
+                self.assertEqual(reloaded['run_list'], [0])
+                self.assertEqual(reloaded['result_list'], ['success'])
+
+            loaded = loadfn(reloaded['file_list'][0])
+            loaded_from_raw = RawCyclerRun.from_file(self.maccor_file).to_processed_cycler_run()
+            pd.testing.assert_frame_equal(loaded.summary.reset_index(drop=True),
+                                          loaded_from_raw.summary.reset_index(drop=True))
+
+            with self.assertRaises(BeepValidationError):
+                structure_file(self.maccor_file_w_parameters, '.', validate=True)
+            with self.assertRaises(ValueError):
+                structure_file(self.maccor_file, '.', incremental=True, validate=True)
+
+    def test_json_processing_cache(self):
+        with ScratchDir('.'):
+            os.environ['BEEP_PROCESSING_DIR'] = os.getcwd()
+            json_obj = {
+                        "mode": self.events_mode,
+                        "file_list": [self.maccor_file, self.maccor_file_w_parameters],
+                        'run_list': [0, 1],
+                        "validity": ['valid', 'valid']
+                        }
+            first = json.loads(process_file_list_from_json(json.dumps(json_obj), cache_dir='cache'))
+            self.assertEqual((first['cache_hits'], first['cache_misses']), (0, 2))
+            os.remove(first['file_list'][0])
+            second = json.loads(process_file_list_from_json(json.dumps(json_obj), cache_dir='cache',
+                                                            workers=2))
+            self.assertEqual((second['cache_hits'], second['cache_misses']), (2, 0))
+            self.assertEqual(second['file_list'], first['file_list'])
+            loaded = loadfn(second['file_list'][0])
+            loaded_from_raw = RawCyclerRun.from_file(self.maccor_file).to_processed_cycler_run()
+            pd.testing.assert_frame_equal(loaded.summary.reset_index(drop=True),
+                                          loaded_from_raw.summary.reset_index(drop=True))
+
+            # Only the most recently used entry fits
+            cache = StructuringCache('cache', max_bytes=os.path.getsize(second['file_list'][1]))
+            self.assertTrue(cache.get(cache.key(self.maccor_file_w_parameters), "reused.json"))
+            cache.evict()
+            self.assertEqual(len(os.listdir('cache')), 1)
+            self.assertFalse(cache.get(cache.key(self.maccor_file), "reused.json"))
+            self.assertTrue(cache.get(cache.key(self.maccor_file_w_parameters), "reused.json"))
+
+            # Entries structured without validation are not used with it
+            del json_obj['validity']
+            for hits, misses in [(0, 1), (1, 0)]:
+                validated = json.loads(process_file_list_from_json(json.dumps(json_obj), cache_dir='cache',
+                                                                   validate=True))
+                self.assertEqual(validated['validity'], ['valid', 'invalid'])
+                self.assertEqual(validated['invalid_file_list'], [self.maccor_file_w_parameters])
+                self.assertEqual((validated['cache_hits'], validated['cache_misses']), (hits, misses))
+
+    def test_save_load_hdf5(self):
+        with ScratchDir('.'):
+            pcycler_run = ProcessedCyclerRun.from_raw_cycler_run(RawCyclerRun.from_file(self.maccor_file_w_parameters),
+                                                                 diagnostic_available=self.diagnostic_available)
+            self.assertFalse(pcycler_run.diagnostic_interpolated.empty)
+            pcycler_run.save("processed.hdf5")
+            loaded = ProcessedCyclerRun.load("processed.hdf5")
+            self.assertEqual(loaded.barcode, pcycler_run.barcode)
+            self.assertEqual(loaded.protocol, pcycler_run.protocol)
+            self.assertEqual(loaded.channel_id, pcycler_run.channel_id)
+            for table in ProcessedCyclerRun.TABLE_ORDER:
+                df = getattr(pcycler_run, table)
+                if df is None:
+                    self.assertTrue(getattr(loaded, table).empty)
+                elif df.empty:
+                    self.assertTrue(getattr(loaded, table).empty)
+                    self.assertEqual(getattr(loaded, table).columns.tolist(), df.columns.tolist())
+                else:
+                    pd.testing.assert_frame_equal(getattr(loaded, table), df)
+
+            # Column projection without loading the whole table
+            voltage = pd.read_hdf("processed.hdf5", "diagnostic_interpolated",
+                                  columns=["voltage", "cycle_index"])
+            self.assertEqual(list(voltage.columns), ["voltage", "cycle_index"])
+
+            # Json remains the default and round-trips through the same api
+            pcycler_run.save("processed.json")
+            loaded = ProcessedCyclerRun.load("processed.json")
+            self.assertIsInstance(loaded, ProcessedCyclerRun)
+
+    def test_lazy_load(self):
+        with ScratchDir('.'):
+            pcycler_run = ProcessedCyclerRun.from_raw_cycler_run(RawCyclerRun.from_file(self.maccor_file_w_parameters),
+                                                                 diagnostic_available=self.diagnostic_available)
+            self.assertFalse(pcycler_run.diagnostic_interpolated.empty)
+            pcycler_run.save("processed.hdf5")
+            pcycler_run.save("processed.json")
+            columns = {'cycles_interpolated': ['cycle_index', 'voltage', 'step_type']}
+            for filename in ["processed.hdf5", "processed.json"]:
+                lazy = LazyProcessedCyclerRun(filename, columns=columns)
+                self.assertEqual(lazy.barcode, pcycler_run.barcode)
+                if filename.endswith(".hdf5"):
+                    self.assertNotIn('diagnostic_interpolated', lazy.__dict__)
+                    self.assertNotIn('cycles_interpolated', lazy.__dict__)
+                self.assertEqual(list(lazy.cycles_interpolated.columns), ['cycle_index', 'voltage', 'step_type'])
+                self.assertTrue(np.array_equal(lazy.v_interpolated, pcycler_run.v_interpolated))
+                if filename.endswith(".hdf5"):
+                    self.assertNotIn('diagnostic_interpolated', lazy.__dict__)
+                pd.testing.assert_frame_equal(lazy.diagnostic_interpolated, pcycler_run.diagnostic_interpolated)
+                self.assertEqual(lazy.get_cycle_life(), pcycler_run.get_cycle_life())
+            with self.assertRaises(AttributeError):
+                lazy.not_an_attribute
+            dumpfn(lazy, "lazy.json")
+            self.assertIsInstance(loadfn("lazy.json"), ProcessedCyclerRun)
+
+    def test_json_processing_hdf5(self):
+        with ScratchDir('.'):
+            os.environ['BEEP_PROCESSING_DIR'] = os.getcwd()
+            json_obj = {
+                        "mode": self.events_mode,
+                        "file_list": [self.maccor_file],
+                        'run_list': [0],
+                        "validity": ['valid']
+                        }
+            reloaded = json.loads(process_file_list_from_json(json.dumps(json_obj), output_format='hdf5'))
+            self.assertEqual(reloaded['result_list'], ['success'])
+            self.assertTrue(reloaded['file_list'][0].endswith('xTESLADIAG_000019_CH70_structure.hdf5'))
+            loaded = ProcessedCyclerRun.load(reloaded['file_list'][0])
+            self.assertIsInstance(loaded, ProcessedCyclerRun)
+            self.assertEqual(loaded.summary.cycle_index.tolist(), [0, 1, 2])
+
+    def test_structure_file_incrementally(self):
+        maccor_file = os.path.join(TEST_FILE_DIR, "xTESLADIAG_000038.078")
+        with open(maccor_file, 'rb') as f:
+            lines = f.readlines()
+        with ScratchDir('.'):
+            os.environ['BEEP_PROCESSING_DIR'] = os.getcwd()
+            filename = os.path.join(os.getcwd(), "xTESLADIAG_000038.078")
+            first_cycles = []
+            for n_lines in [len(lines) // 2, 3 * len(lines) // 4, len(lines)]:
+                # End with a partially written line, except for the full file
+                with open(filename, 'wb') as f:
+                    f.write(b''.join(lines[:n_lines]) + b''.join(lines[n_lines:n_lines + 1])[:20])
+                processed_loc = structure_file(filename, os.getcwd(), incremental=True)
+                checkpoint = loadfn(processed_loc.replace(".json", STRUCTURE_CHECKPOINT_EXTENSION))
+                first_cycles.append(checkpoint['first_cycle'])
+            self.assertEqual(first_cycles, sorted(first_cycles))
+            self.assertLess(first_cycles[0], first_cycles[-1])
+
+            processed = ProcessedCyclerRun.load(processed_loc)
+            RawCyclerRun.from_file(filename).to_processed_cycler_run().save("full_structure.json")
+            expected = ProcessedCyclerRun.load("full_structure.json")
+            pd.testing.assert_frame_equal(processed.summary, expected.summary)
+            pd.testing.assert_frame_equal(processed.cycles_interpolated, expected.cycles_interpolated)
+            np.testing.assert_array_equal(processed.v_interpolated, expected.v_interpolated)
+
     def test_auto_load(self):
         loaded = ProcessedCyclerRun.auto_load(self.arbin_file)
         self.assertIsInstance(loaded, ProcessedCyclerRun)
 
 
+def sum_maccor_quantity(data, quantity, state_type):
+    """Reference step-by-step implementation of get_maccor_quantity_sum"""
+    state_code = MACCOR_CONFIG["{}_state_code".format(state_type)]
+    quantity_agg = data['_' + quantity].where(data['_state'] == state_code, other=0.0, axis=0)
+    end_step = data['_ending_status'].apply(lambda x: MACCOR_CONFIG['end_step_code_min'] <= x
+                                            <= MACCOR_CONFIG['end_step_code_max'])
+    end_step_inds = end_step.index[end_step]
+    if end_step_inds.size == 0:
+        return quantity_agg
+
+    lastindex = quantity_agg.size - 1
+    for i, istep in enumerate(end_step_inds):
+        if i > 0:
+            quantity_agg[istep_old+1:istep+1] += cycle_sum
+        if istep == lastindex:
+            cycle_sum = 0.
+        elif data.loc[istep+1, 'cycle_index'] != data.loc[istep, 'cycle_index']:
+            cycle_sum = 0.
+        else:
+            cycle_sum = quantity_agg[istep]
+        istep_old = istep
+    if end_step_inds[-1] < lastindex:
+        quantity_agg[istep_old+1:] += cycle_sum
+    return quantity_agg
+
+
+def make_synthetic_run_data(n_cycles=6, n_points=150, seed=0):
+    """Charge/discharge cycles with strictly monotonic voltage and capacity"""
+    rng = np.random.RandomState(seed)
+    frames = []
+    for cycle in range(n_cycles):
+        capacity = np.sort(rng.uniform(0, 1.1, n_points))
+        charge = pd.DataFrame({
+            "step_index": 1, "charge_capacity": capacity, "discharge_capacity": 0.0,
+            "voltage": 2.7 + 0.9 * capacity / 1.1 + rng.uniform(0, 1e-4, n_points).cumsum(),
+            "current": 1.0 + rng.normal(0, 0.01, n_points)})
+        capacity = np.sort(rng.uniform(0, 1.05, n_points))
+        discharge = pd.DataFrame({
+            "step_index": 2, "charge_capacity": charge.charge_capacity.max(),
+            "discharge_capacity": capacity,
+            "voltage": 3.6 - 0.9 * capacity / 1.05 - rng.uniform(0, 1e-4, n_points).cumsum(),
+            "current": -1.0 + rng.normal(0, 0.01, n_points)})
+        frame = pd.concat([charge, discharge], ignore_index=True)
+        frame["cycle_index"] = cycle
+        frames.append(frame)
+    data = pd.concat(frames, ignore_index=True)
+    data["test_time"] = np.arange(len(data)) * 10.0
+    data["internal_resistance"] = rng.uniform(0.01, 0.02, len(data))
+    data["temperature"] = rng.uniform(25, 35, len(data))
+    data.loc[rng.choice(len(data), 50), "temperature"] = np.nan
+    return data
+
+
+def merge_interpolated_data(dataframe, field_name, field_range, columns, resolution):
+    """Reference merge/interpolate implementation of get_interpolated_data"""
+    columns = list(set(columns) | {field_name})
+    df = dataframe.loc[:, columns]
+    interpolated_df = pd.DataFrame({field_name: np.linspace(*field_range, resolution),
+                                    "interpolated": True})
+    df['interpolated'] = False
+    interpolated_df = interpolated_df.merge(df, how='outer', on=field_name, sort=True)
+    interpolated_df = interpolated_df.set_index(field_name)
+    interpolated_df = interpolated_df.interpolate('slinear')
+    interpolated_df[['interpolated_x']] = interpolated_df[['interpolated_x']].fillna(False)
+    interpolated_df = interpolated_df[interpolated_df['interpolated_x'].astype(bool)]
+    interpolated_df = interpolated_df.drop(["interpolated_x", "interpolated_y"], axis=1)
+    interpolated_df = interpolated_df.reset_index()
+    return interpolated_df[~interpolated_df[field_name].duplicated()]
+
+
+class InterpolationTest(unittest.TestCase):
+    def setUp(self):
+        self.data = make_synthetic_run_data()
+        self.columns = ["voltage", "current", "charge_capacity", "discharge_capacity",
+                        "internal_resistance", "temperature"]
+
+    def test_interpolate_segments(self):
+        x = np.array([0., 1., 2., 0.5, 1.5, 10., 20.])
+        y = np.array([0., 10., 20., 5., 15., 1., 2.])
+        x_interp = np.array([-1., 0.5, 2., 2.5, 0.5, 1., 1.5, 15.])
+        result = interpolate_segments(x, y, [0, 3, 5, 7], x_interp, [0, 4, 7, 8])
+        self.assertTrue(np.isnan(result[[0, 3]]).all())
+        np.testing.assert_allclose(result[[1, 2, 4, 5, 6, 7]], [5., 20., 5., 10., 15., 1.5])
+        two_columns = interpolate_segments(x, np.stack([y, 2 * y], axis=1), [0, 3, 5, 7],
+                                           x_interp, [0, 4, 7, 8])
+        np.testing.assert_allclose(two_columns[:, 1], 2 * result)
+
+    def test_get_interpolated_data_parity(self):
+        cycle = self.data[(self.data.cycle_index == 2) & (self.data.step_index == 2)]
+        for field_name, field_range in [("voltage", [2.8, 3.5]),
+                                        ("discharge_capacity", [0, 1.1]),
+                                        ("test_time", [cycle.test_time.min(), cycle.test_time.max()])]:
+            interpolated = get_interpolated_data(cycle, field_name, field_range,
+                                                 self.columns, resolution=400)
+            reference = merge_interpolated_data(cycle, field_name, field_range,
+                                                self.columns, resolution=400)
+            pd.testing.assert_frame_equal(interpolated,
+                                          reference[interpolated.columns].reset_index(drop=True))
+
+    def test_get_interpolated_steps_parity(self):
+        raw_cycler_run = RawCyclerRun(self.data, {})
+        for step_type, axis in [("discharge", "voltage"), ("charge", "charge_capacity"),
+                                ("charge", "test_time")]:
+            interpolated = raw_cycler_run.get_interpolated_steps(
+                [2.8, 3.5], 500, step_type=step_type, reg_cycles=[0, 1, 3, 4, 5], axis=axis)
+            step_index = 2 if step_type == "discharge" else 1
+            reference = []
+            for cycle_index in [0, 1, 3, 4, 5]:
+                step = self.data[(self.data.cycle_index == cycle_index)
+                                 & (self.data.step_index == step_index)]
+                if axis == "voltage":
+                    axis_range = [2.8, 3.5]
+                elif axis == "test_time":
+                    axis_range = [step[axis].min(), step[axis].max()]
+                else:
+                    axis_range = [self.data[axis].min(), self.data[axis].max()]
+                cycle_df = merge_interpolated_data(step, axis, axis_range, self.columns, 500)
+                cycle_df["cycle_index"] = cycle_index
+                reference.append(cycle_df)
+            reference = pd.concat(reference, ignore_index=True)
+            self.assertEqual(interpolated.step_type.unique().tolist(), [step_type])
+            pd.testing.assert_frame_equal(interpolated.drop(columns="step_type"),
+                                          reference[interpolated.columns.drop("step_type")],
+                                          check_dtype=False)
+
+
+class SegmentIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.maccor_file = os.path.join(TEST_FILE_DIR, "xTESLADIAG_000019_CH70.070")
+
+    def test_cycle_rows(self):
+        cycler_run = RawCyclerRun.from_file(self.maccor_file)
+        data = cycler_run.data
+        index = cycler_run.segment_index
+        self.assertIs(index, cycler_run.segment_index)
+        self.assertEqual(index.cycles.tolist(), [0, 1, 2])
+        for cycle_index in index.cycles:
+            np.testing.assert_array_equal(index.cycle_rows(cycle_index),
+                                          np.flatnonzero(data.cycle_index == cycle_index))
+        np.testing.assert_array_equal(index.cycle_rows([2, 0, 5]),
+                                      np.flatnonzero(data.cycle_index.isin([0, 2])))
+
+    def test_step_index_counter(self):
+        data = make_synthetic_run_data(n_cycles=3, n_points=5)
+        # Repeat the charge step of cycle 1 after its discharge step
+        data.loc[(data.cycle_index == 1) & (data.index % 10 >= 8), 'step_index'] = 1
+        # Shuffle the cycles so that cycle 2 comes first
+        data = pd.concat([data[data.cycle_index == 2], data[data.cycle_index < 2]], ignore_index=True)
+        index = SegmentIndex(data)
+        self.assertEqual(index.cycles.tolist(), [0, 1, 2])
+        self.assertEqual(index.steps.step_index.tolist(), [1, 2, 1, 2, 1, 1, 2])
+        self.assertEqual(index.steps.step_index_counter.tolist(), [1, 2, 1, 2, 3, 1, 2])
+        expected = data.groupby('cycle_index').step_index.transform(
+            lambda steps: steps.ne(steps.shift()).cumsum())
+        np.testing.assert_array_equal(index.step_index_counter(), expected.values)
+        rows = index.order[index.steps.start[4]:index.steps.stop[4]]
+        self.assertEqual(data.loc[rows, 'step_index'].tolist(), [1, 1])
+
+    def test_reductions(self):
+        data = make_synthetic_run_data(n_cycles=3, n_points=5)
+        data.loc[data.index % 7 == 0, 'voltage'] = np.nan
+        data.loc[data.cycle_index == 1, 'current'] = np.nan
+        data = pd.concat([data[data.cycle_index == 2], data[data.cycle_index < 2]], ignore_index=True)
+        index = SegmentIndex(data)
+        grouped = data.groupby('cycle_index')
+        np.testing.assert_array_equal(index.reduce_cycles(np.fmax, data.voltage.values),
+                                      grouped.voltage.max().values)
+        np.testing.assert_array_equal(index.reduce_cycles(np.fmin, data.current.values),
+                                      grouped.current.min().values)
+        np.testing.assert_array_equal(index.first_valid(data.voltage.values),
+                                      grouped.voltage.first().values)
+        np.testing.assert_array_equal(index.last_valid(data.voltage.values),
+                                      grouped.voltage.last().values)
+        np.testing.assert_array_equal(index.last_valid(data.current.values, fill=-1.0),
+                                      grouped.current.last().fillna(-1.0).values)
+
+
 class EISpectrumTest(unittest.TestCase):
     def setUp(self):
         pass
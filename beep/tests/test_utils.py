@@ -0,0 +1,29 @@
+# Copyright 2019 Toyota Research Institute. All rights reserved.
+"""Unit tests related to beep utilities"""
+
+import os
+import hashlib
+import unittest
+from beep.utils import hash_file, hash_files
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_FILE_DIR = os.path.join(TEST_DIR, "test_files")
+
+
+class HashTest(unittest.TestCase):
+    def setUp(self):
+        self.filenames = [os.path.join(TEST_FILE_DIR, "xTESLADIAG_000038.078"),
+                          os.path.join(TEST_FILE_DIR, "xTESLADIAG_000038con.078")]
+
+    def test_hash_file(self):
+        with open(self.filenames[0], 'rb') as f:
+            contents = f.read()
+        self.assertEqual(hash_file(self.filenames[0]), hashlib.md5(contents).digest())
+        self.assertEqual(hash_file(self.filenames[0], chunksize=1000), hashlib.md5(contents).digest())
+        self.assertEqual(hash_file(self.filenames[0], algorithm='blake2b'),
+                         hashlib.blake2b(contents).digest())
+
+    def test_hash_files(self):
+        hashes = hash_files(self.filenames, algorithm='blake2b', workers=2)
+        self.assertEqual(hashes, [hash_file(filename, algorithm='blake2b') for filename in self.filenames])
+        self.assertNotEqual(hashes[0], hashes[1])
@@ -8,7 +8,7 @@ import pandas as pd
 import numpy as np
 from monty.tempfile import ScratchDir
 from beep.validate import ValidatorBeep, validate_file_list_from_json, \
-    SimpleValidator
+    SimpleValidator, CompiledSchema, ValidationRecords
 from beep import S3_CACHE, VALIDATION_SCHEMA_DIR
 from beep.utils.secrets_manager import event_setup
 TEST_DIR = os.path.dirname(__file__)
@@ -77,25 +77,23 @@ class ValidationArbinTest(unittest.TestCase):
         paths = [os.path.join(TEST_FILE_DIR, path) for path in paths]
         v = ValidatorBeep()
 
-        temp_records = os.path.join(TEST_FILE_DIR, 'temp_records.json')
-        with open(temp_records, 'w') as f:
-            f.write("{}")
-
         results = v.validate_from_paths(paths, record_results=False)
         self.assertFalse(results["2017-05-09_test-TC-contact_CH33.csv"]["validated"])
         errmsg = results["2017-05-09_test-TC-contact_CH33.csv"]["errors"]['cycle_index'][0][0][0]
         self.assertEqual(errmsg, 'must be of number type')
         self.assertTrue(results["2017-12-04_4_65C-69per_6C_CH29.csv"]["validated"])
 
-        v.validate_from_paths(paths, record_results=True, record_path=temp_records)
-        with open(temp_records, 'r') as f:
-            results_form_rec = json.load(f)
+        with ScratchDir('.'):
+            temp_records = os.path.join(os.getcwd(), 'temp_records.db')
+            v.validate_from_paths(paths, record_results=True, record_path=temp_records)
+            key = ValidationRecords.keys(paths[:1])[0]
+            results_form_rec = ValidationRecords(temp_records).get([key])
 
-        self.assertFalse(results_form_rec["2017-05-09_test-TC-contact_CH33.csv"]["validated"])
+            self.assertFalse(results_form_rec[key]["validated"])
 
-        results = v.validate_from_paths(paths, record_results=True, skip_existing=True,
-                                        record_path=temp_records)
-        self.assertEqual(results, {})
+            results = v.validate_from_paths(paths, record_results=True, skip_existing=True,
+                                            record_path=temp_records)
+            self.assertEqual(results, {})
 
     @unittest.skip
     def test_bad_file(self):
@@ -165,14 +163,95 @@ class ValidationMaccorTest(unittest.TestCase):
         with ScratchDir('.') as scratch_dir:
             # Run validation on everything
             v = SimpleValidator()
+            record_path = os.path.join(scratch_dir, 'validation_records.db')
             validate_record = v.validate_from_paths(paths, record_results=True,
                                                     skip_existing=False,
-                                                    record_path=os.path.join(scratch_dir, 'validation_records.json'))
-            df = pd.DataFrame(v.validation_records)
+                                                    record_path=record_path)
+            records = v.validation_records.get(ValidationRecords.keys(paths))
+            df = pd.DataFrame({name: record for (name, _), record in records.items()})
             df = df.transpose()
             self.assertEqual(df.loc["xTESLADIAG_000019_CH70.070", "method"], "simple_maccor")
             self.assertEqual(df.loc["xTESLADIAG_000019_CH70.070", "validated"], True)
 
+            # Files are skipped while their content is unchanged
+            self.assertEqual(v.validate_from_paths(paths, record_results=True, skip_existing=True,
+                                                   record_path=record_path), {})
+            with open(paths[0]) as f:
+                lines = f.readlines()
+            changed = os.path.join(scratch_dir, "xTESLADIAG_000019_CH70.070")
+            with open(changed, 'w') as f:
+                f.writelines(lines[:-1])
+            results = v.validate_from_paths([changed], record_results=True, skip_existing=True,
+                                            record_path=record_path)
+            self.assertEqual(list(results), ["xTESLADIAG_000019_CH70.070"])
+            self.assertEqual(len(ValidationRecords(record_path)), 2)
+
+    def test_validation_records(self):
+        with ScratchDir('.'):
+            records = ValidationRecords("records.db")
+            keys = [("file_{}.csv".format(n), "{:032x}".format(n)) for n in range(1000)]
+            records.put((key, {"validated": n % 2 == 0, "method": "simple_arbin",
+                               "errors": "" if n % 2 == 0 else {"cycle_index": ["error"]},
+                               "time": "now"}) for n, key in enumerate(keys))
+            records.put([(keys[1], {"validated": True, "method": "simple_arbin",
+                                    "errors": "", "time": "later"})])
+            self.assertEqual(len(records), 1000)
+            found = records.get(keys[::3] + [("file_1.csv", "other hash")])
+            self.assertEqual(sorted(found), sorted(keys[::3]))
+            self.assertEqual(found[keys[3]], {"validated": False, "method": "simple_arbin",
+                                              "errors": {"cycle_index": ["error"]}, "time": "now"})
+            self.assertEqual(records.get([keys[1]])[keys[1]]["time"], "later")
+
+
+    def test_validator_beep_maccor(self):
+        path = os.path.join(TEST_FILE_DIR, "xTESLADIAG_000019_CH70.070")
+        schema = os.path.join(VALIDATION_SCHEMA_DIR, "schema-maccor-2170.yaml")
+        df = pd.read_csv(path, delimiter='\t', skiprows=1)
+        df['State'] = df['State'].astype(str)
+
+        v = ValidatorBeep()
+        v.allow_unknown = True
+        self.assertTrue(v.validate_maccor_dataframe(df, schema=schema))
+        self.assertEqual(v.errors, {})
+
+        # Errors are reported for the first cycle with errors, by position in the cycle
+        first_cycle = df['Cyc#'] == df['Cyc#'].min()
+        position = 3
+        df.loc[np.flatnonzero(first_cycle)[position], 'Volts'] = 0.5
+        df.loc[np.flatnonzero(~first_cycle)[0], 'Volts'] = 5.0
+        self.assertFalse(v.validate_maccor_dataframe(df, schema=schema))
+        self.assertEqual(v.errors, {'volts': [{position: ['min value is 1.2']}]})
+
+        # NaN is a float, so it doesn't fail the type rule of float columns
+        df.loc[np.flatnonzero(first_cycle)[position], 'Volts'] = np.nan
+        df.loc[np.flatnonzero(~first_cycle)[0], 'Volts'] = 4.0
+        self.assertTrue(v.validate_maccor_dataframe(df, schema=schema))
+        self.assertEqual(v.errors, {})
+
+        df.loc[0, 'Cyc#'] = np.nan
+        self.assertFalse(v.validate_maccor_dataframe(df, schema=None))
+        self.assertEqual(v.errors['cyc#'][0][0][0], 'must be of number type')
+
+
+class CompiledSchemaTest(unittest.TestCase):
+    def test_rules(self):
+        schema = CompiledSchema({'a': {'schema': {'type': 'integer', 'min': 0, 'max_at_least': 5}},
+                                 'b': {'schema': {'type': 'float', 'nullable': False, 'max': 1.0}}})
+        df = pd.DataFrame({'a': [1.0, 2.5, -1.0], 'b': [0.5, np.nan, 2.0]})
+        a, b = schema.columns
+        violations = {rule: list(mask) for rule, _, mask in
+                      schema.row_violations(a, df['a'], element_types=True)}
+        self.assertEqual(violations, {'type': [True, True, True], 'min': [False, False, False]})
+        violations = {rule: list(mask) for rule, _, mask in schema.row_violations(a, df['a'])}
+        self.assertEqual(violations, {'min': [False, False, True]})
+        violations = {rule: list(mask) for rule, _, mask in schema.row_violations(b, df['b'])}
+        self.assertEqual(violations, {'nullable': [False, True, False], 'max': [False, False, True]})
+        self.assertEqual(list(schema.column_violations(a, df['a'])), [('max_at_least', 5, 2.5)])
+        self.assertEqual(schema.first_index(np.array([False, True, True])), 1)
+        self.assertIsNone(schema.first_index(np.array([False, False])))
+        with self.assertRaises(ValueError):
+            CompiledSchema({'a': {'schema': {'regex': '.*'}}})
+
 
 class ValidationEisTest(unittest.TestCase):
     # To further develop
@@ -291,6 +370,60 @@ class SimpleValidatorTest(unittest.TestCase):
         self.assertEqual(loaded['validity'][0], 'invalid')
         self.assertEqual(loaded['validity'][1], 'valid')
 
+    def test_check_column(self):
+        schema = CompiledSchema({'a': {'schema': {'type': 'integer', 'min': 0, 'max_at_least': 5}},
+                                 'b': {'schema': {'type': 'float', 'nullable': False, 'max': 1.0}}})
+        a, b = schema.columns
+        self.assertEqual(SimpleValidator.check_column(schema, a, pd.Series([1.0, 4.0, 3.0])),
+                         ('', 1.0, 4.0))
+        self.assertEqual(SimpleValidator.check_column(schema, b, pd.Series([1.0, -1.0]).astype(int),
+                                                      check_dtype=False), ('', -1, 1))
+        reason, _, _ = SimpleValidator.check_column(schema, a, pd.Series([1.0, 2.5, 3.5]), offset=10)
+        self.assertEqual(reason, "Column a: integer type check failed at index 11 with value 2.5")
+        reason, _, _ = SimpleValidator.check_column(schema, a, pd.Series([1, -2, -3]))
+        self.assertEqual(reason, "a is lower than allowed min 0 at index 1:value=-2")
+        reason, _, _ = SimpleValidator.check_column(schema, b, pd.Series([0.5, 2.0, np.nan]))
+        self.assertEqual(reason, "b is null at index 2")
+        self.assertEqual(SimpleValidator.check_type(pd.Series([1, 2]), "integer"), (True, ""))
+        self.assertEqual(SimpleValidator.extrema(np.array([np.nan, 2.0, -1.0])), (-1.0, 2.0))
+
+    def test_validate_chunks(self):
+        v = SimpleValidator()
+        v.schema = {'a': {'schema': {'type': 'integer', 'max': 10, 'max_at_least': 5}},
+                    'b': {'schema': {'type': 'float', 'min_is_below': 1.0}}}
+        df = pd.DataFrame({'a': [1, 2, 3, 6], 'b': [3.0, 2.0, 1.0, 0.5]})
+        chunks = [df.iloc[:2], df.iloc[2:].astype({'b': int})]
+        self.assertEqual(v.validate_chunks(chunks), (True, ''))
+        self.assertEqual(v.validate_chunks([df.iloc[:3]]), v.validate(df.iloc[:3]))
+
+        # Integer columns fail the float type check
+        chunks = [df.iloc[:2].astype({'b': int}), df.iloc[2:].astype({'b': int})]
+        self.assertEqual(v.validate_chunks(chunks), v.validate(df.astype({'b': int})))
+
+        # Parsing stops at the first chunk with a violation
+        bad = df.copy()
+        bad.loc[2, 'a'] = 11
+        chunks = iter([bad.iloc[:2], bad.iloc[2:3], bad.iloc[3:]])
+        validity, reason = v.validate_chunks(chunks)
+        self.assertFalse(validity)
+        self.assertEqual(reason, v.validate(bad)[1])
+        self.assertEqual(len(list(chunks)), 1)
+
+    def test_validate_from_paths_chunks(self):
+        paths = [os.path.join(TEST_FILE_DIR, path) for path in
+                 ["xTESLADIAG_000019_CH70.070", "PredictionDiagnostics_000109_tztest.010",
+                  "FastCharge_000025_CH8.csv", "2017-05-09_test-TC-contact_CH33.csv"]]
+        v = SimpleValidator()
+        results = v.validate_from_paths(paths)
+        for workers, chunksize in [(1, 100), (2, 1000), (2, None)]:
+            chunk_results = v.validate_from_paths(paths, workers=workers, chunksize=chunksize)
+            self.assertEqual(list(chunk_results), list(results))
+            for name, result in results.items():
+                self.assertEqual(chunk_results[name]['validated'], result['validated'])
+                self.assertEqual(chunk_results[name]['errors'], result['errors'])
+        self.assertEqual([result['validated'] for result in results.values()],
+                         [True, False, False, False])
+
     @unittest.skipUnless(False, "toggle this test")
     def test_heavy(self):
         # Sync all S3 objects
@@ -305,7 +438,7 @@ class SimpleValidatorTest(unittest.TestCase):
         v = SimpleValidator()
         validate_record = v.validate_from_paths(paths, record_results=True,
                                                 skip_existing=True)
-        df = pd.DataFrame(v.validation_records)
+        df = pd.DataFrame(validate_record)
         df = df.transpose()
         print(df)
         print("{} valid, {} invalid".format(
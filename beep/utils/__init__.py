@@ -2,10 +2,15 @@ import os
 import hashlib
 import json
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from .events import Logger, KinesisEvents
 from .splice import MaccorSplice
 from pydash import get, set_with, unset, merge
 
+# Number of bytes of a file hashed at a time
+HASH_CHUNKSIZE = 1024 * 1024
+
 
 class DashOrderedDict(OrderedDict):
     """
@@ -40,16 +45,42 @@ class DashOrderedDict(OrderedDict):
         return self.__str__()
 
 
-def hash_file(filename):
+def hash_file(filename, algorithm='md5', chunksize=HASH_CHUNKSIZE):
     """
-    Utility function to hash a file
+    Utility function to hash a file, read in chunks so that
+    memory use doesn't grow with the size of the file
 
     Args:
         filename (str): name fo file to hash
+        algorithm (str): name of a hashlib algorithm, e. g. md5 or
+            the faster blake2b
+        chunksize (int): number of bytes read at a time
+
+    Returns:
+        bytes: digest of the file contents
     """
+    file_hash = hashlib.new(algorithm)
     with open(filename, 'rb') as f:
-        chunk = f.read()
-    return hashlib.md5(chunk).digest()
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            file_hash.update(chunk)
+    return file_hash.digest()
+
+
+def hash_files(filenames, algorithm='md5', workers=4):
+    """
+    Utility function to hash many files concurrently, hashlib
+    releases the GIL while hashing so threads hash in parallel
+
+    Args:
+        filenames (list): names of files to hash
+        algorithm (str): name of a hashlib algorithm, see hash_file
+        workers (int): number of threads to hash files with
+
+    Returns:
+        list: digest of each file in the order of filenames
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(partial(hash_file, algorithm=algorithm), filenames))
 
 
 def os_format(json_string):
@@ -4,15 +4,20 @@ Module and script for validating battery cycler flat files using dictionary
 key or DataFrame based validation of typing, min/max, and non-allowed values
 
 Usage:
-    validate [INPUT_JSON]
+    validate [INPUT_JSON] [--workers=<n>] [--chunksize=<n>]
 
 Options:
-    -h --help       Show this screen
-    --version       Show version
+    -h --help           Show this screen
+    --version           Show version
+    --workers=<n>       Number of processes to validate files with [default: 1]
+    --chunksize=<n>     Validate csv files while parsing them this many rows at a time
 
 The validation script, `validate`, runs the validation procedure contained
 in beep.validate on renamed files according to the output of `collate`.
-It also updates a general json validation record in `/data-share/validation/validation.json`.
+It also records the validation results in a local SQLite store, see `ValidationRecords`.
+With `--chunksize`, files are validated chunk by chunk as they are parsed and invalid
+files are mostly rejected before they are parsed completely, see
+`SimpleValidator.validate_chunks`.
 
 The input json must contain the following fields
 
@@ -42,33 +47,438 @@ import json
 import os
 import warnings
 import re
+import sqlite3
+from collections import namedtuple
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
 from docopt import docopt
 from cerberus import Validator
 from beep import tqdm
-from monty.serialization import loadfn, dumpfn
+from monty.serialization import loadfn
 
 from beep import VALIDATION_SCHEMA_DIR, ENVIRONMENT
 from beep.conversion_schemas import ARBIN_CONFIG, MACCOR_CONFIG
-from beep.utils import KinesisEvents
+from beep.utils import KinesisEvents, hash_files
 from beep import logger, __version__
 
 DEFAULT_ARBIN_SCHEMA = os.path.join(VALIDATION_SCHEMA_DIR, "schema-arbin-lfp.yaml")
 DEFAULT_MACCOR_SCHEMA = os.path.join(VALIDATION_SCHEMA_DIR, "schema-maccor-lfp.yaml")
 DEFAULT_EIS_SCHEMA = os.path.join(VALIDATION_SCHEMA_DIR, "schema-maccor-eis.yaml")
-DEFAULT_VALIDATION_RECORDS = os.path.join(VALIDATION_SCHEMA_DIR, "validation_records.json")
+DEFAULT_VALIDATION_RECORDS = os.path.join(VALIDATION_SCHEMA_DIR, "validation_records.db")
 s = {'service': 'DataValidator'}
 
+# Schemas with which SimpleValidator validates each type of raw cycler file
+RAW_FILE_SCHEMAS = {'arbin': os.path.join(VALIDATION_SCHEMA_DIR, "schema-arbin-lfp.yaml"),
+                    'maccor': os.path.join(VALIDATION_SCHEMA_DIR, "schema-maccor-2170.yaml")}
+
+# Rules of the column schemas, row rules first, in the order they are checked
+SCHEMA_RULES = ('nullable', 'type', 'max', 'min', 'max_at_least', 'min_is_below')
+# NumPy dtype kinds whose elements satisfy each type rule of element-wise
+# (cerberus) type checking, e. g. booleans are integers but not numbers
+ELEMENT_TYPE_KINDS = {'integer': 'iub', 'float': 'fiub', 'number': 'fiu', 'numeric': 'fiu',
+                      'string': 'U', 'boolean': 'b'}
+# Python types of object elements that satisfy each type rule, and types excluded from them
+ELEMENT_TYPES = {'integer': ((int,), ()), 'float': ((float, int), ()), 'number': ((int, float), (bool,)),
+                 'numeric': ((int, float), (bool,)), 'string': ((str,), ()), 'boolean': ((bool,), ())}
+# Error messages of the rules in cerberus format, as reported by ValidatorBeep
+CERBERUS_MESSAGES = {'nullable': 'null value not allowed',
+                     'type': 'must be of {} type',
+                     'max': 'max value is {}',
+                     'min': 'min value is {}',
+                     'max_at_least': 'max value must be at least {}',
+                     'min_is_below': 'min value must be below {}'}
+
+ColumnSchema = namedtuple('ColumnSchema', ('name',) + SCHEMA_RULES)
+
+# Seconds a connection to the validation records waits for concurrent writers
+VALIDATION_RECORDS_TIMEOUT = 60
+# Number of keys looked up in the validation records per query, within the
+# limit of 999 parameters of a SQLite statement
+VALIDATION_RECORDS_BATCH_SIZE = 400
+
+
+class CompiledSchema(object):
+    """
+    Validation schema compiled into vectorized checks on the columns of a
+    DataFrame, shared by ValidatorBeep and SimpleValidator. Each rule is
+    evaluated on a whole column at once rather than on every element of
+    a dictionary of lists.
+
+    Row rules (nullable, type, max, min) produce a boolean mask of the
+    violating rows, while column rules (max_at_least, min_is_below) test
+    the extrema of the column.
+
+    Attributes:
+        columns ([ColumnSchema]): rules of each column, in schema order,
+            with None for the rules that are not set.
+    """
+
+    def __init__(self, schema):
+        """
+        Args:
+            schema (dict): cerberus-style validation schema, mapping column
+                names to a dictionary with the rules under the "schema" key.
+        """
+        self.columns = []
+        for column_name, value in schema.items():
+            column_schema = value.get('schema', {})
+            unsupported = set(column_schema) - set(SCHEMA_RULES)
+            if unsupported:
+                raise ValueError("Rules {} of column {} are not supported".format(
+                    sorted(unsupported), column_name))
+            self.columns.append(ColumnSchema(column_name, *[column_schema.get(rule) for rule in SCHEMA_RULES]))
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Args:
+            filename (str): yaml or json file with the validation schema.
+
+        Returns:
+            beep.validate.CompiledSchema: compiled schema.
+        """
+        return cls(loadfn(filename))
+
+    @staticmethod
+    def first_index(mask):
+        """
+        Args:
+            mask (numpy.ndarray): boolean mask.
+
+        Returns:
+            int: position of the first True element, or None if there is none.
+        """
+        index = int(np.argmax(mask)) if mask.size else 0
+        return index if mask.size and mask[index] else None
+
+    @staticmethod
+    def element_type_mask(values, type_rule):
+        """
+        Checks the type of each element of a column, as cerberus does for
+        the elements of a list, e. g. an integral float is not an integer.
+
+        Args:
+            values (pandas.Series): column.
+            type_rule (str): type rule, see ELEMENT_TYPE_KINDS.
+
+        Returns:
+            numpy.ndarray: mask of the elements of the wrong type.
+        """
+        if type_rule not in ELEMENT_TYPE_KINDS:
+            raise ValueError("type_rule {} not supported, please choose one of {}".format(
+                type_rule, ", ".join(ELEMENT_TYPE_KINDS)))
+        if values.dtype.kind != 'O':
+            return np.full(len(values), values.dtype.kind not in ELEMENT_TYPE_KINDS[type_rule])
+        allowed, excluded = ELEMENT_TYPES[type_rule]
+        return ~np.fromiter((isinstance(value, allowed) and not isinstance(value, excluded)
+                             for value in values.values), dtype=bool, count=len(values))
+
+    @staticmethod
+    def numeric_values(values):
+        """
+        Args:
+            values (pandas.Series): column.
+
+        Returns:
+            numpy.ndarray: values of the column, with NaN for non-numeric values.
+        """
+        if values.dtype.kind in 'fiub':
+            return values.values
+        return pd.to_numeric(values, errors='coerce').values
+
+    def row_violations(self, column, values, element_types=False):
+        """
+        Evaluates the row rules of a column. Null rows are exempt from all
+        rules if the column is nullable and violate the nullable rule if it
+        is explicitly not nullable. Otherwise, when types are checked by
+        element, they are checked as any other element, as in the cerberus
+        documents of each cycle, i. e. NaN is a float and a number but not an
+        integer. Rows are only reported for the first rule they violate.
+
+        Args:
+            column (ColumnSchema): rules of the column.
+            values (pandas.Series): column.
+            element_types (bool): whether to check the type rule on each
+                element, see element_type_mask. Otherwise the type rule is
+                left to the caller.
+
+        Yields:
+            (str, object, numpy.ndarray): rule, its constraint and the mask
+                of the rows violating it, for each row rule that is set.
+        """
+        nulls = pd.isnull(values).values
+        checked = ~nulls if column.nullable is not None else np.ones(len(values), dtype=bool)
+        if column.nullable is False:
+            yield 'nullable', column.nullable, nulls
+        if element_types and column.type is not None:
+            mask = checked & self.element_type_mask(values, column.type)
+            checked &= ~mask
+            yield 'type', column.type, mask
+        if column.max is not None or column.min is not None:
+            numeric = self.numeric_values(values)
+            with np.errstate(invalid='ignore'):
+                if column.max is not None:
+                    yield 'max', column.max, checked & (numeric > column.max)
+                if column.min is not None:
+                    yield 'min', column.min, checked & (numeric < column.min)
+
+    def column_violations(self, column, values):
+        """
+        Evaluates the column rules of a column, ignoring null and
+        non-numeric values.
+
+        Args:
+            column (ColumnSchema): rules of the column.
+            values (pandas.Series): column.
+
+        Yields:
+            (str, object, float): rule, its constraint and the extremum of
+                the column, for each column rule that is violated.
+        """
+        if column.max_at_least is None and column.min_is_below is None:
+            return
+        numeric = pd.Series(self.numeric_values(values))
+        yield from self.extrema_violations(column, numeric.min(), numeric.max())
+
+    @staticmethod
+    def extrema_violations(column, minimum, maximum):
+        """
+        Evaluates the column rules of a column from its extrema.
+
+        Args:
+            column (ColumnSchema): rules of the column.
+            minimum (float): minimum of the numeric values of the column,
+                NaN if there are none.
+            maximum (float): maximum of the numeric values of the column.
+
+        Yields:
+            (str, object, float): rule, its constraint and the extremum of
+                the column, for each column rule that is violated.
+        """
+        if column.max_at_least is not None and maximum < column.max_at_least:
+            yield 'max_at_least', column.max_at_least, maximum
+        if column.min_is_below is not None and minimum > column.min_is_below:
+            yield 'min_is_below', column.min_is_below, minimum
+
+
+class ValidationRecords(object):
+    """
+    Local SQLite store of validation results, keyed on the basename and the
+    content hash of each validated file, so that a result is only found
+    again while the content of the file is unchanged. Lookups use the
+    primary key index, results are upserted in one transaction per call,
+    and concurrent validators serialize their writes on the database lock,
+    waiting up to VALIDATION_RECORDS_TIMEOUT seconds for it.
+
+    Attributes:
+        path (str): path to the SQLite database.
+    """
+    def __init__(self, path=DEFAULT_VALIDATION_RECORDS):
+        """
+        Args:
+            path (str): path to the SQLite database, created if it doesn't
+                exist.
+        """
+        self.path = path
+        with closing(self.connect()) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS validation_records ("
+                               "name TEXT NOT NULL, hash TEXT NOT NULL, validated INTEGER NOT NULL, "
+                               "method TEXT, errors TEXT, time TEXT, PRIMARY KEY (name, hash))")
+
+    def connect(self):
+        """
+        Returns:
+            sqlite3.Connection: connection to the database.
+        """
+        return sqlite3.connect(self.path, timeout=VALIDATION_RECORDS_TIMEOUT)
+
+    @staticmethod
+    def keys(paths):
+        """
+        Args:
+            paths (list): paths to the files.
+
+        Returns:
+            list: (basename, hex content hash) key of each file.
+        """
+        hashes = hash_files(paths, algorithm='blake2b')
+        return [(os.path.basename(path), file_hash.hex()) for path, file_hash in zip(paths, hashes)]
+
+    def get(self, keys):
+        """
+        Args:
+            keys (list): keys of the files to look up, see keys.
+
+        Returns:
+            dict: validation result with fields "validated", "method",
+                "errors" and "time" by key, for the keys which are recorded.
+        """
+        records = {}
+        with closing(self.connect()) as connection:
+            for start in range(0, len(keys), VALIDATION_RECORDS_BATCH_SIZE):
+                batch = keys[start:start + VALIDATION_RECORDS_BATCH_SIZE]
+                # Joined from the keys, so that each key is a primary key search
+                query = "WITH keys(name, hash) AS (VALUES {}) " \
+                        "SELECT r.name, r.hash, r.validated, r.method, r.errors, r.time " \
+                        "FROM keys CROSS JOIN validation_records r " \
+                        "ON r.name = keys.name AND r.hash = keys.hash".format(", ".join(["(?, ?)"] * len(batch)))
+                for name, file_hash, validated, method, errors, time in connection.execute(
+                        query, [value for key in batch for value in key]):
+                    records[(name, file_hash)] = {"validated": bool(validated),
+                                                  "method": method,
+                                                  "errors": json.loads(errors),
+                                                  "time": time}
+        return records
+
+    def put(self, records):
+        """
+        Inserts or replaces validation results in a single transaction.
+
+        Args:
+            records (iterable): (key, validation result) pairs, see get.
+        """
+        rows = [(key[0], key[1], bool(result['validated']), result['method'],
+                 json.dumps(result['errors'], default=str), result['time'])
+                for key, result in records]
+        with closing(self.connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO validation_records "
+                                   "(name, hash, validated, method, errors, time) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def __len__(self):
+        with closing(self.connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM validation_records").fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def load_compiled_schema(filename):
+    """
+    Loads and compiles a validation schema file once per process, so that
+    validators share the compiled schema of each file type.
+
+    Args:
+        filename (str): yaml or json file with the validation schema.
+
+    Returns:
+        beep.validate.CompiledSchema: compiled schema, which must not be
+            modified.
+    """
+    return CompiledSchema.from_file(filename)
+
 
 class ValidatorBeep(Validator):
     """
     Data validation for battery cycling.
     Currently supports Arbin and Maccor cyclers.
 
+    DataFrames are validated column-wise with a CompiledSchema, reporting
+    errors in the same format as cerberus validation of their dictionary
+    of lists; other documents are validated by cerberus.
     """
+    _dataframe_errors = None
+
+    @property
+    def errors(self):
+        """dict: errors of the latest validation."""
+        if self._dataframe_errors is not None:
+            return self._dataframe_errors
+        return super().errors
+
+    @errors.setter
+    def errors(self, errors):
+        self._dataframe_errors = errors
+
+    def validate(self, document, *args, **kwargs):
+        self._dataframe_errors = None
+        return super().validate(document, *args, **kwargs)
+
+    def _validate_max_at_least(self, constraint, field, value):
+        """
+        Column rule, only checked on DataFrames, see CompiledSchema.
+
+        The rule's arguments are validated against this schema:
+        {'type': 'number'}
+        """
+
+    def _validate_min_is_below(self, constraint, field, value):
+        """
+        Column rule, only checked on DataFrames, see CompiledSchema.
+
+        The rule's arguments are validated against this schema:
+        {'type': 'number'}
+        """
+
+    def _load_dataframe_schema(self, schema, attribute, description):
+        """
+        Sets the schema for a kind of DataFrame, keeping the previous one
+        of that kind if schema can't be loaded.
+
+        Args:
+            schema (str or dict): path to the validation schema, or schema.
+            attribute (str): attribute keeping the schema of this kind.
+            description (str): kind of schema for warnings.
+        """
+        try:
+            schema = loadfn(schema) if isinstance(schema, str) else dict(schema)
+            setattr(self, attribute, schema)
+        except Exception as e:
+            warnings.warn('{} schema could not be found: {}'.format(description, e))
+        self.schema = getattr(self, attribute)
+
+    def validate_dataframe(self, df, cycle_column=None):
+        """
+        Validates a DataFrame with lower case columns against the current
+        schema. As for cerberus validation of the dictionary of lists of
+        each cycle, row errors are only reported for the first cycle with
+        errors, indexed by position within that cycle.
+
+        Args:
+            df (pandas.DataFrame): data to validate.
+            cycle_column (str): column of the cycle index, or None to
+                validate the DataFrame as a single document.
+
+        Returns:
+            bool: True if validated without errors. If validation fails,
+                errors are listed at ValidatorBeep.errors.
+        """
+        compiled_schema = CompiledSchema(self.schema)
+        row_errors = []
+        column_errors = {}
+        for column in compiled_schema.columns:
+            if column.name not in df.columns:
+                continue
+            values = df[column.name]
+            for rule, constraint, mask in compiled_schema.row_violations(column, values, element_types=True):
+                if mask.any():
+                    row_errors.append((column.name, CERBERUS_MESSAGES[rule].format(constraint), mask))
+            for rule, constraint, _ in compiled_schema.column_violations(column, values):
+                column_errors.setdefault(column.name, []).append(CERBERUS_MESSAGES[rule].format(constraint))
+
+        errors = {}
+        if row_errors:
+            failed = np.logical_or.reduce([mask for _, _, mask in row_errors])
+            if cycle_column is None:
+                cycle = np.ones(len(df), dtype=bool)
+            else:
+                cycle_index = df[cycle_column].values
+                cycle = cycle_index == cycle_index[failed].min()
+            positions = np.cumsum(cycle) - 1
+            for column_name, message, mask in row_errors:
+                rows = np.flatnonzero(mask & cycle)
+                if rows.size:
+                    column_rows = errors.setdefault(column_name, [{}])[0]
+                    for position in positions[rows]:
+                        column_rows.setdefault(int(position), []).append(message)
+        for column_name, messages in column_errors.items():
+            errors.setdefault(column_name, []).extend(messages)
+
+        self._dataframe_errors = errors
+        return not errors
 
     def validate_arbin_dataframe(self, df, schema=DEFAULT_ARBIN_SCHEMA):
         """
@@ -83,12 +493,7 @@ class ValidatorBeep(Validator):
             bool: True if validated with out errors. If validation fails, errors
                 are listed at ValidatorBeep.errors.
         """
-
-        try:
-            schema = loadfn(schema)
-            self.arbin_schema = schema
-        except Exception as e:
-            warnings.warn('Arbin schema could not be found: {}'.format(e))
+        self._load_dataframe_schema(schema, 'arbin_schema', 'Arbin')
 
         df = df.rename(str.lower, axis='columns')
 
@@ -97,15 +502,7 @@ class ValidatorBeep(Validator):
             return False
         df.cycle_index = df.cycle_index.astype(int, copy=False)
 
-        # Validation starts here
-        self.schema = self.arbin_schema
-
-        for cycle_index, cycle_df in tqdm(df.groupby("cycle_index")):
-            cycle_dict = cycle_df.replace({np.nan, 'None'}).to_dict(orient='list')
-            result = self.validate(cycle_dict)
-            if not result:
-                return False
-        return True
+        return self.validate_dataframe(df, cycle_column='cycle_index')
 
     def validate_maccor_dataframe(self, df, schema=DEFAULT_MACCOR_SCHEMA):
         """
@@ -120,12 +517,7 @@ class ValidatorBeep(Validator):
             bool: True if validated with out errors. If validation fails, errors
             are listed at ValidatorBeep.errors.
         """
-
-        try:
-            schema = loadfn(schema)
-            self.maccor_schema = schema
-        except Exception as e:
-            warnings.warn('Maccor schema could not be found: {}'.format(e))
+        self._load_dataframe_schema(schema, 'maccor_schema', 'Maccor')
 
         df = df.rename(str.lower, axis='columns')
 
@@ -134,15 +526,7 @@ class ValidatorBeep(Validator):
             return False
         df['cyc#'] = df['cyc#'].astype(int, copy=False)
 
-        # Validation starts here
-        self.schema = self.maccor_schema
-
-        for cycle_index, cycle_df in tqdm(df.groupby("cyc#")):
-            cycle_dict = cycle_df.replace({np.nan, 'None'}).to_dict(orient='list')
-            result = self.validate(cycle_dict)
-            if not result:
-                return False
-        return True
+        return self.validate_dataframe(df, cycle_column='cyc#')
 
     def validate_eis_dataframe(self, df, schema=DEFAULT_EIS_SCHEMA):
         """
@@ -154,32 +538,27 @@ class ValidatorBeep(Validator):
             bool: True if validated with out errors. If validation fails, errors
                 are listed at ValidatorBeep.errors.
         """
-
-        try:
-            schema = loadfn(schema)
-            self.eis_schema = schema
-        except Exception as e:
-            warnings.warn('Maccor EIS schema could not be found: {}'.format(e))
+        self._load_dataframe_schema(schema, 'eis_schema', 'Maccor EIS')
 
         df = df.rename(str.lower, axis='columns')
-        self.schema = self.eis_schema
 
-        return self.validate(df.replace(np.nan, 'None').to_dict(orient='list'), )
+        return self.validate_dataframe(df)
 
     def validate_from_paths(self, paths, record_results=False, skip_existing=False,
                             record_path=DEFAULT_VALIDATION_RECORDS):
         """
         This method streamlines validation of multiple Arbin csv files given a list of paths.
 
-        It can also do bookkeeping of validations by dumping results in a json file,
-        locally until a more centralized method is implemented.
+        It can also do bookkeeping of validations by recording results in a local SQLite store,
+        see ValidationRecords, until a more centralized method is implemented.
 
         Args:
             paths (list): a list of paths to csv files.
             record_results (bool): Whether to record the validation results locally or not (defaults to False).
             skip_existing (bool): Whether to skip already validated files. This is done by checking if the file is in
-                the validation_records. skip_existing only matters if record_results is True. Defaults to False.
-            record_path (str): path to the json file storing the past validation results.
+                the validation_records with the same content. skip_existing only matters if record_results is True.
+                Defaults to False.
+            record_path (str): path to the SQLite database storing the past validation results.
         Returns:
             dict: Results of the validation in the form of a key,value pairs where each key corresponds to the filename
                 validated. For each file, the results contain a field "validated", True if validation was successful or
@@ -190,13 +569,11 @@ class ValidatorBeep(Validator):
         self.allow_unknown = True
 
         if record_results:
-            if os.path.isfile(record_path):
-                self.validation_records = loadfn(record_path)
-                if skip_existing:
-                    paths = [path for path in paths if os.path.basename(path)
-                             not in self.validation_records]
-            else:
-                self.validation_records = {}
+            self.validation_records = ValidationRecords(record_path)
+            keys = dict(zip(paths, self.validation_records.keys(paths)))
+            if skip_existing:
+                existing = self.validation_records.get(list(keys.values()))
+                paths = [path for path in paths if keys[path] not in existing]
 
         results = {}
         for path in paths:
@@ -219,8 +596,7 @@ class ValidatorBeep(Validator):
             results[name]['errors'] = self.errors
 
         if record_results:
-            self.validation_records.update(results)
-            dumpfn(self.validation_records, record_path)
+            self.validation_records.put((keys[path], results[os.path.basename(path)]) for path in paths)
 
         return results
 
@@ -229,8 +605,8 @@ class ValidatorBeep(Validator):
         Scheme for prevalidation of non-numeric column,
         primarily used to pre-validate non-null cycle index,
         This is induces an error on validation of a dataframe
-        with a null value in cycle_index, using a dummy doc
-        and a custom schema for non-numeric cycle values.
+        with a null value in cycle_index, reported as cerberus
+        reports the first null row as a non-numeric document.
 
         Args:
             df (pandas.DataFrame): dataframe.
@@ -241,14 +617,8 @@ class ValidatorBeep(Validator):
                 pandas.isnull().
 
         """
-        null_index_mask = df[column_name].isnull()
-        if null_index_mask.any():
-
-            non_numeric_schema = {column_name : {'type': 'list',
-                                                 'schema': {'type': 'number'}}}
-            dummy_df = df[null_index_mask].iloc[0:1].replace({np.nan: 'None'})
-            dummy_doc = dummy_df.to_dict(orient='list')
-            self.validate(dummy_doc, schema=non_numeric_schema)
+        if df[column_name].isnull().values.any():
+            self._dataframe_errors = {column_name: [{0: [CERBERUS_MESSAGES['type'].format('number')]}]}
             return False
         else:
             return True
@@ -274,8 +644,9 @@ class SimpleValidator(object):
     Note that the COLUMN_NAME.type key above is ignored, but
     COLUMN_NAME.schema.type is used.
 
-    The only schema keys that are supported at this time are
-    max, min, and type.
+    The schema keys that are supported at this time are
+    max, min, type, max_at_least, min_is_below and nullable,
+    evaluated by CompiledSchema.
 
     Typing is compared using the key-mapping by rule defined
     by the ALLOWED_TYPES_BY_RULE attribute defined below.
@@ -294,7 +665,7 @@ class SimpleValidator(object):
         self.validation_records = None
 
     @staticmethod
-    def check_type(df, type_rule):
+    def check_type(df, type_rule, offset=0):
         """
         Method to check type of input dataframe.
 
@@ -304,6 +675,8 @@ class SimpleValidator(object):
                 to check, supported type rules are:
                 integer: checks for numeric values which are
                     equal to their rounded values
+            offset (int): index of the first row of df, added to
+                the reported index, e. g. for chunks of a file.
 
         Returns:
             bool: valid
@@ -314,12 +687,15 @@ class SimpleValidator(object):
                              "of integer, float, numeric, or string")
         # Integer: Check residual from rounding
         if type_rule == "integer":
-            nonint_indices = np.arange(len(df))[(df != np.round(df))]
-            if nonint_indices.size > 0:
-                value = df.iloc[nonint_indices[0]]
-                return False, "integer type check failed at index {} with value {}".format(
-                    nonint_indices[0], value
-                )
+            values = np.asarray(df)
+            # Integer and boolean dtypes can only hold integers
+            if values.dtype.kind not in 'iub':
+                # Stops at the first non-integral value, NaN included
+                index = CompiledSchema.first_index(values != np.round(values))
+                if index is not None:
+                    return False, "integer type check failed at index {} with value {}".format(
+                        index + offset, df.iloc[index]
+                    )
         # Float: just check numpy dtyping
         elif type_rule == "float":
             if not np.issubdtype(df.dtype, np.floating):
@@ -336,7 +712,7 @@ class SimpleValidator(object):
                 return False, "string type check failed, type is {}".format(df.dtype)
         return True, ""
 
-    def validate(self, dataframe):
+    def validate(self, dataframe, compiled_schema=None):
         """
         Method to run the validation on everything, and report
         the results, i. e. which columns are inconsistent with
@@ -344,93 +720,322 @@ class SimpleValidator(object):
 
         Args:
             dataframe (pandas.DataFrame): dataframe to be validated.
+            compiled_schema (beep.validate.CompiledSchema): schema to
+                validate with, compiled from self.schema if not given.
 
         Returns:
             dict: report corresponding to each validation
             str: reason for report validation failure, empty string on report
                 validation success
         """
-        dataframe = dataframe.rename(str.lower, axis='columns')
-        for column_name, value in self.schema.items():
-            column_schema = value['schema']
-            max_at_least_rule = column_schema.get('max_at_least')
-            min_is_below_rule = column_schema.get('min_is_below')
-            max_rule = column_schema.get('max')
-            min_rule = column_schema.get('min')
-            type_rule = column_schema.get('type')
-
-            # Check type
-            if type_rule is not None:
-                validity, reason = self.check_type(dataframe[column_name], type_rule=type_rule)
-                if not validity:
-                    reason = "Column {}: {}".format(column_name, reason)
-                    return validity, reason
-
-            # Check max
-            if max_rule is not None:
-                comp = np.where(dataframe[column_name] > max_rule)
-                if comp[0].size > 0:
-                    index = comp[0][0]
-                    value = dataframe[column_name].iloc[index]
-                    reason = "{} is higher than allowed max {} at index {}: " \
-                             "value={}".format(
-                        column_name, max_rule, index, value
-                    )
-                    return False, reason
+        dataframe = dataframe.rename(str.lower, axis='columns', copy=False)
+        compiled_schema = compiled_schema or CompiledSchema(self.schema)
+        for column in compiled_schema.columns:
+            reason, minimum, maximum = self.check_column(compiled_schema, column, dataframe[column.name])
+            if reason:
+                return False, reason
 
-            # Check min
-            if min_rule is not None:
-                comp = np.where(dataframe[column_name] < min_rule)
-                if comp[0].size > 0:
-                    index = comp[0][0]
-                    value = dataframe[column_name].iloc[index]
-                    reason = "{} is lower than allowed min {} at index {}:" \
-                             "value={}".format(
-                        column_name, min_rule, index, value
-                    )
-                    return False, reason
+            for rule, constraint, value in compiled_schema.extrema_violations(column, minimum, maximum):
+                return False, self.column_violation_reason(column.name, rule, constraint, value)
 
-            # Check a maximum value is at least above a threshold
-            if max_at_least_rule is not None:
-                comp = np.where(dataframe[column_name].max() < max_at_least_rule)
-                if comp[0].size > 0:
-                    index = comp[0][0]
-                    value = dataframe[column_name].iloc[index]
-                    reason = "{} needs to reach at least {} for processing, instead found:" \
-                             "value={}".format(
-                        column_name, max_at_least_rule, value
-                    )
-                    return False, reason
+        return True, ''
 
-            # Check a minimum value is below above a threshold
-            if min_is_below_rule is not None:
-                comp = np.where(dataframe[column_name].min() > min_is_below_rule)
-                if comp[0].size > 0:
-                    index = comp[0][0]
-                    value = dataframe[column_name].iloc[index]
-                    reason = "{} needs to reach under {} for processing, instead found:" \
-                             "value={}".format(
-                        column_name, max_at_least_rule, value
-                    )
+    @classmethod
+    def check_column(cls, compiled_schema, column, values, offset=0, check_dtype=True):
+        """
+        Checks the type and row rules of a column with whole-column
+        reductions, which also give the extrema for the column rules. The
+        max and min rules are checked on the extrema, so that a mask of the
+        rows violating a rule is only built, and searched up to its first
+        row, if the rule is violated.
+
+        Args:
+            compiled_schema (beep.validate.CompiledSchema): schema.
+            column (ColumnSchema): rules of the column.
+            values (pandas.Series): column.
+            offset (int): index of the first row of values, added to the
+                reported index.
+            check_dtype (bool): whether to check the float, numeric and
+                string type rules, which only depend on the dtype of values.
+
+        Returns:
+            str: reason for the first violation, empty string if there is none.
+            float: minimum of the numeric values, NaN if there are none or
+                the column has no max, min, max_at_least or min_is_below rule.
+            float: maximum of the numeric values.
+        """
+        if column.type == 'integer' or (column.type is not None and check_dtype):
+            validity, reason = cls.check_type(values, type_rule=column.type, offset=offset)
+            if not validity:
+                return "Column {}: {}".format(column.name, reason), np.nan, np.nan
+
+        minimum, maximum = np.nan, np.nan
+        if any(constraint is not None for constraint in
+               [column.max, column.min, column.max_at_least, column.min_is_below]):
+            minimum, maximum = cls.extrema(compiled_schema.numeric_values(values))
+        if column.nullable is False and pd.isnull(values).values.any():
+            return cls.row_violation_reason(compiled_schema, column, values, 'nullable', False, offset), \
+                minimum, maximum
+        with np.errstate(invalid='ignore'):
+            for rule, violated in [('max', column.max is not None and maximum > column.max),
+                                   ('min', column.min is not None and minimum < column.min)]:
+                if violated:
+                    reason = cls.row_violation_reason(compiled_schema, column, values, rule,
+                                                      getattr(column, rule), offset)
+                    return reason, minimum, maximum
+        return '', minimum, maximum
+
+    @staticmethod
+    def extrema(numeric):
+        """
+        Args:
+            numeric (numpy.ndarray): numeric values with NaN for nulls.
+
+        Returns:
+            float: minimum of the values which are not NaN, NaN if there
+                are none.
+            float: maximum of the values which are not NaN.
+        """
+        if numeric.size == 0:
+            return np.nan, np.nan
+        minimum, maximum = numeric.min(), numeric.max()
+        if np.isnan(minimum) or np.isnan(maximum):
+            # Only reduced again if there are nulls
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                minimum, maximum = np.nanmin(numeric), np.nanmax(numeric)
+        return minimum, maximum
+
+    def validate_chunks(self, chunks, compiled_schema=None):
+        """
+        Validates a DataFrame given as consecutive chunks of rows, e. g.
+        parsed from a csv file with a chunksize, and stops at the first
+        chunk violating a rule of the rows, so that invalid files are
+        mostly rejected without being parsed completely.
+
+        The extrema of the columns are tracked over the chunks for the
+        max_at_least and min_is_below rules, and the dtype of each column
+        is combined over the chunks for the float, numeric and string type
+        rules, which are checked after the last chunk unless a chunk is
+        already of object dtype. The validity is that of validate for the
+        whole DataFrame, but the reason can be a different violation,
+        as violations of the rows are reported by the first chunk
+        they occur in. Indices are counted from the first chunk.
+
+        Args:
+            chunks (iterable): DataFrames of consecutive rows.
+            compiled_schema (beep.validate.CompiledSchema): schema to
+                validate with, compiled from self.schema if not given.
+
+        Returns:
+            bool: validity
+            str: reason for validation failure, empty string on success
+        """
+        compiled_schema = compiled_schema or CompiledSchema(self.schema)
+        dtypes = {}
+        extrema = {}
+        offset = 0
+        for chunk in chunks:
+            chunk = chunk.rename(str.lower, axis='columns')
+            for column in compiled_schema.columns:
+                values = chunk[column.name]
+                dtype = dtypes[column.name] = self.combined_dtype(dtypes.get(column.name), values.dtype)
+                reason, minimum, maximum = self.check_column(
+                    compiled_schema, column, values, offset,
+                    check_dtype=column.type in ('float', 'numeric') and dtype.kind == 'O')
+                if reason:
                     return False, reason
 
+                extrema.setdefault(column.name, []).extend([minimum, maximum])
+            offset += len(chunk)
+
+        for column in compiled_schema.columns:
+            if column.type is not None and column.type != 'integer':
+                validity, reason = self.check_type(pd.Series([], dtype=dtypes.get(column.name, object)),
+                                                   type_rule=column.type)
+                if not validity:
+                    return False, "Column {}: {}".format(column.name, reason)
+
+            minimum, maximum = self.extrema(np.array(extrema.get(column.name, [])))
+            for rule, constraint, value in compiled_schema.extrema_violations(column, minimum, maximum):
+                return False, self.column_violation_reason(column.name, rule, constraint, value)
+
         return True, ''
 
+    @staticmethod
+    def combined_dtype(dtype, other):
+        """
+        Dtype of a column made of parts of two dtypes, as parsed from a
+        csv file at once, i. e. the common numeric type of numeric parts
+        and object otherwise.
+
+        Args:
+            dtype (numpy.dtype): dtype of the first part, or None if there
+                is none.
+            other (numpy.dtype): dtype of the second part.
+
+        Returns:
+            numpy.dtype: combined dtype.
+        """
+        if dtype is None or dtype == other:
+            return other
+        if dtype.kind in 'fiu' and other.kind in 'fiu':
+            return np.result_type(dtype, other)
+        return np.dtype(object)
+
+    @staticmethod
+    def row_violation_reason(compiled_schema, column, values, rule, constraint, offset=0):
+        """
+        Locates the first row violating a nullable, max or min rule.
+
+        Args:
+            compiled_schema (beep.validate.CompiledSchema): schema.
+            column (ColumnSchema): rules of the column.
+            values (pandas.Series): column.
+            rule (str): nullable, max or min, which is violated.
+            constraint (object): constraint of the rule.
+            offset (int): index of the first row of values, added to the
+                reported index.
+
+        Returns:
+            str: reason for the violation.
+        """
+        if rule == 'nullable':
+            index = compiled_schema.first_index(pd.isnull(values).values)
+            return "{} is null at index {}".format(column.name, index + offset)
+        numeric = compiled_schema.numeric_values(values)
+        with np.errstate(invalid='ignore'):
+            mask = numeric > constraint if rule == 'max' else numeric < constraint
+        index = compiled_schema.first_index(mask)
+        value = values.iloc[index]
+        if rule == 'max':
+            return "{} is higher than allowed max {} at index {}: " \
+                   "value={}".format(column.name, constraint, index + offset, value)
+        return "{} is lower than allowed min {} at index {}:" \
+               "value={}".format(column.name, constraint, index + offset, value)
+
+    @staticmethod
+    def column_violation_reason(column_name, rule, constraint, value):
+        """
+        Args:
+            column_name (str): name of the column.
+            rule (str): max_at_least or min_is_below.
+            constraint (float): threshold of the rule.
+            value (float): extremum of the column.
+
+        Returns:
+            str: reason for the violation of a column rule.
+        """
+        if rule == 'max_at_least':
+            return "{} needs to reach at least {} for processing, instead found:" \
+                   "value={}".format(column_name, constraint, value)
+        return "{} needs to reach under {} for processing, instead found:" \
+               "value={}".format(column_name, constraint, value)
+
+    def validate_raw_data(self, path, df):
+        """
+        Validates the data of a raw cycler file with the schema of its file
+        type, leaving the data unchanged so that it can be structured next.
+
+        Args:
+            path (str): path to the raw cycler file.
+            df (pandas.DataFrame or iterable): data of the file, or
+                consecutive chunks of it, which are validated with
+                validate_chunks, see read_raw_data.
+
+        Returns:
+            dict: validation result with fields "validated", "method",
+                "errors" and "time", see validate_from_paths.
+        """
+        name = os.path.basename(path)
+        file_type = get_raw_file_type(path)
+        if df is None or file_type is None:
+            validated, reason = False, "File type not recognized"
+            method = None
+        else:
+            compiled_schema = load_compiled_schema(RAW_FILE_SCHEMAS[file_type])
+            method = "simple_" + file_type
+            if isinstance(df, pd.DataFrame):
+                validated, reason = self.validate(self.prepare_raw_data(file_type, df), compiled_schema)
+            else:
+                chunks = (self.prepare_raw_data(file_type, chunk) for chunk in df)
+                validated, reason = self.validate_chunks(chunks, compiled_schema)
+
+        if validated:
+            logger.info("%s method=%s errors=%s", name, method, reason, extra=s)
+        else:
+            logger.warning("%s method=%s errors=%s", name, method, reason, extra=s)
+        return {"validated": validated,
+                "method": method,
+                "errors": reason,
+                "time": json.dumps(datetime.now(), indent=4, sort_keys=True, default=str)}
+
+    @staticmethod
+    def prepare_raw_data(file_type, df):
+        """
+        Args:
+            file_type (str): 'arbin' or 'maccor', see get_raw_file_type.
+            df (pandas.DataFrame): data of a raw cycler file.
+
+        Returns:
+            pandas.DataFrame: data with the columns the schema of the file
+                type expects, sharing the data of df.
+        """
+        if file_type == 'maccor':
+            # Columns need to be retyped and renamed for validation,
+            # conversion will happen during structuring
+            df = df.copy(deep=False)
+            df['State'] = df['State'].astype(str)
+            df['current'] = df['Amps']
+        return df
+
+    def validate_raw_file(self, path, chunksize=None):
+        """
+        Parses and validates a raw cycler file, see validate_raw_data.
+
+        Args:
+            path (str): path to the raw cycler file.
+            chunksize (int): number of rows to parse and validate at a
+                time, which stops parsing invalid files at the first chunk
+                with a violation, see validate_chunks. The whole file is
+                parsed at once if None.
+
+        Returns:
+            dict: validation result, see validate_raw_data.
+        """
+        data = read_raw_data(path, chunksize=chunksize)
+        try:
+            return self.validate_raw_data(path, data)
+        finally:
+            if chunksize is not None and data is not None:
+                data.close()
+
+    def __getstate__(self):
+        # Validation records stay with the validator that records them,
+        # e. g. when validating in worker processes
+        state = self.__dict__.copy()
+        state['validation_records'] = None
+        return state
+
     def validate_from_paths(self, paths, record_results=False, skip_existing=False,
-                            record_path=DEFAULT_VALIDATION_RECORDS):
+                            record_path=DEFAULT_VALIDATION_RECORDS, workers=1, chunksize=None):
         """
         This method streamlines validation of multiple Arbin csv files given a list of paths.
 
-        It can also do bookkeeping of validations by dumping results in a json file,
-        locally until a more centralized method is implemented.
+        It can also do bookkeeping of validations by recording results in a local SQLite store,
+        see ValidationRecords, until a more centralized method is implemented.
 
         Args:
             paths (list): a list of paths to csv files
             record_results (bool): Whether to record the validation results locally or not (defaults to False)
             skip_existing (bool): Whether to skip already validated files. This is done by checking if the
-                                    file is in the validation_records. skip_existing only matters if record_results
-                                    is True. (defaults to False)
-            record_path (str): path to the json file storing the past validation results.
+                                    file is in the validation_records with the same content. skip_existing
+                                    only matters if record_results is True. (defaults to False)
+            record_path (str): path to the SQLite database storing the past validation results.
+            workers (int): number of processes to validate the files with, 1
+                validates them sequentially in the current process.
+            chunksize (int): number of rows to parse and validate at a time,
+                see validate_raw_file. Files are parsed at once if None.
         Returns:
             dict: Results of the validation in the form of a key,value pairs where each key corresponds to the filename
                 validated. For each file, the results contain a field "validated", True if validation was successful or
@@ -439,55 +1044,66 @@ class SimpleValidator(object):
 
         """
         if record_results:
-            if os.path.isfile(record_path):
-                self.validation_records = loadfn(record_path)
-                if skip_existing:
-                    paths = [path for path in paths if os.path.basename(path)
-                             not in self.validation_records]
-            else:
-                self.validation_records = {}
+            self.validation_records = ValidationRecords(record_path)
+            keys = dict(zip(paths, self.validation_records.keys(paths)))
+            if skip_existing:
+                existing = self.validation_records.get(list(keys.values()))
+                paths = [path for path in paths if keys[path] not in existing]
+
+        names = [os.path.basename(path) for path in paths]
+        if workers <= 1:
+            results = {name: self.validate_raw_file(path, chunksize)
+                       for name, path in zip(names, tqdm(paths))}
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = dict(zip(names, tqdm(executor.map(self.validate_raw_file, paths,
+                                                             [chunksize] * len(paths)),
+                                               total=len(paths))))
 
-        results = {}
-        for path in tqdm(paths):
-            name = os.path.basename(path)
-            results[name] = {}
-            if re.match(ARBIN_CONFIG['file_pattern'], path):
-                schema_filename = os.path.join(VALIDATION_SCHEMA_DIR, "schema-arbin-lfp.yaml")
-                self.schema = loadfn(schema_filename)
-                df = pd.read_csv(path, index_col=0)
-                validated, reason = self.validate(df)
-                method = "simple_arbin"
-            elif re.match(MACCOR_CONFIG['file_pattern'], path):
-                schema_filename = os.path.join(VALIDATION_SCHEMA_DIR, "schema-maccor-2170.yaml")
-                self.schema = loadfn(schema_filename)
-                self.allow_unknown = True
-                df = pd.read_csv(path, delimiter='\t', skiprows=1)
+        if record_results:
+            self.validation_records.put((keys[path], results[os.path.basename(path)]) for path in paths)
 
-                # Columns need to be retyped and renamed for validation,
-                # conversion will happen during structuring
-                df['State'] = df['State'].astype(str)
-                df['current'] = df['Amps']
+        return results
 
-                validated, reason = self.validate(df)
-                method = "simple_maccor"
-            else:
-                validated, reason = False, "File type not recognized"
-                method = None
-            results[name].update({"validated": validated,
-                                  "method": method,
-                                  "errors": reason,
-                                  "time": json.dumps(datetime.now(), indent=4, sort_keys=True, default=str)})
-
-            if validated:
-                logger.info("%s method=%s errors=%s", name, method, reason, extra=s)
-            else:
-                logger.warning("%s method=%s errors=%s", name, method, reason, extra=s)
 
-        if record_results:
-            self.validation_records.update(results)
-            dumpfn(self.validation_records, record_path)
+def get_raw_file_type(path):
+    """
+    Args:
+        path (str): path to a raw cycler file.
 
-        return results
+    Returns:
+        str: 'arbin' for Arbin csv and 'maccor' for Maccor files, None if
+            the file type is not recognized.
+    """
+    if re.match(ARBIN_CONFIG['file_pattern'], path):
+        return 'arbin'
+    elif re.match(MACCOR_CONFIG['file_pattern'], path):
+        return 'maccor'
+    return None
+
+
+def read_raw_data(path, chunksize=None):
+    """
+    Parses a raw Arbin csv or Maccor file into a DataFrame with the
+    columns of the file, which is validated by SimpleValidator and can
+    then be structured without parsing the file again, see
+    RawCyclerRun.from_raw_data.
+
+    Args:
+        path (str): path to the raw cycler file.
+        chunksize (int): number of rows to parse at a time, in which case
+            an iterator over DataFrames of consecutive rows is returned.
+
+    Returns:
+        pandas.DataFrame: data of the file, or None if the file type is
+            not recognized.
+    """
+    file_type = get_raw_file_type(path)
+    if file_type == 'arbin':
+        return pd.read_csv(path, chunksize=chunksize)
+    elif file_type == 'maccor':
+        return pd.read_csv(path, delimiter='\t', skiprows=1, chunksize=chunksize)
+    return None
 
 
 class BeepValidationError(Exception):
@@ -495,7 +1111,8 @@ class BeepValidationError(Exception):
 
 
 def validate_file_list_from_json(file_list_json, record_results=False,
-                                 skip_existing=False, validator_class=SimpleValidator):
+                                 skip_existing=False, validator_class=SimpleValidator,
+                                 workers=1, chunksize=None):
     """
     Validates a list of files from json input
 
@@ -510,6 +1127,10 @@ def validate_file_list_from_json(file_list_json, record_results=False,
             skip_existing only matters if record_results is True. (defaults to False)
         validator_class (ValidatorBeep or SimpleValidator): validator class
             to use in validation.
+        workers (int): number of processes to validate files with, only
+            used by SimpleValidator.
+        chunksize (int): number of rows to parse and validate at a time,
+            only used by SimpleValidator, see SimpleValidator.validate_raw_file.
 
     Returns:
         str: json dump of the validator results.
@@ -527,8 +1148,11 @@ def validate_file_list_from_json(file_list_json, record_results=False,
     file_list = file_list_data['file_list']
 
     validator = validator_class()
+    kwargs = {}
+    if isinstance(validator, SimpleValidator):
+        kwargs = {'workers': workers, 'chunksize': chunksize}
     all_results = validator.validate_from_paths(
-        file_list, record_results=record_results, skip_existing=skip_existing,
+        file_list, record_results=record_results, skip_existing=skip_existing, **kwargs
     )
 
     # Get validities and recast to strings (valid/invalid) based on result
@@ -556,7 +1180,9 @@ def main():
     try:
         args = docopt(__doc__)
         input_json = args['INPUT_JSON']
-        print(validate_file_list_from_json(input_json), end="")
+        chunksize = args['--chunksize'] and int(args['--chunksize'])
+        print(validate_file_list_from_json(input_json, workers=int(args['--workers']),
+                                           chunksize=chunksize), end="")
     except Exception as e:
         logger.error(str(e), extra=s)
         raise e
@@ -0,0 +1,93 @@
+# Copyright 2019 Toyota Research Institute. All rights reserved.
+"""
+Benchmark of SimpleValidator.validate on the raw cycler files of the test
+fixtures, against the previous validation of one rule at a time with
+full-length masks and an np.arange based integer check. Each file is
+tiled to at least the given number of rows, so that the timing is not
+dominated by per-call overhead.
+
+Usage:
+    benchmark_validation.py [--rows=<n>] [--repeat=<n>]
+
+Options:
+    -h --help        Show this screen
+    --rows=<n>       Minimum number of rows of each validated frame [default: 1000000]
+    --repeat=<n>     Number of timed validations of each frame [default: 5]
+
+"""
+import os
+import timeit
+
+import numpy as np
+import pandas as pd
+from docopt import docopt
+
+from beep import MODULE_DIR
+from beep.validate import SimpleValidator, RAW_FILE_SCHEMAS, get_raw_file_type, \
+    read_raw_data, load_compiled_schema
+
+TEST_FILE_DIR = os.path.join(MODULE_DIR, "tests", "test_files")
+FILES = ["2017-05-09_test-TC-contact_CH33.csv", "FastCharge_000025_CH8.csv",
+         "xTESLADIAG_000019_CH70.070", "PredictionDiagnostics_000109_tztest.010",
+         "xTESLADIAG_000038.078"]
+
+
+def reference_validate(compiled_schema, dataframe):
+    """
+    Validation as before the fused column checks, returning only validity.
+
+    Args:
+        compiled_schema (beep.validate.CompiledSchema): schema.
+        dataframe (pandas.DataFrame): data to validate.
+
+    Returns:
+        bool: validity
+    """
+    dataframe = dataframe.rename(str.lower, axis='columns')
+    for column in compiled_schema.columns:
+        values = dataframe[column.name]
+        if column.type == "integer":
+            nonint_indices = np.arange(len(values))[(values != np.round(values))]
+            if nonint_indices.size > 0:
+                return False
+        elif column.type is not None and not SimpleValidator.check_type(values, column.type)[0]:
+            return False
+        for rule, constraint, mask in compiled_schema.row_violations(column, values):
+            if compiled_schema.first_index(mask) is not None:
+                return False
+        for _ in compiled_schema.column_violations(column, values):
+            return False
+    return True
+
+
+def benchmark(rows, repeat):
+    """
+    Times the validation of each fixture and prints the speedup.
+
+    Args:
+        rows (int): minimum number of rows of each validated frame.
+        repeat (int): number of timed validations of each frame.
+    """
+    validator = SimpleValidator()
+    print("{:45s} {:>9s} {:>12s} {:>12s} {:>8s}".format(
+        "file", "rows", "before (ms)", "after (ms)", "speedup"))
+    for filename in FILES:
+        path = os.path.join(TEST_FILE_DIR, filename)
+        file_type = get_raw_file_type(path)
+        data = read_raw_data(path)
+        data = SimpleValidator.prepare_raw_data(file_type, data)
+        data = pd.concat([data] * -(-rows // len(data)), ignore_index=True)
+        compiled_schema = load_compiled_schema(RAW_FILE_SCHEMAS[file_type])
+        assert reference_validate(compiled_schema, data) == validator.validate(data, compiled_schema)[0]
+
+        before = min(timeit.repeat(lambda: reference_validate(compiled_schema, data),
+                                   number=1, repeat=repeat))
+        after = min(timeit.repeat(lambda: validator.validate(data, compiled_schema),
+                                  number=1, repeat=repeat))
+        print("{:45s} {:9d} {:12.1f} {:12.1f} {:7.1f}x".format(
+            filename, len(data), before * 1e3, after * 1e3, before / after))
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    benchmark(int(args['--rows']), int(args['--repeat']))